@@ -0,0 +1,47 @@
+"""Add site_id and content_hash to documents for upload deduplication
+
+Revision ID: 5d0c8e3f9a17
+Revises: bf6a257b5822
+Create Date: 2026-10-18 14:03:27.518940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0c8e3f9a17'
+down_revision = 'bf6a257b5822'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('documents', sa.Column('site_id', sa.String(), server_default='default', nullable=False))
+    op.add_column('documents', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    # content是上传内容按UTF-8解码的结果，重新编码后的哈希与上传时计算的一致；
+    # 已有的重复文档只给最早的一条填写哈希，避免违反唯一索引
+    op.execute(
+        """
+        UPDATE documents SET content_hash = hashed.content_hash
+        FROM (
+            SELECT id, content_hash,
+                   row_number() OVER (PARTITION BY site_id, content_hash ORDER BY id) AS rn
+            FROM (
+                SELECT id, site_id, encode(sha256(convert_to(content, 'UTF8')), 'hex') AS content_hash
+                FROM documents
+                WHERE content IS NOT NULL
+            ) AS computed
+        ) AS hashed
+        WHERE documents.id = hashed.id AND hashed.rn = 1
+        """
+    )
+    op.create_index(
+        'ux_documents_site_id_content_hash', 'documents', ['site_id', 'content_hash'], unique=True
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ux_documents_site_id_content_hash', table_name='documents')
+    op.drop_column('documents', 'content_hash')
+    op.drop_column('documents', 'site_id')
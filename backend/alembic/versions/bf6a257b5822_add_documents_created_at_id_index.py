@@ -0,0 +1,24 @@
+"""Add (created_at, id) index for keyset pagination
+
+Revision ID: bf6a257b5822
+Revises: a0cf3ee6e595
+Create Date: 2026-10-18 10:12:45.204311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bf6a257b5822'
+down_revision = 'a0cf3ee6e595'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_documents_created_at_id', 'documents', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_documents_created_at_id', table_name='documents')
@@ -1,8 +1,9 @@
 from fastapi import APIRouter
 
-from app.api.endpoints import documents, query
+from app.api.endpoints import documents, jobs, query
 
 api_router = APIRouter()
 api_router.include_router(documents.router, prefix="/documents", tags=["documents"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
 api_router.include_router(query.router, prefix="/query", tags=["query"])
 
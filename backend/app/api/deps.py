@@ -0,0 +1,14 @@
+from fastapi import Request
+
+from app.services.index_service import IndexService, IndexServiceFactory
+from app.services.job_service import IngestionJobQueue
+
+
+def get_index_service() -> IndexService:
+    """获取共享的索引服务实例"""
+    return IndexServiceFactory.get_instance()
+
+
+def get_job_queue(request: Request) -> IngestionJobQueue:
+    """获取应用启动时创建的摄入任务队列"""
+    return request.app.state.job_queue
@@ -1,107 +1,292 @@
 import os
-import shutil
-import tempfile
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+import zipfile
+from typing import Iterator, List, Literal, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 import logging
 
-from app.db.session import get_db
+from app.api.deps import get_index_service, get_job_queue
+from app.core.config import settings
+from app.db.session import get_async_db
 from app.models.document import Document
-from app.schemas.document import DocumentResponse
-from app.services.document_service import DocumentService
+from app.schemas.document import (
+    DocumentBatchUploadResponse,
+    DocumentListResponse,
+    DocumentResponse,
+    DocumentUpdateResponse,
+    DocumentUploadResponse,
+    SkippedFile,
+)
+from app.services.document_service import DEDUP_REPLACE, DocumentService, DuplicateDocumentError
+from app.services.index_service import IndexService
+from app.services.job_service import JOB_STATUS_QUEUED, IngestionJobQueue
+from app.worker import run_local_job
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+DedupPolicy = Literal["skip", "alias", "replace"]
 
-@router.post("/upload", response_model=DocumentResponse)
+# 支持导入的文件类型，zip压缩包会展开其中的这些文件
+SUPPORTED_EXTENSIONS = (".md", ".txt")
+
+
+def _check_file(filename: str, size: int, skipped: List[SkippedFile]) -> bool:
+    if not filename.endswith(SUPPORTED_EXTENSIONS) or os.path.basename(filename).startswith("."):
+        skipped.append(SkippedFile(filename=filename, reason="不支持的文件类型"))
+        return False
+    if size > settings.UPLOAD_MAX_FILE_BYTES:
+        skipped.append(SkippedFile(filename=filename, reason="文件超过大小限制"))
+        return False
+    return True
+
+
+async def _read_upload(file: UploadFile) -> bytes:
+    """读取单个上传文件，最多读入大小限制多一个字节，超过限制时返回413"""
+    data = await file.read(settings.UPLOAD_MAX_FILE_BYTES + 1)
+    if len(data) > settings.UPLOAD_MAX_FILE_BYTES:
+        raise HTTPException(status_code=413, detail="文件超过大小限制")
+    return data
+
+
+def _iter_uploads(files: List[UploadFile], skipped: List[SkippedFile]) -> Iterator[Tuple[str, bytes]]:
+    """
+    逐个产出上传文件的 (文件名, 内容)
+
+    上传文件由框架缓冲在SpooledTemporaryFile中，这里直接从中读取，
+    zip压缩包也按成员逐个解压，任一时刻只在内存中保留一个文件的内容。
+    """
+    for file in files:
+        if file.filename.endswith(".zip"):
+            with zipfile.ZipFile(file.file) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or not _check_file(info.filename, info.file_size, skipped):
+                        continue
+                    yield os.path.basename(info.filename), archive.read(info)
+        elif _check_file(file.filename, file.size or 0, skipped):
+            file.file.seek(0)
+            yield file.filename, file.file.read()
+
+
+@router.post("/upload", response_model=DocumentUploadResponse, status_code=202)
 async def upload_document(
+    response: Response,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    dedup: Optional[DedupPolicy] = Form(None),
+    db: AsyncSession = Depends(get_async_db),
+    index_service: IndexService = Depends(get_index_service),
+    queue: IngestionJobQueue = Depends(get_job_queue)
 ):
     """
-    上传文档文件并处理
+    上传文档文件，保存后将向量化和索引写入交给摄入worker异步执行
+
+    内容与已有文档重复时按dedup处理(默认使用UPLOAD_DEDUP_POLICY)：
+    skip和alias直接返回已有文档，不创建摄入任务；replace删除已有文档后重新导入。
     """
-    # 创建临时文件
-    temp_dir = tempfile.gettempdir()
-    temp_file_path = os.path.join(temp_dir, file.filename)
     try:
-        # 保存上传的文件
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        # 创建文档服务
-        document_service = DocumentService(db)
-        
-        # 根据文件类型处理文档
+        # 直接解析内存中的上传内容，不再经过临时文件
         filename = file.filename
-        if filename.endswith(".md"):
-            document = await document_service.process_markdown_file(temp_file_path, filename)
-        else:
-            document = await document_service.process_text_file(temp_file_path, filename)
+        data = await _read_upload(file)
+        document_service = DocumentService(db, index_service)
+        document, action = await document_service.upload(filename, data, index=False, dedup_policy=dedup)
+        if action is not None and action != DEDUP_REPLACE:
+            response.status_code = 200
+            return DocumentUploadResponse(
+                **DocumentResponse.model_validate(document).model_dump(),
+                dedup_action=action,
+                duplicate_of=document.id,
+            )
         
-        return document
+        # 创建摄入任务，进度可通过 /api/jobs/{job_id} 查询
+        job_id = await queue.enqueue(
+            document_ids=[document.id],
+            site_id=document_service.index_service.site_id,
+            filename=filename,
+            dispatch=not index_service.indexes_in_process,
+        )
+        if index_service.indexes_in_process:
+            run_local_job(queue, job_id)
+        
+        return DocumentUploadResponse(
+            **DocumentResponse.model_validate(document).model_dump(),
+            job_id=job_id,
+            job_status=JOB_STATUS_QUEUED,
+            dedup_action=action,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"文件处理失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"文件处理失败: {str(e)}")
+
+
+@router.post("/upload/batch", response_model=DocumentBatchUploadResponse, status_code=202)
+async def upload_documents(
+    response: Response,
+    files: List[UploadFile] = File(...),
+    dedup: Optional[DedupPolicy] = Form(None),
+    db: AsyncSession = Depends(get_async_db),
+    index_service: IndexService = Depends(get_index_service),
+    queue: IngestionJobQueue = Depends(get_job_queue)
+):
+    """
+    批量上传文档文件，支持多个 .md/.txt 文件以及包含这些文件的zip压缩包
+
+    所有文档在一个事务中写入，并作为一个摄入任务交给worker执行。
+    与已有文档内容重复的文件按dedup处理，列在duplicates中。
+    """
+    skipped: List[SkippedFile] = []
+    try:
+        document_service = DocumentService(db, index_service)
+        documents, duplicates = await document_service.create_documents(
+            _iter_uploads(files, skipped), dedup_policy=dedup
+        )
+    except (zipfile.BadZipFile, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"文件无法解析: {str(e)}")
     except Exception as e:
         logger.exception(f"文件处理失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"文件处理失败: {str(e)}")
-    finally:
-        # 删除临时文件
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+
+    if not documents:
+        if not duplicates:
+            raise HTTPException(status_code=400, detail="没有可导入的文件")
+        # 全部文件都已导入过，不需要摄入任务
+        response.status_code = 200
+        return DocumentBatchUploadResponse(documents=[], skipped=skipped, duplicates=duplicates)
+
+    try:
+        filename = documents[0].filename if len(documents) == 1 else f"{len(documents)}个文件"
+        job_id = await queue.enqueue(
+            document_ids=[document.id for document in documents],
+            site_id=document_service.index_service.site_id,
+            filename=filename,
+            dispatch=not index_service.indexes_in_process,
+        )
+        if index_service.indexes_in_process:
+            run_local_job(queue, job_id)
+        return DocumentBatchUploadResponse(
+            job_id=job_id,
+            job_status=JOB_STATUS_QUEUED,
+            documents=documents,
+            skipped=skipped,
+            duplicates=duplicates,
+        )
+    except Exception as e:
+        logger.exception(f"创建摄入任务失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"创建摄入任务失败: {str(e)}")
 
 
 @router.get("/", response_model=List[DocumentResponse])
 async def get_documents(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    index_service: IndexService = Depends(get_index_service)
 ):
     """
     获取所有文档
     """
     try:
-        document_service = DocumentService(db)
-        documents = document_service.get_documents(skip=skip, limit=limit)
+        document_service = DocumentService(db, index_service)
+        documents = await document_service.get_documents(skip=skip, limit=limit)
         return documents
     except Exception as e:
         logger.exception(f"获取文档失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取文档失败: {str(e)}")
 
 
+@router.get("/summary", response_model=DocumentListResponse)
+async def list_document_summaries(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_async_db),
+    index_service: IndexService = Depends(get_index_service)
+):
+    """
+    分页获取文档摘要(大小和正文预览)，不返回正文和元数据
+    """
+    try:
+        document_service = DocumentService(db, index_service)
+        return await document_service.list_document_summaries(cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception(f"获取文档失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取文档失败: {str(e)}")
+
+
 @router.get("/{document_id}", response_model=DocumentResponse)
 async def get_document(
     document_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    index_service: IndexService = Depends(get_index_service)
 ):
     """
     通过ID获取文档
     """
     try:
-        document_service = DocumentService(db)
-        document = document_service.get_document(document_id)
+        document_service = DocumentService(db, index_service)
+        document = await document_service.get_document(document_id)
         if document is None:
             raise HTTPException(status_code=404, detail="文档未找到")
         return document
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception(f"获取文档失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取文档失败: {str(e)}")
 
 
+@router.put("/{document_id}", response_model=DocumentUpdateResponse)
+async def update_document(
+    document_id: int,
+    file: UploadFile = File(...),
+    db: AsyncSession = Depends(get_async_db),
+    index_service: IndexService = Depends(get_index_service)
+):
+    """
+    用新文件替换文档内容，只重新索引发生变化的分块
+    """
+    try:
+        data = await _read_upload(file)
+        document_service = DocumentService(db, index_service)
+        result = await document_service.update_document(document_id, file.filename, data)
+        if result is None:
+            raise HTTPException(status_code=404, detail="文档未找到")
+
+        document, chunk_stats = result
+        if not chunk_stats["success"]:
+            raise HTTPException(status_code=500, detail="文档索引更新失败")
+        return DocumentUpdateResponse(
+            **DocumentResponse.model_validate(document).model_dump(),
+            chunks=chunk_stats,
+        )
+    except HTTPException:
+        raise
+    except DuplicateDocumentError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.exception(f"文件处理失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"文件处理失败: {str(e)}")
+
+
 @router.delete("/{document_id}")
 async def delete_document(
     document_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    index_service: IndexService = Depends(get_index_service)
 ):
     """
     删除文档
     """
     try:
-        document_service = DocumentService(db)  
-        success = document_service.delete_document(document_id)
+        document_service = DocumentService(db, index_service)  
+        success = await document_service.delete_document(document_id)
         if not success:
             raise HTTPException(status_code=404, detail="文档未找到")
         return {"message": "文档已删除"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception(f"删除文档失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"删除文档失败: {str(e)}")
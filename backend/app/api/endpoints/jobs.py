@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException
+import logging
+
+from app.api.deps import get_job_queue
+from app.schemas.job import IngestionJobResponse
+from app.services.job_service import IngestionJobQueue
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+@router.get("/{job_id}", response_model=IngestionJobResponse)
+async def get_job(
+    job_id: str,
+    queue: IngestionJobQueue = Depends(get_job_queue)
+):
+    """
+    获取摄入任务的状态和进度
+    """
+    try:
+        job = await queue.get_job(job_id)
+    except Exception as e:
+        logger.exception(f"获取任务失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"获取任务失败: {str(e)}")
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务未找到")
+    return job
@@ -1,8 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import json
+from typing import Any, AsyncIterator, Dict, Literal
 
-from app.db.session import get_db
-from app.schemas.query import QueryRequest, QueryResponse
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.api.deps import get_index_service
+from app.schemas.query import (
+    QueryBatchRequest,
+    QueryBatchResponse,
+    QueryRequest,
+    QueryResponse,
+    SearchCalibrationResponse,
+)
 from app.services.index_service import IndexService
 import logging
 
@@ -14,20 +23,98 @@ router = APIRouter()
 @router.post("/", response_model=QueryResponse)
 async def query_documents(
     query_request: QueryRequest,
-    db: Session = Depends(get_db)
+    index_service: IndexService = Depends(get_index_service)
 ):
     """
     查询文档并返回答案
     """
     try:
-        index_service = IndexService(db)
         result = await index_service.query(
             query_text=query_request.query,
             top_k=query_request.top_k,
-            rerank=query_request.rerank
+            rerank=query_request.rerank,
+            rerank_top_k=query_request.rerank_top_k,
+            search_kwargs=query_request.search_kwargs(),
         )
         return result
     except Exception as e:
         logger.exception(f"查询失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"查询失败: {str(e)}")
 
+
+
+@router.post("/batch", response_model=QueryBatchResponse)
+async def query_documents_batch(
+    batch_request: QueryBatchRequest,
+    index_service: IndexService = Depends(get_index_service)
+):
+    """
+    批量查询文档，结果顺序与请求中的查询顺序一致
+    """
+    try:
+        results = await index_service.query_batch(
+            query_texts=batch_request.queries,
+            top_k=batch_request.top_k,
+            rerank=batch_request.rerank,
+            rerank_top_k=batch_request.rerank_top_k,
+            search_kwargs=batch_request.search_kwargs(),
+        )
+        return {"results": results}
+    except Exception as e:
+        logger.exception(f"批量查询失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"批量查询失败: {str(e)}")
+
+
+@router.post("/calibrate", response_model=SearchCalibrationResponse)
+async def calibrate_search(
+    index_service: IndexService = Depends(get_index_service)
+):
+    """
+    在当前集合上测量各候选检索配置的延迟和召回率，供latency_target_ms选择
+    """
+    try:
+        profiles = await index_service.calibrate_search()
+        return {"site_id": index_service.site_id, "profiles": profiles}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception(f"检索参数校准失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"检索参数校准失败: {str(e)}")
+
+
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+
+def _encode_event(event: Dict[str, Any], format: str) -> str:
+    if format == "sse":
+        return f"event: {event['event']}\ndata: {json.dumps(event['data'], ensure_ascii=False, default=str)}\n\n"
+    return json.dumps(event, ensure_ascii=False, default=str) + "\n"
+
+
+@router.post("/stream")
+async def query_documents_stream(
+    query_request: QueryRequest,
+    format: Literal["ndjson", "sse"] = Query("ndjson"),
+    index_service: IndexService = Depends(get_index_service)
+):
+    """
+    流式查询文档，检索结果、重排序结果和最终汇总依次推送
+
+    响应格式由format指定: ndjson每行一个事件，sse为Server-Sent Events。
+    """
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in index_service.query_stream(
+                query_text=query_request.query,
+                top_k=query_request.top_k,
+                rerank=query_request.rerank,
+                rerank_top_k=query_request.rerank_top_k,
+                search_kwargs=query_request.search_kwargs(),
+            ):
+                yield _encode_event(event, format)
+        except Exception as e:
+            # 响应头已经发出，错误只能作为事件推送给客户端
+            logger.exception(f"流式查询失败: {str(e)}")
+            yield _encode_event({"event": "error", "data": {"detail": f"查询失败: {str(e)}"}}, format)
+
+    return StreamingResponse(events(), media_type=STREAM_MEDIA_TYPES[format])
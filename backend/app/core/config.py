@@ -1,5 +1,5 @@
 import os
-from typing import List, Union
+from typing import Any, Dict, List, Union
 from pydantic import AnyHttpUrl, field_validator
 from pydantic_settings import BaseSettings
 
@@ -15,6 +15,14 @@ class Settings(BaseSettings):
     POSTGRES_DB: str
     POSTGRES_HOST: str
     POSTGRES_PORT: str
+    # Async engine (asyncpg) used by the API and the ingestion worker; derived from DATABASE_URL when empty
+    ASYNC_DATABASE_URL: str = ""
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: int = 30  # seconds to wait for a free connection
+    DB_POOL_RECYCLE: int = 1800  # seconds; -1 disables
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100  # prepared statements cached per connection; 0 behind pgbouncer
     
     # Redis settings
     REDIS_HOST: str = "localhost"
@@ -22,10 +30,32 @@ class Settings(BaseSettings):
     REDIS_PASSWORD: str = ""
     REDIS_DB: int = 0
     
+    # Docstore node encoding: compact (msgpack, see app.migrate_docstore) / json
+    DOCSTORE_CODEC: str = "compact"
+    DOCSTORE_COMPRESSION: str = "zstd"  # zstd / none, applied to node text
+    DOCSTORE_COMPRESS_MIN_BYTES: int = 1024
+    DOCSTORE_ZSTD_LEVEL: int = 3
+    
     # Milvus settings
     MILVUS_HOST: str = "localhost"
     MILVUS_PORT: int = 19530
     MILVUS_DB: str = "default"
+    MILVUS_HNSW_M: int = 32
+    MILVUS_HNSW_EF_CONSTRUCTION: int = 200
+    MILVUS_SEARCH_EF: int = 512
+    
+    # Vector store backend: milvus / numpy (in-process, for small sites and offline use).
+    # A numpy site's directory is locked by the one process that opens it, so its ingestion
+    # jobs run inside the API process instead of app.worker; run a single uvicorn worker.
+    VECTOR_STORE_BACKEND: str = "milvus"
+    SITE_VECTOR_STORE_BACKENDS: Dict[str, str] = {}
+    NUMPY_VECTOR_STORE_DIR: str = "./data/vectors"
+    
+    # Sparse index backend: milvus (sparse field in the collection) / local (in-process inverted index).
+    # Sites on the numpy vector store always use the local index. Like the numpy store, the
+    # local index is locked by one process, so its sites ingest inside the API process.
+    SPARSE_INDEX_BACKEND: str = "milvus"
+    SPARSE_INDEX_DIR: str = "./data/sparse"
     
     # OpenAI settings
     OPENAI_API_KEY: str
@@ -37,15 +67,71 @@ class Settings(BaseSettings):
     EMBEDDING_MODEL: str = "bge-m3"
     EMB_DIMENSIONS: int = 1536
     ENABLE_SPARSE_EMBEDDING: bool = True
+    SPARSE_BATCH_SIZE: int = 32
+    SPARSE_MAX_CONCURRENCY: int = 4
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_MAX_CONCURRENCY: int = 4
+    EMBEDDING_CACHE_BACKEND: str = "redis"  # redis / local / none
+    EMBEDDING_CACHE_PATH: str = "/tmp/simplerag_embedding_cache.sqlite3"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 1_000_000
+    
+    # Document metadata policy: full metadata stays on the document row, chunks reference it by document_id.
+    # document_id and filename are always kept on chunks.
+    METADATA_NODE_KEYS: List[str] = ["document_id", "filename", "site_id", "created_at"]
+    METADATA_EMBED_KEYS: List[str] = ["filename"]
+    METADATA_SOURCE_KEYS: List[str] = ["document_id", "filename", "created_at"]
+    METADATA_MAX_VALUE_BYTES: int = 1024  # larger values are never copied onto chunks
     
     # Text processing settings
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
     
+    # Ingestion settings
+    INGEST_BATCH_SIZE: int = 64
+    INGEST_QUEUE_SIZE: int = 8
+    INGEST_SPLIT_WORKERS: int = 2
+    INGEST_EMBED_WORKERS: int = 4
+    INGEST_INSERT_WORKERS: int = 2
+    INGEST_JOB_STREAM: str = "simplerag:jobs:ingest"
+    INGEST_JOB_GROUP: str = "ingest-workers"
+    INGEST_JOB_TTL_SECONDS: int = 7 * 24 * 3600
+    INGEST_JOB_CLAIM_IDLE_MS: int = 10 * 60 * 1000  # running jobs heartbeat every third of this
+    INGEST_JOB_MAX_DELIVERIES: int = 3  # then the job fails and moves to the dead-letter stream
+    INGEST_WORKER_CONCURRENCY: int = 2
+    
+    # Index service settings (sites warmed up at startup)
+    INDEX_WARMUP_SITES: List[str] = ["default"]
+    
+    # Query cache settings
+    QUERY_CACHE_BACKEND: str = "redis"  # redis / local / none
+    QUERY_CACHE_MAX_ENTRIES: int = 10_000
+    QUERY_CACHE_TTL_SECONDS: int = 600
+    QUERY_VECTOR_CACHE_MAX_ENTRIES: int = 10_000  # 0 disables
+    QUERY_VECTOR_CACHE_TTL_SECONDS: int = 3600
+    
+    # Search tuning settings
+    # Per-site defaults for ef / candidate_k / rerank_top_k, e.g. {"docs": {"ef": 128, "candidate_k": 20}}
+    SITE_SEARCH_DEFAULTS: Dict[str, Dict[str, Any]] = {}
+    # Candidate profiles measured by latency calibration, cheapest first
+    SEARCH_CALIBRATION_PROFILES: List[Dict[str, int]] = [
+        {"ef": 16, "candidate_k": 10, "rerank_top_k": 5},
+        {"ef": 64, "candidate_k": 20, "rerank_top_k": 10},
+        {"ef": 128, "candidate_k": 40, "rerank_top_k": 10},
+        {"ef": 512, "candidate_k": 100, "rerank_top_k": 20},
+    ]
+    SEARCH_CALIBRATION_SAMPLES: int = 50
+    
+    # Upload settings
+    UPLOAD_MAX_FILE_BYTES: int = 20 * 1024 * 1024
+    # What to do when an upload has the same content as an existing document: skip / alias / replace
+    UPLOAD_DEDUP_POLICY: str = "skip"
+    
     # Reranker settings (optional)
     RERANKER_API_KEY: str = ""
     RERANKER_BASE_URL: str = ""
     RERANKER_MODEL: str = "bge-reranker-v2-m3"
+    RERANKER_TIMEOUT_MS: int = 800  # falls back to retrieval order when exceeded
+    RERANKER_MAX_CONCURRENCY: int = 8
     
     # CORS settings
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = []
@@ -1,15 +1,50 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
 
-# Create SQLAlchemy engine
-engine = create_engine(settings.DATABASE_URL)
+# 连接池参数，同步和异步引擎共用
+POOL_OPTIONS = dict(
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
+
+
+def async_database_url() -> str:
+    """异步引擎的连接URL，未单独配置时将DATABASE_URL的驱动换成asyncpg"""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    return make_url(settings.DATABASE_URL).set(drivername="postgresql+asyncpg").render_as_string(
+        hide_password=False
+    )
+
+
+# Create SQLAlchemy engine (Alembic迁移和同步脚本使用)
+engine = create_engine(settings.DATABASE_URL, **POOL_OPTIONS)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 异步引擎，API和摄入worker使用，数据库等待期间不阻塞事件循环
+async_engine = create_async_engine(
+    async_database_url(),
+    **POOL_OPTIONS,
+    connect_args={
+        # SQLAlchemy层和asyncpg层各有一个预编译语句缓存
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    },
+)
+
+# 提交后不过期对象，响应序列化时不会触发异步上下文之外的延迟加载
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Create Base class
 Base = declarative_base()
 
@@ -21,3 +56,8 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    """异步数据库会话依赖"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,11 +1,34 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.api.api import api_router
+from app.db.session import async_engine
+from app.services.index_service import IndexServiceFactory
+from app.services.job_service import IngestionJobQueue
+from app.worker import wait_local_jobs
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """创建并预热长生命周期的服务，所有请求共享，关闭时统一释放连接"""
+    app.state.job_queue = IngestionJobQueue.from_settings()
+    await IndexServiceFactory.warmup(settings.INDEX_WARMUP_SITES)
+    try:
+        yield
+    finally:
+        # 进程内站点的摄入任务由本进程执行，关闭索引前等待写入完成
+        await wait_local_jobs()
+        await IndexServiceFactory.close_all()
+        await app.state.job_queue.close()
+        await async_engine.dispose()
+
 
 app = FastAPI(
     title=settings.APP_NAME,
+    lifespan=lifespan,
     openapi_url=f"{settings.API_PREFIX}/openapi.json",
     docs_url=f"{settings.API_PREFIX}/docs",
     redoc_url=f"{settings.API_PREFIX}/redoc",
@@ -0,0 +1,132 @@
+"""
+文档存储格式迁移
+
+把各站点Redis文档存储中的节点原地改写为紧凑编码(NodeCodec)，或改写回JSON以便回退:
+
+    python -m app.migrate_docstore                  # 迁移所有站点
+    python -m app.migrate_docstore --site docs      # 只迁移指定站点
+    python -m app.migrate_docstore --to json        # 改写回RedisDocumentStore的JSON格式
+
+用HSCAN分批读取，每批用一个Lua脚本按字段比较后写入：读取之后被摄入worker改写过的字段保持不变，
+迁移期间服务和worker不需要停机。已是目标格式的字段直接跳过，中断后可以重复执行。
+"""
+import argparse
+import asyncio
+import json
+import logging
+from typing import Dict, List, Optional
+
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from app.services.custom.compact_docstore import NodeCodec
+
+logger = logging.getLogger(__name__)
+
+FORMAT_COMPACT = "compact"
+FORMAT_JSON = "json"
+
+# 与IndexService的redis_namespace和RedisDocumentStore的节点集合名一致
+NODE_COLLECTION_PATTERN = "simplerag:*:docs/doc"
+
+# 字段值仍是读取时的旧值才写入新值，ARGV依次为 字段, 旧值, 新值
+_COMPARE_AND_SET = """
+local written = 0
+for i = 1, #ARGV, 3 do
+    if redis.call('HGET', KEYS[1], ARGV[i]) == ARGV[i + 1] then
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 2])
+        written = written + 1
+    end
+end
+return written
+"""
+
+
+def node_collection(site_id: str) -> str:
+    return f"simplerag:{site_id}:docs/doc"
+
+
+def _convert(codec: NodeCodec, value: bytes, target: str) -> Optional[bytes]:
+    """返回目标格式的值，已是目标格式时返回None"""
+    if target == FORMAT_COMPACT:
+        return None if codec.is_compact(value) else codec.encode_json(value)
+    if not codec.is_compact(value):
+        return None
+    return json.dumps(codec.decode(value)).encode()
+
+
+async def migrate_collection(
+    client: aioredis.Redis,
+    collection: str,
+    codec: NodeCodec,
+    target: str = FORMAT_COMPACT,
+    batch_size: int = 500,
+) -> Dict[str, int]:
+    """
+    原地改写一个节点集合
+
+    Returns:
+        Dict[str, int]: 扫描、改写、因并发写入跳过的节点数，以及改写前后的字节数
+    """
+    compare_and_set = client.register_script(_COMPARE_AND_SET)
+    stats = {"scanned": 0, "rewritten": 0, "conflicts": 0, "bytes_before": 0, "bytes_after": 0}
+    cursor = 0
+    while True:
+        cursor, values = await client.hscan(collection, cursor, count=batch_size)
+        args: List[bytes] = []
+        for field, value in values.items():
+            stats["scanned"] += 1
+            converted = _convert(codec, value, target)
+            if converted is None:
+                continue
+            stats["bytes_before"] += len(value)
+            stats["bytes_after"] += len(converted)
+            args += [field, value, converted]
+        if args:
+            written = await compare_and_set(keys=[collection], args=args)
+            stats["rewritten"] += written
+            stats["conflicts"] += len(args) // 3 - written
+        if cursor == 0:
+            return stats
+
+
+async def find_collections(client: aioredis.Redis) -> List[str]:
+    """列出所有站点的节点集合"""
+    collections = []
+    async for key in client.scan_iter(match=NODE_COLLECTION_PATTERN, _type="hash"):
+        collections.append(key.decode())
+    return sorted(collections)
+
+
+async def run_migration(sites: List[str], target: str, batch_size: int) -> None:
+    client = aioredis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        password=settings.REDIS_PASSWORD or None,
+        db=settings.REDIS_DB,
+    )
+    codec = NodeCodec.from_settings()
+    try:
+        collections = [node_collection(site) for site in sites] if sites else await find_collections(client)
+        for collection in collections:
+            stats = await migrate_collection(client, collection, codec, target, batch_size)
+            logger.info(
+                f"{collection}: 扫描 {stats['scanned']}，改写 {stats['rewritten']}，"
+                f"并发修改跳过 {stats['conflicts']}，{stats['bytes_before']} -> {stats['bytes_after']} 字节"
+            )
+    finally:
+        await client.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SimpleRAG 文档存储格式迁移")
+    parser.add_argument("--site", action="append", default=[], help="只迁移指定站点，可重复")
+    parser.add_argument("--to", choices=[FORMAT_COMPACT, FORMAT_JSON], default=FORMAT_COMPACT, help="目标格式")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批扫描的节点数")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_migration(args.site, args.to, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, func
+from sqlalchemy import Column, Index, Integer, String, Text, DateTime, func
 from sqlalchemy.dialects.postgresql import JSONB
 
 from app.db.session import Base
@@ -10,6 +10,15 @@ class Document(Base):
     filename = Column(String, index=True)
     content = Column(Text)
     _metadata = Column(JSONB)
+    site_id = Column(String, nullable=False, server_default="default")
+    # 上传文件原始内容的SHA-256，同一站点内唯一，用于上传去重
+    content_hash = Column(String(64))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    __table_args__ = (
+        # 列表接口按 (created_at, id) 游标分页
+        Index("ix_documents_created_at_id", "created_at", "id"),
+        Index("ux_documents_site_id_content_hash", "site_id", "content_hash", unique=True),
+    )
+
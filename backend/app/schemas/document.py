@@ -1,12 +1,18 @@
 from datetime import datetime
-from typing import Dict, Any, Optional
-from pydantic import BaseModel
+from typing import Dict, Any, List, Optional
+from pydantic import AliasChoices, BaseModel, Field, field_serializer
+
+from app.services.metadata_policy import MetadataPolicy
 
 
 class DocumentBase(BaseModel):
     filename: str
     content: Optional[str] = None
-    _metadata: Optional[Dict[str, Any]] = None
+    # ORM模型的列名是_metadata(metadata是SQLAlchemy的保留属性)；
+    # 下划线开头的字段会被pydantic当作私有属性，传入的元数据会被静默丢弃，因此用别名映射
+    metadata: Optional[Dict[str, Any]] = Field(
+        default=None, validation_alias=AliasChoices("_metadata", "metadata")
+    )
 
 
 class DocumentCreate(DocumentBase):
@@ -21,3 +27,73 @@ class DocumentResponse(DocumentBase):
     class Config:
         from_attributes = True
 
+    @field_serializer("metadata")
+    def serialize_metadata(self, metadata: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        # 完整元数据可能包含整篇解析结果，响应中只返回白名单内的键
+        if metadata is None:
+            return None
+        return MetadataPolicy.from_settings().document_metadata(metadata)
+
+
+class DocumentSummary(BaseModel):
+    id: int
+    filename: str
+    size: int
+    preview: str
+    truncated: bool
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+
+class DocumentListResponse(BaseModel):
+    documents: List[DocumentSummary]
+    next_cursor: Optional[str] = None
+
+
+class ChunkUpdateStats(BaseModel):
+    reused: int
+    # 内容未变、前后分块变化后重新写入的分块
+    relinked: int = 0
+    added: int
+    removed: int
+
+
+class DocumentUpdateResponse(DocumentResponse):
+    chunks: ChunkUpdateStats
+
+
+class DocumentUploadResponse(DocumentResponse):
+    # 内容与已有文档重复且未重新创建时(skip/alias)没有摄入任务
+    job_id: Optional[str] = None
+    job_status: Optional[str] = None
+    # 内容重复时执行的去重策略，以及匹配到的已有文档ID
+    dedup_action: Optional[str] = None
+    duplicate_of: Optional[int] = None
+
+
+class UploadedDocument(BaseModel):
+    id: int
+    filename: str
+
+    class Config:
+        from_attributes = True
+
+
+class SkippedFile(BaseModel):
+    filename: str
+    reason: str
+
+
+class DuplicateFile(BaseModel):
+    filename: str
+    document_id: int
+    action: str
+
+
+class DocumentBatchUploadResponse(BaseModel):
+    # 全部文件都与已有文档重复时没有摄入任务
+    job_id: Optional[str] = None
+    job_status: Optional[str] = None
+    documents: List[UploadedDocument]
+    skipped: List[SkippedFile]
+    duplicates: List[DuplicateFile] = []
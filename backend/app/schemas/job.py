@@ -0,0 +1,16 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    status: str
+    document_ids: List[int]
+    site_id: str
+    filename: str
+    chunks_split: int
+    chunks_embedded: int
+    chunks_inserted: int
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
@@ -1,11 +1,38 @@
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 from pydantic import BaseModel, Field
 
 
-class QueryRequest(BaseModel):
-    query: str
+class QueryOptions(BaseModel):
     top_k: int = Field(default=5, ge=1, le=20)
     rerank: bool = True
+    # 混合检索融合参数
+    fusion: Literal["rrf", "weighted"] = "rrf"
+    dense_weight: float = Field(default=1.0, ge=0)
+    sparse_weight: float = Field(default=1.0, ge=0)
+    # 检索深度，未指定时使用站点默认值
+    candidate_k: Optional[int] = Field(default=None, ge=1, le=200)
+    ef: Optional[int] = Field(default=None, ge=1, le=4096)
+    rerank_top_k: Optional[int] = Field(default=None, ge=1, le=100)
+    # 按站点校准表选择 ef、candidate_k 和 rerank_top_k，显式指定的参数优先
+    latency_target_ms: Optional[float] = Field(default=None, gt=0)
+
+    def search_kwargs(self) -> Dict[str, Any]:
+        """转换为IndexService.query的search_kwargs"""
+        return {
+            "fusion": self.fusion,
+            "weights": [self.dense_weight, self.sparse_weight],
+            "candidate_k": self.candidate_k,
+            "ef": self.ef,
+            "latency_target_ms": self.latency_target_ms,
+        }
+
+
+class QueryRequest(QueryOptions):
+    query: str
+
+
+class QueryBatchRequest(QueryOptions):
+    queries: List[str] = Field(min_length=1, max_length=256)
 
 
 class QuerySourceNode(BaseModel):
@@ -17,6 +44,18 @@ class QuerySourceNode(BaseModel):
 
 class QueryResponse(BaseModel):
     query: str
-    answer: str
+    answer: Optional[str] = None
     sources: List[QuerySourceNode]
+    total_results: int = 0
+    # 重排序超时或失败、回退为检索顺序时为True
+    degraded: bool = False
+
+
+
+class QueryBatchResponse(BaseModel):
+    results: List[QueryResponse]
+
 
+class SearchCalibrationResponse(BaseModel):
+    site_id: str
+    profiles: List[Dict[str, Any]]
@@ -0,0 +1,56 @@
+import os
+from typing import IO, Sequence
+
+# 新文件全部写完后才创建，存在即表示替换已提交
+COMMIT_MARKER = ".replace-commit"
+STAGED_SUFFIX = ".staged"
+
+
+def staged_path(directory: str, name: str) -> str:
+    """name的待替换文件路径，与原文件在同一目录，保证os.replace是原子的"""
+    return os.path.join(directory, name + STAGED_SUFFIX)
+
+
+def fsync_file(f: IO) -> None:
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _fsync_dir(directory: str) -> None:
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def replace_files(directory: str, names: Sequence[str]) -> None:
+    """
+    用已写好并fsync的staged文件一起替换多个文件
+
+    先创建提交标记再逐个os.replace：标记之前崩溃时原文件完好，staged文件在下次打开时丢弃；
+    标记之后崩溃时由recover_files继续完成替换，不会出现新旧文件混用。
+    """
+    _fsync_dir(directory)
+    with open(os.path.join(directory, COMMIT_MARKER), "wb") as f:
+        fsync_file(f)
+    _fsync_dir(directory)
+    recover_files(directory, names)
+
+
+def recover_files(directory: str, names: Sequence[str]) -> None:
+    """打开目录时调用：完成已提交的替换，丢弃未提交的staged文件"""
+    marker = os.path.join(directory, COMMIT_MARKER)
+    committed = os.path.exists(marker)
+    for name in names:
+        staged = staged_path(directory, name)
+        if not os.path.exists(staged):
+            continue
+        if committed:
+            os.replace(staged, os.path.join(directory, name))
+        else:
+            os.remove(staged)
+    if committed:
+        _fsync_dir(directory)
+        os.remove(marker)
+        _fsync_dir(directory)
@@ -1,5 +1,7 @@
+import asyncio
 import os
-from typing import List
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import httpx
 from llama_index.vector_stores.milvus.utils import BaseSparseEmbeddingFunction
@@ -12,18 +14,109 @@ from tenacity import (
 
 
 class BGEM3SparseEmbeddingFunction(BaseSparseEmbeddingFunction):
-    def __init__(self, timeout=60, max_retries=32):
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        timeout=60,
+        max_retries=32,
+        max_batch_size=32,
+        max_concurrency=4,
+        query_cache=None,
+    ):
         """
         初始化函数
 
         Args:
+            base_url: bgem3服务地址，默认读取环境变量EMBEDDING_BASE_URL
             timeout: 请求超时时间(秒)
             max_retries: 最大重试次数
+            max_batch_size: 单次请求的最大文本数
+            max_concurrency: 同时在途的最大请求数
+            query_cache: 查询向量缓存(QueryVectorCache)，为None时不缓存查询向量
         """
         self.timeout = timeout
         self.max_retries = max_retries
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.query_cache = query_cache
+        self.endpoint = f"{base_url or os.getenv('EMBEDDING_BASE_URL')}/embeddings"
+        self._limits = httpx.Limits(
+            max_connections=max_concurrency,
+            max_keepalive_connections=max_concurrency,
+        )
+        self._client = httpx.Client(timeout=timeout, limits=self._limits)
+        # 异步客户端的连接池绑定事件循环，首次使用时按当前循环创建
+        self._async_client: Optional[httpx.AsyncClient] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # 正在写入的批次预先计算好的稀疏向量，值为 (向量, 引用该文本的在途批次数)
+        self._prefetched: Dict[str, Tuple[Dict[int, float], int]] = {}
         super().__init__()
 
+    @contextmanager
+    def prefetched(self, documents: List[str], vectors: List[Dict[int, float]]) -> Iterator[None]:
+        """
+        在with块内登记一批已计算好的文档稀疏向量，退出时(包括写入失败或取消)移除
+
+        MilvusVectorStore写入时会逐条调用encode_documents，命中预取结果即可跳过同步的远程请求。
+        同一文本可能出现在同一批的多个分块或多个并发批次中，按批次计数，最后一个批次退出时才移除。
+        """
+        batch = dict(zip(documents, vectors))
+        for document, vector in batch.items():
+            _, count = self._prefetched.get(document, (None, 0))
+            self._prefetched[document] = (vector, count + 1)
+        try:
+            yield
+        finally:
+            for document in batch:
+                vector, count = self._prefetched[document]
+                if count == 1:
+                    del self._prefetched[document]
+                else:
+                    self._prefetched[document] = (vector, count - 1)
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_client.is_closed or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(timeout=self.timeout, limits=self._limits)
+            self._async_loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._async_client
+
+    def close(self):
+        self._client.close()
+
+    async def aclose(self):
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_loop = None
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        return [
+            texts[start:start + self.max_batch_size]
+            for start in range(0, len(texts), self.max_batch_size)
+        ]
+
+    def _encode(self, texts: List[str]) -> List[Dict[int, float]]:
+        results = []
+        for batch in self._batches(texts):
+            outputs = self._remote_encode(batch)
+            results.extend(self._to_standard_dict(output["embedding"]) for output in outputs)
+        return results
+
+    async def _aencode(self, texts: List[str]) -> List[Dict[int, float]]:
+        # 按批拆分并发请求，并发数由信号量限制
+        outputs = await asyncio.gather(
+            *(self._async_remote_encode(batch) for batch in self._batches(texts))
+        )
+        return [
+            self._to_standard_dict(output["embedding"])
+            for batch_outputs in outputs
+            for output in batch_outputs
+        ]
+
     @retry(
         stop=stop_after_attempt(64),
         wait=wait_exponential(multiplier=1, min=1, max=10),
@@ -71,18 +164,17 @@ class BGEM3SparseEmbeddingFunction(BaseSparseEmbeddingFunction):
         }
         """
         try:
-            response = httpx.post(
-                f"{os.getenv('EMBEDDING_BASE_URL')}/embeddings",
+            response = self._client.post(
+                self.endpoint,
                 json={
                     "input": queries,
                     "return_dense": "False",
                     "return_sparse": "True",
                     "return_colbert_vecs": "False",
                 },
-                timeout=self.timeout,
             )
             response.raise_for_status()  # 检查HTTP错误
-            return response.json()["data"]
+            return sorted(response.json()["data"], key=lambda e: e["index"])
         except httpx.HTTPStatusError as e:
             print(f"HTTP错误: {e.response.status_code} - {e.response.text}")
             raise
@@ -108,19 +200,19 @@ class BGEM3SparseEmbeddingFunction(BaseSparseEmbeddingFunction):
     )
     async def _async_remote_encode(self, queries: List[str]):
         try:
-            async with httpx.AsyncClient() as client:
+            client = self._get_async_client()
+            async with self._semaphore:
                 response = await client.post(
-                    f"{os.getenv('EMBEDDING_BASE_URL')}/embeddings",
+                    self.endpoint,
                     json={
                         "input": queries,
                         "return_dense": "False",
                         "return_sparse": "True",
                         "return_colbert_vecs": "False",
                     },
-                    timeout=self.timeout,
                 )
-                response.raise_for_status()  # 检查HTTP错误
-                return response.json()["data"]
+            response.raise_for_status()  # 检查HTTP错误
+            return sorted(response.json()["data"], key=lambda e: e["index"])
         except httpx.HTTPStatusError as e:
             print(f"HTTP错误: {e.response.status_code} - {e.response.text}")
             raise
@@ -131,25 +223,40 @@ class BGEM3SparseEmbeddingFunction(BaseSparseEmbeddingFunction):
             print(f"请求错误: {str(e)}")
             raise
 
+    def _lookup_queries(self, queries: List[str]):
+        """从查询向量缓存取出已有结果，返回结果列表和未命中的查询"""
+        if self.query_cache is None:
+            return [None] * len(queries), list(dict.fromkeys(queries))
+        results = [self.query_cache.get_sparse(self.endpoint, query) for query in queries]
+        missing = list(dict.fromkeys(q for q, r in zip(queries, results) if r is None))
+        return results, missing
+
+    def _fill_queries(self, queries: List[str], results, missing: List[str], vectors):
+        encoded = dict(zip(missing, vectors))
+        if self.query_cache is not None:
+            for query, vector in encoded.items():
+                self.query_cache.set_sparse(self.endpoint, query, vector)
+        return [result if result is not None else encoded[query] for query, result in zip(queries, results)]
+
     def encode_queries(self, queries: List[str]):
-        # 使用httpx连接远程的bgem3服务
-        outputs = self._remote_encode(queries)
-        return [self._to_standard_dict(output["embedding"]) for output in outputs]
+        # 同步路径仅用于非异步调用方，异步检索会走async_encode_queries
+        results, missing = self._lookup_queries(queries)
+        vectors = self._encode(missing) if missing else []
+        return self._fill_queries(queries, results, missing, vectors)
 
     async def async_encode_queries(self, queries: List[str]):
-        outputs = await self._async_remote_encode(queries)
-        return [self._to_standard_dict(output["embedding"]) for output in outputs]
+        results, missing = self._lookup_queries(queries)
+        vectors = await self._aencode(missing) if missing else []
+        return self._fill_queries(queries, results, missing, vectors)
 
     def encode_documents(self, documents: List[str]):
-        outputs = self._remote_encode(documents)
-        return [self._to_standard_dict(output["embedding"]) for output in outputs]
+        if all(document in self._prefetched for document in documents):
+            return [self._prefetched[document][0] for document in documents]
+        return self._encode(documents)
 
     async def async_encode_documents(self, documents: List[str]):
-        outputs = await self._async_remote_encode(documents)
-        return [self._to_standard_dict(output["embedding"]) for output in outputs]
+        return await self._aencode(documents)
 
     def _to_standard_dict(self, raw_output):
-        result = {}
-        for k in raw_output:
-            result[int(k)] = raw_output[k]
-        return result
+        # JSON对象的键是字符串，转换为整数词id
+        return {int(token): weight for token, weight in raw_output.items()}
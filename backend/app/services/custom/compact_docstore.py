@@ -0,0 +1,287 @@
+import copy
+import json
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+import msgpack
+import zstandard
+from llama_index.core.constants import DATA_KEY, TYPE_KEY
+from llama_index.core.schema import (
+    BaseNode,
+    Document,
+    ImageDocument,
+    ImageNode,
+    IndexNode,
+    MediaResource,
+    TextNode,
+)
+from llama_index.core.storage.docstore.types import DEFAULT_BATCH_SIZE
+from llama_index.core.storage.docstore.utils import json_to_doc
+from llama_index.storage.docstore.redis import RedisDocumentStore
+from llama_index.storage.kvstore.redis import RedisKVStore
+
+# 紧凑格式的前缀：0xc1在msgpack中保留不用，也不是合法的JSON开头，据此区分新旧格式
+MAGIC = b"\xc1\x01"
+
+COMPRESSION_NONE = "none"
+COMPRESSION_ZSTD = "zstd"
+
+# 各节点类型的字段默认值，与默认值相同的字段不写入Redis，读取时补回
+_FIELD_DEFAULTS = {
+    node.class_name(): {
+        key: value
+        for key, value in node.to_dict().items()
+        if key not in ("id_", "class_name", "index_id")
+    }
+    for node in (Document(), ImageDocument(), TextNode(), ImageNode(), IndexNode(index_id=""))
+}
+# text_resource中为None的字段同样不写入
+_RESOURCE_DEFAULTS = MediaResource().model_dump()
+
+
+class NodeCodec:
+    """
+    文档存储中节点的紧凑编码
+
+    RedisDocumentStore把doc_to_json的结果再序列化一次JSON：正文中的换行和引号被转义两次，
+    Document的正文在text和text_resource.text中各存一份，模板等默认值每条都重复保存。
+    这里改为msgpack编码，只保存与默认值不同的字段，正文只保存一份，
+    超过min_compress_bytes的正文用zstd压缩后以二进制保存。
+
+    decode同时兼容旧的JSON格式，迁移完成之前两种格式可以混合存在。
+    """
+
+    def __init__(
+        self,
+        compression: str = COMPRESSION_ZSTD,
+        min_compress_bytes: int = 1024,
+        level: int = 3,
+    ):
+        if compression not in (COMPRESSION_NONE, COMPRESSION_ZSTD):
+            raise ValueError(f"不支持的压缩方式: {compression}")
+        self.compression = compression
+        self.min_compress_bytes = min_compress_bytes
+        self.level = level
+
+    @classmethod
+    def from_settings(cls) -> "NodeCodec":
+        from app.core.config import settings
+
+        return cls(
+            compression=settings.DOCSTORE_COMPRESSION,
+            min_compress_bytes=settings.DOCSTORE_COMPRESS_MIN_BYTES,
+            level=settings.DOCSTORE_ZSTD_LEVEL,
+        )
+
+    @staticmethod
+    def is_compact(value: Union[bytes, str]) -> bool:
+        return isinstance(value, bytes) and value.startswith(MAGIC)
+
+    def _pack_text(self, text: str) -> Union[str, bytes]:
+        raw = text.encode("utf-8")
+        if self.compression == COMPRESSION_ZSTD and len(raw) >= self.min_compress_bytes:
+            # msgpack区分str和bin类型，读取时据此判断正文是否压缩过
+            return zstandard.compress(raw, self.level)
+        return text
+
+    @staticmethod
+    def _unpack_text(text: Union[str, bytes]) -> str:
+        if isinstance(text, bytes):
+            return zstandard.decompress(text).decode("utf-8")
+        return text
+
+    def encode(self, doc_json: Dict[str, Any]) -> bytes:
+        """把doc_to_json的结果编码为紧凑格式"""
+        data = dict(doc_json[DATA_KEY])
+        defaults = _FIELD_DEFAULTS.get(data.get("class_name"), {})
+        resource = data.get("text_resource")
+        if resource is not None:
+            resource = {key: value for key, value in resource.items() if value is not None}
+            if resource.get("text") == data.get("text"):
+                # Document的正文在text_resource中已有一份
+                data.pop("text", None)
+            if "text" in resource:
+                resource["text"] = self._pack_text(resource["text"])
+            data["text_resource"] = resource
+        for key, default in defaults.items():
+            if key in data and data[key] == default:
+                del data[key]
+        if "text" in data:
+            data["text"] = self._pack_text(data["text"])
+        return MAGIC + msgpack.packb([doc_json[TYPE_KEY], data], use_bin_type=True)
+
+    def decode(self, value: Union[bytes, str]) -> Dict[str, Any]:
+        """解码为doc_to_json格式的字典，可直接交给json_to_doc"""
+        if not self.is_compact(value):
+            return json.loads(value)
+        doc_type, stored = msgpack.unpackb(value[len(MAGIC):], raw=False)
+        data = copy.deepcopy(_FIELD_DEFAULTS.get(stored.get("class_name"), {}))
+        data.update(stored)
+        resource = stored.get("text_resource")
+        if resource is not None:
+            resource = data["text_resource"] = {**_RESOURCE_DEFAULTS, **resource}
+            if resource["text"] is not None:
+                resource["text"] = self._unpack_text(resource["text"])
+                if "text" not in stored:
+                    data["text"] = resource["text"]
+        if "text" in stored:
+            data["text"] = self._unpack_text(stored["text"])
+        return {TYPE_KEY: doc_type, DATA_KEY: data}
+
+    def decode_node(self, value: Union[bytes, str]) -> BaseNode:
+        return json_to_doc(self.decode(value))
+
+    def encode_json(self, value: Union[bytes, str]) -> bytes:
+        """把旧格式的值重新编码为紧凑格式，用于迁移"""
+        return self.encode(self.decode(value))
+
+
+class CompactRedisDocumentStore(RedisDocumentStore):
+    """
+    节点以NodeCodec紧凑编码保存的Redis文档存储
+
+    只有节点集合使用紧凑编码，文档哈希和ref_doc_info等小记录仍由RedisKVStore按JSON保存。
+    批量读取节点时用HMGET一次取回，不再逐个HGET；遍历全部节点时用HSCAN分批读取，
+    不会一次把整个哈希读入内存。
+    """
+
+    def __init__(
+        self,
+        redis_kvstore: RedisKVStore,
+        namespace: Optional[str] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        codec: Optional[NodeCodec] = None,
+    ) -> None:
+        super().__init__(redis_kvstore, namespace=namespace, batch_size=batch_size)
+        self.codec = codec or NodeCodec()
+
+    @property
+    def _redis(self):
+        return self._kvstore._redis_client
+
+    @property
+    def _aredis(self):
+        return self._kvstore._async_redis_client
+
+    def _batches(self, items: Sequence[Any], batch_size: Optional[int] = None):
+        batch_size = batch_size or self._batch_size
+        for start in range(0, len(items), batch_size):
+            yield items[start:start + batch_size]
+
+    def _encode_pairs(self, node_kv_pairs: List[Tuple[str, dict]]) -> List[Dict[str, bytes]]:
+        return [
+            {key: self.codec.encode(value) for key, value in batch}
+            for batch in self._batches(node_kv_pairs)
+        ]
+
+    def _decode_values(
+        self, doc_ids: Sequence[str], values: Sequence[Optional[bytes]], raise_error: bool
+    ) -> List[Optional[BaseNode]]:
+        nodes = []
+        for doc_id, value in zip(doc_ids, values):
+            if value is None:
+                if raise_error:
+                    raise ValueError(f"doc_id {doc_id} not found.")
+                nodes.append(None)
+            else:
+                nodes.append(self.codec.decode_node(value))
+        return nodes
+
+    @property
+    def docs(self) -> Dict[str, BaseNode]:
+        values = self._redis.hgetall(self._node_collection)
+        return {key.decode(): self.codec.decode_node(value) for key, value in values.items()}
+
+    def add_documents(
+        self,
+        docs: Sequence[BaseNode],
+        allow_update: bool = True,
+        batch_size: Optional[int] = None,
+        store_text: bool = True,
+    ) -> None:
+        batch_size = batch_size or self._batch_size
+        node_kv_pairs, metadata_kv_pairs, ref_doc_kv_pairs = self._prepare_kv_pairs(
+            docs, allow_update, store_text
+        )
+        with self._redis.pipeline(transaction=False) as pipe:
+            for mapping in self._encode_pairs(node_kv_pairs):
+                pipe.hset(self._node_collection, mapping=mapping)
+            pipe.execute()
+        self._kvstore.put_all(metadata_kv_pairs, collection=self._metadata_collection, batch_size=batch_size)
+        self._kvstore.put_all(ref_doc_kv_pairs, collection=self._ref_doc_collection, batch_size=batch_size)
+
+    async def async_add_documents(
+        self,
+        docs: Sequence[BaseNode],
+        allow_update: bool = True,
+        batch_size: Optional[int] = None,
+        store_text: bool = True,
+    ) -> None:
+        batch_size = batch_size or self._batch_size
+        node_kv_pairs, metadata_kv_pairs, ref_doc_kv_pairs = await self._async_prepare_kv_pairs(
+            docs, allow_update, store_text
+        )
+        pipe = self._aredis.pipeline(transaction=False)
+        for mapping in self._encode_pairs(node_kv_pairs):
+            pipe.hset(self._node_collection, mapping=mapping)
+        await pipe.execute()
+        await self._kvstore.aput_all(metadata_kv_pairs, collection=self._metadata_collection, batch_size=batch_size)
+        await self._kvstore.aput_all(ref_doc_kv_pairs, collection=self._ref_doc_collection, batch_size=batch_size)
+
+    def get_document(self, doc_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        value = self._redis.hget(self._node_collection, doc_id)
+        return self._decode_values([doc_id], [value], raise_error)[0]
+
+    async def aget_document(self, doc_id: str, raise_error: bool = True) -> Optional[BaseNode]:
+        value = await self._aredis.hget(self._node_collection, doc_id)
+        return self._decode_values([doc_id], [value], raise_error)[0]
+
+    def get_documents(self, doc_ids: Sequence[str], raise_error: bool = False) -> List[Optional[BaseNode]]:
+        """按顺序批量读取节点，不存在的位置为None"""
+        if not doc_ids:
+            return []
+        with self._redis.pipeline(transaction=False) as pipe:
+            for batch in self._batches(doc_ids):
+                pipe.hmget(self._node_collection, batch)
+            values = [value for batch in pipe.execute() for value in batch]
+        return self._decode_values(doc_ids, values, raise_error)
+
+    async def aget_documents(self, doc_ids: Sequence[str], raise_error: bool = False) -> List[Optional[BaseNode]]:
+        """按顺序批量读取节点，不存在的位置为None，所有批次在一次往返中完成"""
+        if not doc_ids:
+            return []
+        pipe = self._aredis.pipeline(transaction=False)
+        for batch in self._batches(doc_ids):
+            pipe.hmget(self._node_collection, batch)
+        values = [value for batch in await pipe.execute() for value in batch]
+        return self._decode_values(doc_ids, values, raise_error)
+
+    def get_nodes(self, node_ids: List[str], raise_error: bool = True) -> List[BaseNode]:
+        return [node for node in self.get_documents(node_ids, raise_error) if node is not None]
+
+    async def aget_nodes(self, node_ids: List[str], raise_error: bool = True) -> List[BaseNode]:
+        return [node for node in await self.aget_documents(node_ids, raise_error) if node is not None]
+
+    async def aiter_documents(self, batch_size: Optional[int] = None) -> AsyncIterator[Dict[str, BaseNode]]:
+        """用HSCAN分批遍历全部节点，每批产出一个 {doc_id: 节点} 字典"""
+        cursor = 0
+        while True:
+            cursor, values = await self._aredis.hscan(
+                self._node_collection, cursor, count=batch_size or self._batch_size
+            )
+            if values:
+                yield {key.decode(): self.codec.decode_node(value) for key, value in values.items()}
+            if cursor == 0:
+                break
+
+    async def aget_document_hashes(self, doc_ids: Sequence[str]) -> List[Optional[str]]:
+        """批量读取文档哈希，与doc_ids一一对应"""
+        if not doc_ids:
+            return []
+        values = await self._aredis.hmget(self._metadata_collection, list(doc_ids))
+        return [json.loads(value).get("doc_hash") if value is not None else None for value in values]
+
+    def document_exists(self, doc_id: str) -> bool:
+        return bool(self._redis.hexists(self._node_collection, doc_id))
+
+    async def adocument_exists(self, doc_id: str) -> bool:
+        return bool(await self._aredis.hexists(self._node_collection, doc_id))
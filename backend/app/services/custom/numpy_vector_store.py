@@ -0,0 +1,479 @@
+import asyncio
+import json
+import logging
+import operator
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Set
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+from app.services.atomic_files import fsync_file, recover_files, replace_files, staged_path
+from app.services.dir_lock import DirectoryLock
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = "vectors.f32"
+LOG_FILE = "nodes.jsonl"
+
+# 作废行超过总行数的这个比例时压缩文件
+COMPACT_RATIO = 0.5
+COMPACT_MIN_ROWS = 1024
+
+_COMPARATORS = {
+    FilterOperator.EQ: operator.eq,
+    FilterOperator.NE: operator.ne,
+    FilterOperator.GT: operator.gt,
+    FilterOperator.GTE: operator.ge,
+    FilterOperator.LT: operator.lt,
+    FilterOperator.LTE: operator.le,
+    FilterOperator.IN: lambda value, expected: value in expected,
+    FilterOperator.NIN: lambda value, expected: value not in expected,
+}
+
+
+class NumpyVectorStore(BasePydanticVectorStore):
+    """
+    进程内向量库，适合几千到几十万分块的小站点和离线测试
+
+    向量归一化后保存在连续的float32矩阵中，检索即一次矩阵-向量乘积加部分排序(argpartition)，
+    多个查询合并为一次矩阵乘积。指定persist_dir时矩阵以内存映射方式保存在磁盘上，
+    节点内容和增删操作追加写入日志，重启时回放日志恢复；删除只作废行，
+    作废行过多时整体压缩。未指定persist_dir时只保存在内存中。
+
+    行号等状态只在启动时从日志恢复，因此persist_dir同一时间只能由一个进程打开，
+    打开时对目录加独占锁，第二个进程打开会直接报错，关闭(close)后释放。
+
+    节点元数据与MilvusVectorStore保存的字段一致(node_to_metadata_dict)，
+    因此两种向量库支持相同的元数据过滤，如按doc_id批量删除。
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+
+    dim: int
+    persist_dir: Optional[str] = None
+
+    _lock: Any = PrivateAttr()
+    _matrix: Any = PrivateAttr(default=None)
+    _alive: Any = PrivateAttr(default=None)
+    _count: int = PrivateAttr(default=0)
+    _row_ids: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _rows: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _ref_rows: Dict[str, Set[int]] = PrivateAttr(default_factory=dict)
+    _metadata: List[Optional[Dict[str, Any]]] = PrivateAttr(default_factory=list)
+    _log: Any = PrivateAttr(default=None)
+    _dir_lock: Any = PrivateAttr(default=None)
+
+    def __init__(self, dim: int, persist_dir: Optional[str] = None, **kwargs: Any):
+        super().__init__(dim=dim, persist_dir=persist_dir, **kwargs)
+        self._lock = threading.RLock()
+        self._reset()
+        if persist_dir is not None:
+            os.makedirs(persist_dir, exist_ok=True)
+            self._dir_lock = DirectoryLock(persist_dir)
+            try:
+                self._load()
+            except Exception:
+                self._dir_lock.release()
+                raise
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "NumpyVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ---- 存储 ----
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_dir, name)
+
+    def _reset(self) -> None:
+        self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+        self._alive = np.zeros(0, dtype=bool)
+        self._count = 0
+        self._row_ids = []
+        self._rows = {}
+        self._ref_rows = {}
+        self._metadata = []
+
+    def _grow(self, rows: int) -> None:
+        """保证矩阵至少能容纳rows行，容量按倍数增长以摊薄扩容开销"""
+        capacity = self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, 1024)
+        if self.persist_dir is None:
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            matrix[:self._count] = self._matrix[:self._count]
+            self._matrix = matrix
+        else:
+            self._flush_matrix()
+            self._matrix = None
+            with open(self._path(VECTORS_FILE), "ab") as f:
+                f.truncate(capacity * self.dim * 4)
+            self._matrix = np.memmap(
+                self._path(VECTORS_FILE), dtype=np.float32, mode="r+", shape=(capacity, self.dim)
+            )
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:self._count] = self._alive[:self._count]
+        self._alive = alive
+
+    def _flush_matrix(self) -> None:
+        if isinstance(self._matrix, np.memmap):
+            self._matrix.flush()
+
+    def _append_log(self, entries: List[Dict[str, Any]]) -> None:
+        if self.persist_dir is None:
+            return
+        if self._log is None:
+            self._log = open(self._path(LOG_FILE), "a", encoding="utf-8")
+        self._log.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+        self._log.flush()
+
+    def _load(self) -> None:
+        """回放日志恢复节点，向量直接映射已有文件"""
+        recover_files(self.persist_dir, (VECTORS_FILE, LOG_FILE))
+        log_path = self._path(LOG_FILE)
+        if not os.path.exists(log_path):
+            return
+        entries = []
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entries.append(json.loads(line))
+        rows = max((entry["row"] for entry in entries if entry["op"] == "add"), default=-1) + 1
+        self._grow(rows)
+        self._count = rows
+        self._row_ids = [None] * rows
+        self._metadata = [None] * rows
+        for entry in entries:
+            if entry["op"] == "add":
+                self._register(entry["row"], entry["id"], entry["metadata"])
+            else:
+                self._invalidate(entry["rows"])
+
+    def _register(self, row: int, node_id: str, metadata: Dict[str, Any]) -> None:
+        previous = self._rows.get(node_id)
+        if previous is not None:
+            self._invalidate([previous])
+        self._row_ids[row] = node_id
+        self._metadata[row] = metadata
+        self._rows[node_id] = row
+        self._ref_rows.setdefault(metadata["ref_doc_id"], set()).add(row)
+        self._alive[row] = True
+
+    def _invalidate(self, rows: Sequence[int]) -> None:
+        for row in rows:
+            node_id = self._row_ids[row]
+            if node_id is None:
+                continue
+            ref_doc_id = self._metadata[row]["ref_doc_id"]
+            self._ref_rows[ref_doc_id].discard(row)
+            if not self._ref_rows[ref_doc_id]:
+                del self._ref_rows[ref_doc_id]
+            del self._rows[node_id]
+            self._row_ids[row] = None
+            self._metadata[row] = None
+            self._alive[row] = False
+
+    def _maybe_compact(self) -> None:
+        """
+        作废行过多时只保留有效行，重写矩阵文件和日志
+
+        新文件先完整写入并fsync，再一起替换旧文件，压缩中途失败或崩溃时旧文件保持不变。
+        """
+        dead = self._count - len(self._rows)
+        if dead < COMPACT_MIN_ROWS or dead < self._count * COMPACT_RATIO:
+            return
+        live = np.flatnonzero(self._alive[:self._count])
+        vectors = np.array(self._matrix[live])
+        entries = [
+            {"op": "add", "row": new_row, "id": self._row_ids[row], "metadata": self._metadata[row]}
+            for new_row, row in enumerate(live)
+        ]
+        if self.persist_dir is None:
+            self._reset()
+            self._write(vectors, entries)
+            return
+        try:
+            with open(staged_path(self.persist_dir, VECTORS_FILE), "wb") as f:
+                vectors.astype(np.float32).tofile(f)
+                fsync_file(f)
+            with open(staged_path(self.persist_dir, LOG_FILE), "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries))
+                fsync_file(f)
+        except OSError as e:
+            # 未提交的新文件直接丢弃，继续使用旧文件，下次删除时再尝试压缩
+            logger.warning(f"向量文件压缩失败，保留原文件: {e}")
+            recover_files(self.persist_dir, (VECTORS_FILE, LOG_FILE))
+            return
+        self._close_files()
+        replace_files(self.persist_dir, (VECTORS_FILE, LOG_FILE))
+        self._reset()
+        self._load()
+
+    def _write(self, vectors: np.ndarray, entries: List[Dict[str, Any]]) -> None:
+        start = self._count
+        self._grow(start + len(entries))
+        self._matrix[start:start + len(entries)] = vectors
+        self._flush_matrix()
+        self._count = start + len(entries)
+        self._row_ids.extend([None] * len(entries))
+        self._metadata.extend([None] * len(entries))
+        for entry in entries:
+            self._register(entry["row"], entry["id"], entry["metadata"])
+        self._append_log(entries)
+
+    def _close_files(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        self._flush_matrix()
+        self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_files()
+            if self._dir_lock is not None:
+                self._dir_lock.release()
+
+    # ---- 写入和删除 ----
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = self._normalize(
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        )
+        with self._lock:
+            entries = [
+                {
+                    "op": "add",
+                    "row": self._count + i,
+                    "id": node.node_id,
+                    "metadata": node_to_metadata_dict(node, remove_text=False, flat_metadata=False),
+                }
+                for i, node in enumerate(nodes)
+            ]
+            self._write(vectors, entries)
+            self._maybe_compact()
+        return [node.node_id for node in nodes]
+
+    def _delete_rows(self, rows: Sequence[int]) -> None:
+        rows = [row for row in rows if self._row_ids[row] is not None]
+        if not rows:
+            return
+        self._invalidate(rows)
+        self._append_log([{"op": "delete", "rows": rows}])
+        self._maybe_compact()
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            self._delete_rows(sorted(self._ref_rows.get(ref_doc_id, ())))
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        with self._lock:
+            mask = self._candidate_mask(node_ids=node_ids, filters=filters)
+            self._delete_rows(np.flatnonzero(mask).tolist())
+
+    def clear(self) -> None:
+        with self._lock:
+            if self.persist_dir is not None:
+                self._close_files()
+                for name in (VECTORS_FILE, LOG_FILE):
+                    if os.path.exists(self._path(name)):
+                        os.remove(self._path(name))
+            self._reset()
+
+    async def async_add(self, nodes: Sequence[BaseNode], **kwargs: Any) -> List[str]:
+        return await asyncio.to_thread(self.add, nodes, **kwargs)
+
+    async def adelete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        await asyncio.to_thread(self.delete, ref_doc_id, **delete_kwargs)
+
+    async def adelete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        await asyncio.to_thread(self.delete_nodes, node_ids, filters)
+
+    async def aclear(self) -> None:
+        await asyncio.to_thread(self.clear)
+
+    # ---- 过滤 ----
+
+    def _rows_for_refs(self, ref_doc_ids: Sequence[str]) -> List[int]:
+        return [row for ref_doc_id in ref_doc_ids for row in self._ref_rows.get(ref_doc_id, ())]
+
+    def _filter_mask(self, filters: MetadataFilters) -> np.ndarray:
+        masks = []
+        for item in filters.filters:
+            if isinstance(item, MetadataFilters):
+                masks.append(self._filter_mask(item))
+            else:
+                masks.append(self._single_filter_mask(item))
+        if not masks:
+            return self._alive[:self._count].copy()
+        if filters.condition == FilterCondition.OR:
+            return np.logical_or.reduce(masks)
+        if filters.condition == FilterCondition.NOT:
+            return self._alive[:self._count] & ~np.logical_or.reduce(masks)
+        return np.logical_and.reduce(masks)
+
+    def _single_filter_mask(self, item: MetadataFilter) -> np.ndarray:
+        mask = np.zeros(self._count, dtype=bool)
+        # 按文档过滤是最常见的情况(批量删除)，直接查倒排而不是逐行比较
+        if item.key in ("doc_id", "ref_doc_id") and item.operator in (FilterOperator.EQ, FilterOperator.IN):
+            values = item.value if item.operator == FilterOperator.IN else [item.value]
+            mask[self._rows_for_refs(values)] = True
+            return mask
+        compare = _COMPARATORS.get(item.operator)
+        if compare is None:
+            raise NotImplementedError(f"NumpyVectorStore不支持过滤运算符: {item.operator}")
+        for row, metadata in enumerate(self._metadata):
+            if metadata is not None and item.key in metadata:
+                mask[row] = compare(metadata[item.key], item.value)
+        return mask
+
+    def _candidate_mask(
+        self,
+        node_ids: Optional[List[str]] = None,
+        doc_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+    ) -> np.ndarray:
+        mask = self._alive[:self._count].copy()
+        if node_ids is not None:
+            selected = np.zeros(self._count, dtype=bool)
+            selected[[self._rows[node_id] for node_id in node_ids if node_id in self._rows]] = True
+            mask &= selected
+        if doc_ids is not None:
+            selected = np.zeros(self._count, dtype=bool)
+            selected[self._rows_for_refs(doc_ids)] = True
+            mask &= selected
+        if filters is not None:
+            mask &= self._filter_mask(filters)
+        return mask
+
+    # ---- 检索 ----
+
+    def _top_k(self, scores: np.ndarray, k: int) -> np.ndarray:
+        """每行取得分最高的k个下标，先argpartition再只对这k个排序"""
+        k = min(k, scores.shape[1])
+        if k <= 0:
+            return np.zeros((scores.shape[0], 0), dtype=np.int64)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(scores, top, axis=1).argsort(axis=1)[:, ::-1]
+        return np.take_along_axis(top, order, axis=1)
+
+    @staticmethod
+    def _mask_scores(scores: np.ndarray, mask: np.ndarray) -> None:
+        # 没有作废行和过滤条件时跳过，避免对整个得分矩阵做一次花式索引
+        if not mask.all():
+            scores[:, ~mask] = -np.inf
+
+    def _result(self, rows: np.ndarray, scores: np.ndarray) -> VectorStoreQueryResult:
+        valid = [(int(row), float(score)) for row, score in zip(rows, scores) if np.isfinite(score)]
+        nodes = [metadata_dict_to_node(self._metadata[row]) for row, _ in valid]
+        return VectorStoreQueryResult(
+            nodes=nodes,
+            similarities=[score for _, score in valid],
+            ids=[self._row_ids[row] for row, _ in valid],
+        )
+
+    def query_many(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        similarity_top_k: int,
+        filters: Optional[MetadataFilters] = None,
+    ) -> List[VectorStoreQueryResult]:
+        """多个查询向量合并为一次矩阵乘积，返回与输入顺序一致的结果"""
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32))
+        with self._lock:
+            if self._count == 0:
+                return [VectorStoreQueryResult(nodes=[], similarities=[], ids=[]) for _ in queries]
+            scores = queries @ self._matrix[:self._count].T
+            self._mask_scores(scores, self._candidate_mask(filters=filters))
+            top = self._top_k(scores, similarity_top_k)
+            return [
+                self._result(rows, np.take(row_scores, rows))
+                for rows, row_scores in zip(top, scores)
+            ]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.query_embedding is None:
+            raise ValueError("NumpyVectorStore只支持向量检索")
+        queries = self._normalize(np.asarray([query.query_embedding], dtype=np.float32))
+        with self._lock:
+            if self._count == 0:
+                return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+            scores = queries @ self._matrix[:self._count].T
+            mask = self._candidate_mask(node_ids=query.node_ids, doc_ids=query.doc_ids, filters=query.filters)
+            self._mask_scores(scores, mask)
+            rows = self._top_k(scores, query.similarity_top_k)[0]
+            return self._result(rows, scores[0][rows])
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+    async def aquery_many(
+        self,
+        query_embeddings: Sequence[Sequence[float]],
+        similarity_top_k: int,
+        filters: Optional[MetadataFilters] = None,
+    ) -> List[VectorStoreQueryResult]:
+        return await asyncio.to_thread(self.query_many, query_embeddings, similarity_top_k, filters)
+
+    def get_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ) -> List[BaseNode]:
+        with self._lock:
+            rows = np.flatnonzero(self._candidate_mask(node_ids=node_ids, filters=filters))
+            return [metadata_dict_to_node(self._metadata[row]) for row in rows.tolist()]
+
+    async def aget_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **kwargs: Any,
+    ) -> List[BaseNode]:
+        return await asyncio.to_thread(self.get_nodes, node_ids, filters)
+
+    def sample_embeddings(self, limit: int) -> List[List[float]]:
+        """取出若干已存储的向量，用于检索参数校准"""
+        with self._lock:
+            rows = np.flatnonzero(self._alive[:self._count])[:limit]
+            return np.asarray(self._matrix[rows]).tolist()
@@ -7,7 +7,8 @@ import requests
 import struct
 import tenacity
 import asyncio
-from typing import Any, Callable, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from requests.adapters import HTTPAdapter
 from llama_index.core.bridge.pydantic import Field, PrivateAttr
 from llama_index.core.callbacks.base import CallbackManager
 from llama_index.core.embeddings import BaseEmbedding
@@ -136,8 +137,28 @@ class SiliconFlowEmbedding(BaseEmbedding):
         description="The maximum number of API retries.",
         ge=0,
     )
+    timeout: float = Field(
+        default=60,
+        description="The timeout for a single API request, in seconds.",
+        gt=0,
+    )
+    max_concurrency: int = Field(
+        default=4,
+        description="The maximum number of in-flight embedding requests.",
+        ge=1,
+    )
+    dimensions: Optional[int] = Field(
+        default=None,
+        description="The dimensionality of the returned embeddings, used to namespace cached vectors.",
+    )
 
     _headers: Any = PrivateAttr()
+    _session: Any = PrivateAttr(default=None)
+    _aiohttp_session: Any = PrivateAttr(default=None)
+    _aiohttp_loop: Any = PrivateAttr(default=None)
+    _semaphore: Any = PrivateAttr(default=None)
+    _vector_cache: Any = PrivateAttr(default=None)
+    _query_cache: Any = PrivateAttr(default=None)
 
     def __init__(
         self,
@@ -146,6 +167,12 @@ class SiliconFlowEmbedding(BaseEmbedding):
         base_url: str = DEFAULT_SILICONFLOW_API_URL,
         encoding_format: Optional[str] = "float",
         max_retries: int = 3,
+        timeout: float = 60,
+        max_concurrency: int = 4,
+        embed_batch_size: int = 32,
+        dimensions: Optional[int] = None,
+        vector_cache: Optional[Any] = None,
+        query_cache: Optional[Any] = None,
         callback_manager: Optional[CallbackManager] = None,
         **kwargs: Any,
     ) -> None:
@@ -155,6 +182,10 @@ class SiliconFlowEmbedding(BaseEmbedding):
             base_url=base_url,
             encoding_format=encoding_format,
             max_retries=max_retries,
+            timeout=timeout,
+            max_concurrency=max_concurrency,
+            embed_batch_size=embed_batch_size,
+            dimensions=dimensions,
             callback_manager=callback_manager,
             **kwargs,
         )
@@ -169,11 +200,67 @@ class SiliconFlowEmbedding(BaseEmbedding):
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
         }
+        self._vector_cache = vector_cache
+        self._query_cache = query_cache
 
     @classmethod
     def class_name(cls) -> str:
         return "SiliconFlowEmbedding"
 
+    def _get_session(self) -> requests.Session:
+        """Get the pooled sync session, creating it on first use."""
+        if self._session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=self.max_concurrency,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers.update(self._headers)
+            self._session = session
+        return self._session
+
+    def _get_aiohttp_session(self) -> aiohttp.ClientSession:
+        """Get the pooled async session bound to the running event loop.
+
+        aiohttp sessions cannot be shared across event loops, so the session
+        (and the concurrency semaphore) is recreated when the loop changes.
+        """
+        loop = asyncio.get_running_loop()
+        if (
+            self._aiohttp_session is None
+            or self._aiohttp_session.closed
+            or self._aiohttp_loop is not loop
+        ):
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                keepalive_timeout=60,
+            )
+            self._aiohttp_session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self._headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._aiohttp_loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._aiohttp_session
+
+    def close(self) -> None:
+        """Close the pooled sync session."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    async def aclose(self) -> None:
+        """Close both pooled sessions."""
+        self.close()
+        if self._aiohttp_session is not None and not self._aiohttp_session.closed:
+            await self._aiohttp_session.close()
+        self._aiohttp_session = None
+        self._aiohttp_loop = None
+        self._semaphore = None
+
     def _data_formatting(self, response: list) -> List[List[float]]:
         results = sorted(response["data"], key=lambda e: e["index"])
         if self.encoding_format == "base64":
@@ -181,15 +268,114 @@ class SiliconFlowEmbedding(BaseEmbedding):
         else:
             return [data["embedding"] for data in results]
 
+    @property
+    def vector_cache(self) -> Optional[Any]:
+        """The content-addressed vector cache, if any."""
+        return self._vector_cache
+
+    def _dedupe(self, texts: List[str]) -> Tuple[List[str], Dict[str, str]]:
+        """Map each text to its cache key and collect the unique keys in order."""
+        if self._vector_cache is None:
+            keys = list(texts)
+        else:
+            keys = [
+                self._vector_cache.make_key(self.model, self.dimensions, text)
+                for text in texts
+            ]
+        unique = dict(zip(keys, texts))
+        return keys, unique
+
+    def get_text_embedding_batch(
+        self,
+        texts: List[str],
+        show_progress: bool = False,
+        **kwargs: Any,
+    ) -> List[List[float]]:
+        """Get embeddings, embedding each distinct uncached text only once."""
+        keys, unique = self._dedupe(texts)
+        found = self._vector_cache.get_many(list(unique)) if self._vector_cache else {}
+        missing = [key for key in unique if key not in found]
+        if missing:
+            vectors = super().get_text_embedding_batch(
+                [unique[key] for key in missing], show_progress=show_progress, **kwargs
+            )
+            computed = dict(zip(missing, vectors))
+            if self._vector_cache:
+                self._vector_cache.set_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    async def aget_text_embedding_batch(
+        self,
+        texts: List[str],
+        show_progress: bool = False,
+        **kwargs: Any,
+    ) -> List[List[float]]:
+        """Asynchronously get embeddings, embedding each distinct uncached text only once."""
+        keys, unique = self._dedupe(texts)
+        found = (
+            await self._vector_cache.aget_many(list(unique)) if self._vector_cache else {}
+        )
+        missing = [key for key in unique if key not in found]
+        if missing:
+            vectors = await super().aget_text_embedding_batch(
+                [unique[key] for key in missing], show_progress=show_progress, **kwargs
+            )
+            computed = dict(zip(missing, vectors))
+            if self._vector_cache:
+                await self._vector_cache.aset_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    @property
+    def _query_cache_model(self) -> str:
+        return f"{self.model}:{self.dimensions or 0}"
+
     def _get_query_embedding(self, query: str) -> List[float]:
-        """Get query embedding."""
-        return self._get_text_embeddings([query])[0]
+        """Get query embedding, served from the query vector cache when possible."""
+        if self._query_cache is not None:
+            cached = self._query_cache.get_dense(self._query_cache_model, query)
+            if cached is not None:
+                return cached
+        embedding = self._get_text_embeddings([query])[0]
+        if self._query_cache is not None:
+            self._query_cache.set_dense(self._query_cache_model, query, embedding)
+        return embedding
 
     async def _aget_query_embedding(self, query: str) -> List[float]:
         """The asynchronous version of _get_query_embedding."""
+        if self._query_cache is not None:
+            cached = self._query_cache.get_dense(self._query_cache_model, query)
+            if cached is not None:
+                return cached
         result = await self._aget_text_embeddings([query])
+        if self._query_cache is not None:
+            self._query_cache.set_dense(self._query_cache_model, query, result[0])
         return result[0]
 
+    async def aget_query_embedding_batch(self, queries: List[str]) -> List[List[float]]:
+        """Embed many queries, sending all uncached ones in as few requests as possible."""
+        found: Dict[str, List[float]] = {}
+        if self._query_cache is not None:
+            for query in dict.fromkeys(queries):
+                cached = self._query_cache.get_dense(self._query_cache_model, query)
+                if cached is not None:
+                    found[query] = cached
+        missing = [query for query in dict.fromkeys(queries) if query not in found]
+        if missing:
+            batches = [
+                missing[start:start + self.embed_batch_size]
+                for start in range(0, len(missing), self.embed_batch_size)
+            ]
+            results = await asyncio.gather(
+                *(self._aget_text_embeddings(batch) for batch in batches)
+            )
+            for query, embedding in zip(missing, (e for batch in results for e in batch)):
+                found[query] = embedding
+                if self._query_cache is not None:
+                    self._query_cache.set_dense(self._query_cache_model, query, embedding)
+        return [found[query] for query in queries]
+
     def _get_text_embedding(self, text: str) -> List[float]:
         """Get text embedding."""
         return self._get_text_embeddings([text])[0]
@@ -201,34 +387,33 @@ class SiliconFlowEmbedding(BaseEmbedding):
 
     @embedding_retry_decorator
     def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
-        with requests.Session() as session:
-            input_json = {
-                "model": self.model,
-                "input": texts,
-                "encoding_format": self.encoding_format,
-            }
-            response = session.post(
-                self.base_url, json=input_json, headers=self._headers
-            ).json()
-            if "data" not in response:
-                raise RuntimeError(response)
-            return self._data_formatting(response)
+        input_json = {
+            "model": self.model,
+            "input": texts,
+            "encoding_format": self.encoding_format,
+        }
+        response = self._get_session().post(
+            self.base_url, json=input_json, timeout=self.timeout
+        ).json()
+        if "data" not in response:
+            raise RuntimeError(response)
+        return self._data_formatting(response)
 
     @embedding_retry_decorator
     async def _aget_text_embeddings(
         self,
         texts: List[str],
     ) -> List[List[float]]:
-        async with aiohttp.ClientSession() as session:
-            input_json = {
-                "input": texts,
-                "model": self.model,
-                "encoding_format": self.encoding_format,
-            }
-
-            async with session.post(
-                self.base_url, json=input_json, headers=self._headers
-            ) as response:
+        session = self._get_aiohttp_session()
+        input_json = {
+            "input": texts,
+            "model": self.model,
+            "encoding_format": self.encoding_format,
+        }
+
+        # aget_text_embedding_batch gathers every batch at once, so cap in-flight requests here.
+        async with self._semaphore:
+            async with session.post(self.base_url, json=input_json) as response:
                 response_json = await response.json()
                 response.raise_for_status()
                 return self._data_formatting(response_json)
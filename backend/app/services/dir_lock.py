@@ -0,0 +1,32 @@
+import fcntl
+import os
+from typing import IO
+
+LOCK_FILE = ".lock"
+
+
+class DirectoryLock:
+    """
+    持久化目录的独占锁，保证进程内向量库和稀疏索引只有一个写入进程
+
+    两者在进程启动时回放日志、之后只在内存中维护行号，
+    另一个进程写入同一目录时既看不到对方新增的行，也会复用相同的行号互相覆盖。
+    加锁失败时立即抛出异常，不等待。锁随文件描述符释放，进程退出后自动失效。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._file: IO[bytes] = open(os.path.join(directory, LOCK_FILE), "ab")
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            raise RuntimeError(
+                f"{directory} 已被其他进程打开，同一目录只能由一个进程读写，"
+                f"使用numpy向量库或本地稀疏索引的站点不能再由单独的摄入worker处理"
+            )
+
+    def release(self) -> None:
+        if not self._file.closed:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
@@ -0,0 +1,129 @@
+import json
+from typing import Any, Dict, List, Optional, Sequence
+
+import redis.asyncio as aioredis
+from redis.exceptions import WatchError
+
+# 列表接口返回的正文预览长度
+PREVIEW_LENGTH = 200
+
+
+class SiteDocumentIndex:
+    """
+    站点文档二级索引
+
+    摄入、更新、删除时增量维护，列表和统计接口只读这里，不再扫描文档存储:
+    - {namespace}:index:entries  哈希，doc_id -> 文档摘要(文件名、分块数、词数、预览)
+    - {namespace}:index:order    有序集合，按数据库文档ID排序，用于游标分页
+    - {namespace}:index:stats    哈希，文档数、分块数、词数的累计值
+    """
+
+    def __init__(self, client: aioredis.Redis, namespace: str):
+        self.client = client
+        self.entries_key = f"{namespace}:index:entries"
+        self.order_key = f"{namespace}:index:order"
+        self.stats_key = f"{namespace}:index:stats"
+
+    @staticmethod
+    def make_entry(document_id: int, filename: str, text: str, chunks: int) -> Dict[str, Any]:
+        """生成文档摘要，词数在摄入时计算一次"""
+        return {
+            "document_id": document_id,
+            "filename": filename,
+            "chunks": chunks,
+            "tokens": len(text.split()),
+            "text_preview": text[:PREVIEW_LENGTH] + "..." if len(text) > PREVIEW_LENGTH else text,
+        }
+
+    @staticmethod
+    def _totals(raw_entries: Sequence[Optional[bytes]]) -> Dict[str, int]:
+        entries = [json.loads(raw) for raw in raw_entries if raw is not None]
+        return {
+            "documents": len(entries),
+            "chunks": sum(entry["chunks"] for entry in entries),
+            "tokens": sum(entry["tokens"] for entry in entries),
+        }
+
+    async def _apply(self, doc_ids: List[str], entries: Optional[Dict[str, Dict[str, Any]]]) -> None:
+        """
+        写入或删除一批摘要，并按新旧摘要的差值更新累计值
+
+        WATCH摘要哈希保证读旧值和写新值之间没有其他worker修改，冲突时重试。
+        """
+        async with self.client.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(self.entries_key)
+                    previous = self._totals(await pipe.hmget(self.entries_key, doc_ids))
+                    current = self._totals(
+                        [json.dumps(entry) for entry in entries.values()] if entries else []
+                    )
+                    pipe.multi()
+                    if entries:
+                        pipe.hset(self.entries_key, mapping={
+                            doc_id: json.dumps(entry) for doc_id, entry in entries.items()
+                        })
+                        pipe.zadd(self.order_key, {
+                            doc_id: entry["document_id"] for doc_id, entry in entries.items()
+                        })
+                    else:
+                        pipe.hdel(self.entries_key, *doc_ids)
+                        pipe.zrem(self.order_key, *doc_ids)
+                    for field, value in current.items():
+                        pipe.hincrby(self.stats_key, field, value - previous[field])
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    async def aupsert(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """写入或覆盖文档摘要"""
+        if entries:
+            await self._apply(list(entries), entries)
+
+    async def aremove(self, doc_ids: Sequence[str]) -> None:
+        """删除文档摘要"""
+        if doc_ids:
+            await self._apply(list(doc_ids), None)
+
+    async def aclear(self) -> None:
+        await self.client.unlink(self.entries_key, self.order_key, self.stats_key)
+
+    async def alist(self, cursor: Optional[int] = None, limit: int = 100) -> Dict[str, Any]:
+        """
+        按文档ID升序分页列出文档
+
+        Args:
+            cursor: 上一页返回的next_cursor，为空时从头开始
+            limit: 每页数量
+
+        Returns:
+            Dict[str, Any]: 文档摘要列表，以及下一页游标(没有更多时为None)
+        """
+        min_score = f"({cursor}" if cursor is not None else "-inf"
+        members = await self.client.zrangebyscore(
+            self.order_key, min_score, "+inf", start=0, num=limit + 1, withscores=True
+        )
+        has_more = len(members) > limit
+        members = members[:limit]
+        doc_ids = [doc_id for doc_id, _ in members]
+        raw_entries = await self.client.hmget(self.entries_key, doc_ids) if doc_ids else []
+
+        documents = []
+        for doc_id, raw in zip(doc_ids, raw_entries):
+            if raw is None:
+                continue
+            doc_id = doc_id.decode() if isinstance(doc_id, bytes) else doc_id
+            documents.append({"id": doc_id, **json.loads(raw)})
+
+        next_cursor = int(members[-1][1]) if has_more else None
+        return {"documents": documents, "next_cursor": next_cursor}
+
+    async def astats(self) -> Dict[str, int]:
+        """读取累计值，耗时与文档数无关"""
+        stats = await self.client.hgetall(self.stats_key)
+        totals = {
+            (key.decode() if isinstance(key, bytes) else key): int(value)
+            for key, value in stats.items()
+        }
+        return {field: totals.get(field, 0) for field in ("documents", "chunks", "tokens")}
@@ -1,88 +1,394 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
 import os
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
-from markitdown import MarkItDown
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from markitdown import MarkItDown, StreamInfo
 
+from app.core.config import settings
 from app.models.document import Document
 from app.schemas.document import DocumentCreate
-from app.services.index_service import IndexService
+from app.services.document_index import PREVIEW_LENGTH
+from app.services.index_service import IndexService, IndexServiceFactory
+from app.services.metadata_policy import ALIASES_KEY
+
+# 上传内容与已有文档重复时的处理策略
+DEDUP_SKIP = "skip"        # 直接返回已有文档
+DEDUP_ALIAS = "alias"      # 返回已有文档，并把新文件名记录到其元数据的aliases中
+DEDUP_REPLACE = "replace"  # 删除已有文档及其索引，按新文件名重新创建
+DEDUP_POLICIES = (DEDUP_SKIP, DEDUP_ALIAS, DEDUP_REPLACE)
+
+
+class DuplicateDocumentError(ValueError):
+    """更新后的内容与同一站点内的另一篇文档重复"""
+
+    def __init__(self, document_id: int):
+        super().__init__(f"内容与文档 {document_id} 重复")
+        self.document_id = document_id
+
+
+def content_hash(data: bytes) -> str:
+    """上传文件原始内容的SHA-256，同一站点内内容相同的文件只保存一份"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def encode_cursor(created_at: datetime, document_id: int) -> str:
+    """把一页最后一条记录的 (created_at, id) 编码为不透明的游标"""
+    raw = json.dumps([created_at.isoformat(), document_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """解析游标，格式不正确时抛出ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, document_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(document_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"无效的游标: {cursor}") from e
 
 
 class DocumentService:
-    def __init__(self, db: Session):
+    """
+    文档服务，数据库操作全部通过AsyncSession异步执行
+
+    等待Postgres期间事件循环可以继续处理其他请求，慢查询不会拖住同一进程内的检索。
+    """
+
+    def __init__(self, db: AsyncSession, index_service: Optional[IndexService] = None):
         self.db = db
-        self.index_service = IndexService(db)
+        # 索引服务按站点共享，数据库会话只属于当前请求
+        self.index_service = index_service or IndexServiceFactory.get_instance()
         # 初始化MarkItDown实例
         self.markitdown = MarkItDown()
 
-    async def create_document(self, document: DocumentCreate) -> Document:
-        """创建文档记录并将其添加到索引中"""
-        db_document = Document(
+    def _new_document(self, document: DocumentCreate, hash_value: Optional[str]) -> Document:
+        return Document(
             filename=document.filename,
             content=document.content,
-            _metadata=document._metadata or {}
+            _metadata=document.metadata or {},
+            site_id=self.index_service.site_id,
+            content_hash=hash_value,
         )
+
+    async def create_document(
+        self, document: DocumentCreate, index: bool = True, hash_value: Optional[str] = None
+    ) -> Document:
+        """创建文档记录，index为False时由摄入worker异步建立索引"""
+        db_document = self._new_document(document, hash_value)
         self.db.add(db_document)
-        self.db.commit()
-        self.db.refresh(db_document)
+        await self.db.commit()
+        await self.db.refresh(db_document)
         
         # 将文档添加到索引中
-        await self.index_service.add_document(db_document)
+        if index:
+            await self.index_service.add_document(db_document)
         
         return db_document
 
-    def get_document(self, document_id: int) -> Optional[Document]:
+    async def add_document_row(self, document: DocumentCreate, hash_value: Optional[str] = None) -> Document:
+        """
+        在当前事务中写入一条文档记录，不提交
+
+        写入后立即释放正文，批量上传时内存占用只与单个文件大小有关。
+        """
+        db_document = self._new_document(document, hash_value)
+        self.db.add(db_document)
+        await self.db.flush()
+        self.db.expire(db_document, ["content", "_metadata"])
+        return db_document
+
+    async def get_document(self, document_id: int) -> Optional[Document]:
         """通过ID获取文档"""
-        return self.db.query(Document).filter(Document.id == document_id).first()
+        return await self.db.get(Document, document_id)
+
+    async def find_duplicate(
+        self, hash_value: str, exclude_id: Optional[int] = None, with_content: bool = True
+    ) -> Optional[Document]:
+        """查找当前站点内内容哈希相同的文档，走 (site_id, content_hash) 唯一索引"""
+        query = select(Document).where(
+            Document.site_id == self.index_service.site_id,
+            Document.content_hash == hash_value,
+        )
+        if exclude_id is not None:
+            query = query.where(Document.id != exclude_id)
+        if not with_content:
+            query = query.options(defer(Document.content))
+        return (await self.db.execute(query)).scalars().first()
+
+    def _add_alias(self, document: Document, filename: str) -> bool:
+        """把文件名记录到已有文档的aliases中，文件名已存在时返回False"""
+        metadata = dict(document._metadata or {})
+        aliases = list(metadata.get(ALIASES_KEY, []))
+        if filename == document.filename or filename in aliases:
+            return False
+        # 赋值新的字典，SQLAlchemy才能检测到JSONB列的变化
+        metadata[ALIASES_KEY] = aliases + [filename]
+        document._metadata = metadata
+        return True
 
-    def get_documents(self, skip: int = 0, limit: int = 100) -> List[Document]:
+    async def get_documents(self, skip: int = 0, limit: int = 100) -> List[Document]:
         """获取所有文档"""
-        return self.db.query(Document).offset(skip).limit(limit).all()
+        result = await self.db.execute(select(Document).offset(skip).limit(limit))
+        return list(result.scalars())
+
+    async def list_document_summaries(self, cursor: Optional[str] = None, limit: int = 100) -> Dict[str, Any]:
+        """
+        按 (created_at, id) 升序分页列出文档摘要
+
+        正文和元数据不出数据库：大小和预览在Postgres中计算，每行只返回固定长度的预览。
+        游标分页直接从 (created_at, id) 索引上的位置开始扫描，翻到深页不会变慢。
 
-    def delete_document(self, document_id: int) -> bool:
+        Args:
+            cursor: 上一页返回的next_cursor，为空时从第一页开始
+            limit: 每页数量
+
+        Returns:
+            Dict[str, Any]: 文档摘要列表，以及下一页游标(没有更多时为None)
+        """
+        query = select(
+            Document.id,
+            Document.filename,
+            Document.created_at,
+            Document.updated_at,
+            func.octet_length(Document.content).label("size"),
+            func.substr(Document.content, 1, PREVIEW_LENGTH).label("preview"),
+        ).order_by(Document.created_at, Document.id).limit(limit + 1)
+        if cursor is not None:
+            query = query.where(tuple_(Document.created_at, Document.id) > decode_cursor(cursor))
+
+        rows = (await self.db.execute(query)).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        documents = [
+            {
+                "id": row.id,
+                "filename": row.filename,
+                "size": row.size or 0,
+                "preview": row.preview or "",
+                "truncated": (row.size or 0) > len((row.preview or "").encode("utf-8")),
+                "created_at": row.created_at,
+                "updated_at": row.updated_at,
+            }
+            for row in rows
+        ]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
+        return {"documents": documents, "next_cursor": next_cursor}
+
+    async def delete_document(self, document_id: int) -> bool:
         """删除文档及其索引"""
-        document = self.get_document(document_id)
+        document = await self.get_document(document_id)
         if not document:
             return False
         
         # 从索引中删除文档
-        self.index_service.delete_document(document_id)
+        await self.index_service.delete_document(document_id)
         
         # 从数据库中删除文档
-        self.db.delete(document)
-        self.db.commit()
+        await self.db.delete(document)
+        await self.db.commit()
         return True
 
-    async def process_markdown_file(self, file_path: str, filename: str) -> Document:
-        """处理Markdown文件并创建文档"""
-        # 使用Markitdown解析Markdown文件
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 使用MarkItDown转换文件
-        result = self.markitdown.convert(file_path)
-        parsed_content = result.text_content
-        
-        # 创建文档
-        document = DocumentCreate(
-            filename=filename,
-            content=content,
-            metadata={"parsed_content": parsed_content}
-        )
-        
-        return await self.create_document(document)
+    async def update_document(
+        self, document_id: int, filename: str, data: bytes
+    ) -> Optional[Tuple[Document, Dict[str, Any]]]:
+        """
+        用新文件内容更新文档，并增量更新其索引
 
-    async def process_text_file(self, file_path: str, filename: str) -> Document:
-        """处理文本文件并创建文档"""
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        # 创建文档
-        document = DocumentCreate(
-            filename=filename,
-            content=content,
-            metadata={}
+        先更新索引再提交：索引更新失败时回滚，数据库保留旧内容，与仍然完整的旧分块一致，
+        调用方可以直接重试。
+        """
+        document = await self.get_document(document_id)
+        if not document:
+            return None
+
+        hash_value = content_hash(data)
+        duplicate = await self.find_duplicate(hash_value, exclude_id=document_id)
+        if duplicate is not None:
+            raise DuplicateDocumentError(duplicate.id)
+
+        content, metadata = await asyncio.to_thread(self.parse_content, filename, data)
+
+        document.filename = filename
+        document.content = content
+        document._metadata = metadata
+        document.content_hash = hash_value
+
+        # 只重新向量化发生变化的分块
+        chunk_stats = await self.index_service.update_document(document)
+        if not chunk_stats["success"]:
+            await self.db.rollback()
+            return document, chunk_stats
+        await self.db.commit()
+        await self.db.refresh(document)
+        return document, chunk_stats
+
+    def parse_content(self, filename: str, data: bytes) -> Tuple[str, Dict[str, Any]]:
+        """解析内存中的文件内容，返回原文和元数据"""
+        content = data.decode("utf-8")
+        if not filename.endswith(".md"):
+            return content, {}
+
+        # 使用MarkItDown转换内存中的内容，无需落盘再读一遍
+        result = self.markitdown.convert_stream(
+            io.BytesIO(data),
+            stream_info=StreamInfo(extension=".md", filename=filename, charset="utf-8"),
         )
-        
-        return await self.create_document(document)
+        # Markdown转换结果通常与原文相同，相同时不再保存第二份
+        if result.text_content == content:
+            return content, {}
+        return content, {"parsed_content": result.text_content}
+
+    async def process_upload(self, filename: str, data: bytes, index: bool = True) -> Document:
+        """处理上传的文件内容并创建文档，内容重复时按默认策略处理"""
+        document, _ = await self.upload(filename, data, index=index)
+        return document
+
+    async def upload(
+        self, filename: str, data: bytes, index: bool = True, dedup_policy: Optional[str] = None
+    ) -> Tuple[Document, Optional[str]]:
+        """
+        处理上传的文件内容，先按内容哈希去重，再解析和创建文档
+
+        去重在解析和向量化之前完成，重复上传的文件不产生任何转换和向量化开销。
+
+        Args:
+            filename: 文件名
+            data: 文件原始内容
+            index: 为False时由摄入worker异步建立索引
+            dedup_policy: 内容重复时的处理策略，为空时使用UPLOAD_DEDUP_POLICY
+
+        Returns:
+            Tuple[Document, Optional[str]]: 文档，以及对重复内容执行的策略(内容不重复时为None)。
+            skip和alias返回已有文档，不需要再建立索引；replace返回新创建的文档
+        """
+        policy = dedup_policy or settings.UPLOAD_DEDUP_POLICY
+        hash_value = content_hash(data)
+        existing = await self.find_duplicate(hash_value)
+        if existing is not None and policy != DEDUP_REPLACE:
+            return await self._apply_dedup(existing, filename, policy), policy
+
+        replaced_id = None
+        if existing is not None:
+            replaced_id = existing.id
+            await self.db.delete(existing)
+            await self.db.flush()
 
+        content, metadata = await asyncio.to_thread(self.parse_content, filename, data)
+        document = DocumentCreate(filename=filename, content=content, metadata=metadata)
+        try:
+            document = await self.create_document(document, index=index, hash_value=hash_value)
+        except IntegrityError:
+            # 并发上传了相同内容，另一个请求先提交，按策略处理它创建的文档
+            await self.db.rollback()
+            existing = await self.find_duplicate(hash_value)
+            if existing is None:
+                raise
+            return await self._apply_dedup(existing, filename, policy), policy
+
+        if replaced_id is not None:
+            await self.index_service.delete_document(replaced_id)
+            return document, DEDUP_REPLACE
+        return document, None
+
+    async def _apply_dedup(self, existing: Document, filename: str, policy: str) -> Document:
+        if policy == DEDUP_ALIAS and self._add_alias(existing, filename):
+            await self.db.commit()
+            await self.db.refresh(existing)
+        return existing
+
+    def _next_upload(self, uploads) -> Optional[Tuple[str, bytes, str]]:
+        """读取下一个文件并计算内容哈希，全部读完时返回None"""
+        upload = next(uploads, None)
+        if upload is None:
+            return None
+        filename, data = upload
+        return filename, data, content_hash(data)
+
+    async def create_documents(
+        self, uploads: Iterable[Tuple[str, bytes]], dedup_policy: Optional[str] = None
+    ) -> Tuple[List[Document], List[Dict[str, Any]]]:
+        """
+        批量创建文档记录，所有文件在同一个事务中提交
+
+        uploads可以是逐个产出 (文件名, 内容) 的生成器，每个文件解析写入后
+        即可释放，不需要同时持有全部文件内容。读取和解析是同步操作，逐个放到线程池中执行。
+        索引由摄入worker异步建立。
+
+        每个文件解析前先按内容哈希去重：与已有文档或本批中更早的文件内容相同时，
+        按dedup_policy处理，不再解析和向量化。
+
+        Returns:
+            Tuple[List[Document], List[Dict[str, Any]]]: 新创建的文档，
+            以及重复的文件(filename、document_id和执行的策略)
+        """
+        policy = dedup_policy or settings.UPLOAD_DEDUP_POLICY
+        documents = []
+        duplicates = []
+        # 本批中已写入的内容哈希，同一批内的重复文件不会触发唯一索引冲突
+        pending: Dict[str, Document] = {}
+        replaced_ids = []
+        uploads = iter(uploads)
+        try:
+            while (upload := await asyncio.to_thread(self._next_upload, uploads)) is not None:
+                filename, data, hash_value = upload
+                if hash_value in pending:
+                    duplicate = pending[hash_value]
+                    if policy == DEDUP_REPLACE:
+                        # 还未建立索引，直接改用新文件名
+                        duplicate.filename = filename
+                    elif policy == DEDUP_ALIAS:
+                        await self.db.refresh(duplicate, ["_metadata"])
+                        if self._add_alias(duplicate, filename):
+                            await self.db.flush()
+                        self.db.expire(duplicate, ["_metadata"])
+                    duplicates.append({"filename": filename, "document_id": duplicate.id, "action": policy})
+                    continue
+
+                # 批量重新导入时大部分文件没有变化，不读取已有文档的正文
+                existing = await self.find_duplicate(hash_value, with_content=False)
+                if existing is not None:
+                    duplicates.append({"filename": filename, "document_id": existing.id, "action": policy})
+                    if policy != DEDUP_REPLACE:
+                        if policy == DEDUP_ALIAS:
+                            self._add_alias(existing, filename)
+                        continue
+                    replaced_ids.append(existing.id)
+                    # 先删除旧记录再写入新记录，避免同一次flush中插入先于删除触发唯一索引冲突
+                    await self.db.delete(existing)
+                    await self.db.flush()
+
+                content, metadata = await asyncio.to_thread(self.parse_content, filename, data)
+                document = await self.add_document_row(
+                    DocumentCreate(filename=filename, content=content, metadata=metadata),
+                    hash_value=hash_value,
+                )
+                pending[hash_value] = document
+                documents.append(document)
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+
+        if replaced_ids:
+            await self.index_service.delete_documents(replaced_ids)
+        return documents, duplicates
+
+    def _read_file(self, file_path: str) -> bytes:
+        with open(file_path, 'rb') as f:
+            return f.read()
+
+    async def process_markdown_file(self, file_path: str, filename: str, index: bool = True) -> Document:
+        """处理Markdown文件并创建文档"""
+        return await self.process_upload(filename, await asyncio.to_thread(self._read_file, file_path), index=index)
+
+    async def process_text_file(self, file_path: str, filename: str, index: bool = True) -> Document:
+        """处理文本文件并创建文档"""
+        return await self.process_upload(filename, await asyncio.to_thread(self._read_file, file_path), index=index)
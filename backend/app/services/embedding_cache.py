@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import redis
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+
+
+class EmbeddingCache(ABC):
+    """
+    内容寻址的向量缓存基类
+
+    缓存键由 (模型, 维度, 文本哈希) 组成，向量以 float32 字节串存储。
+    子类只需实现按键批量读写的原语，命中/未命中计数在这里统一维护。
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def close(self) -> None:
+        pass
+
+    async def aclose(self) -> None:
+        self.close()
+
+    @staticmethod
+    def make_key(model: str, dimensions: Optional[int], text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{dimensions or 0}:{digest}"
+
+    @staticmethod
+    def encode(vector: Sequence[float]) -> bytes:
+        return np.asarray(vector, dtype=np.float32).tobytes()
+
+    @staticmethod
+    def decode(raw: bytes) -> List[float]:
+        return np.frombuffer(raw, dtype=np.float32).tolist()
+
+    def _record(self, found: Dict[str, bytes], keys: Sequence[str]) -> Dict[str, List[float]]:
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return {key: self.decode(raw) for key, raw in found.items()}
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """批量读取，返回命中的键到向量的映射"""
+        if not keys:
+            return {}
+        return self._record(self._get_raw(keys), keys)
+
+    def set_many(self, items: Dict[str, Sequence[float]]) -> None:
+        """批量写入，并按LRU淘汰超出容量的条目"""
+        if items:
+            self._set_raw({key: self.encode(vec) for key, vec in items.items()})
+
+    async def aget_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        if not keys:
+            return {}
+        return self._record(await self._aget_raw(keys), keys)
+
+    async def aset_many(self, items: Dict[str, Sequence[float]]) -> None:
+        if items:
+            await self._aset_raw({key: self.encode(vec) for key, vec in items.items()})
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "max_entries": self.max_entries,
+        }
+
+    @abstractmethod
+    def _get_raw(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        """按键批量读取向量字节串，只返回命中的键"""
+
+    @abstractmethod
+    def _set_raw(self, items: Dict[str, bytes]) -> None:
+        """批量写入向量字节串"""
+
+    async def _aget_raw(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        return await asyncio.to_thread(self._get_raw, keys)
+
+    async def _aset_raw(self, items: Dict[str, bytes]) -> None:
+        await asyncio.to_thread(self._set_raw, items)
+
+
+class LocalEmbeddingCache(EmbeddingCache):
+    """基于本地SQLite文件的向量缓存，按最近访问时间淘汰"""
+
+    def __init__(self, path: str, max_entries: int = 100_000):
+        super().__init__(max_entries=max_entries)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+
+    def _get_raw(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        now = time.time()
+        with self._lock:
+            # SQLite 对单条语句的参数数量有限制，分批查询
+            for start in range(0, len(keys), 500):
+                batch = list(keys[start:start + 500])
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return found
+
+    def _set_raw(self, items: Dict[str, bytes]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                [(key, raw, now) for key, raw in items.items()],
+            )
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    "SELECT key FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (overflow,),
+                )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisEmbeddingCache(EmbeddingCache):
+    """
+    基于Redis的向量缓存，可在多个worker之间共享
+
+    向量存放在一个哈希表中，另用有序集合记录访问时间以实现LRU淘汰。
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        password: str = "",
+        db: int = 0,
+        namespace: str = "simplerag:embcache",
+        max_entries: int = 100_000,
+    ):
+        super().__init__(max_entries=max_entries)
+        self.vectors_key = f"{namespace}:vectors"
+        self.lru_key = f"{namespace}:lru"
+        connection_kwargs = dict(host=host, port=port, password=password or None, db=db)
+        self._client = redis.Redis(**connection_kwargs)
+        self._aclient = aioredis.Redis(**connection_kwargs)
+
+    def _get_raw(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        values = self._client.hmget(self.vectors_key, keys)
+        found = {key: raw for key, raw in zip(keys, values) if raw is not None}
+        if found:
+            now = time.time()
+            self._client.zadd(self.lru_key, {key: now for key in found})
+        return found
+
+    def _set_raw(self, items: Dict[str, bytes]) -> None:
+        now = time.time()
+        pipe = self._client.pipeline(transaction=False)
+        pipe.hset(self.vectors_key, mapping=items)
+        pipe.zadd(self.lru_key, {key: now for key in items})
+        pipe.zcard(self.lru_key)
+        count = pipe.execute()[-1]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            evicted = self._client.zpopmin(self.lru_key, overflow)
+            if evicted:
+                self._client.hdel(self.vectors_key, *[key for key, _ in evicted])
+
+    async def _aget_raw(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        values = await self._aclient.hmget(self.vectors_key, keys)
+        found = {key: raw for key, raw in zip(keys, values) if raw is not None}
+        if found:
+            now = time.time()
+            await self._aclient.zadd(self.lru_key, {key: now for key in found})
+        return found
+
+    async def _aset_raw(self, items: Dict[str, bytes]) -> None:
+        now = time.time()
+        pipe = self._aclient.pipeline(transaction=False)
+        pipe.hset(self.vectors_key, mapping=items)
+        pipe.zadd(self.lru_key, {key: now for key in items})
+        pipe.zcard(self.lru_key)
+        count = (await pipe.execute())[-1]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            evicted = await self._aclient.zpopmin(self.lru_key, overflow)
+            if evicted:
+                await self._aclient.hdel(self.vectors_key, *[key for key, _ in evicted])
+
+    def close(self) -> None:
+        self._client.close()
+
+    async def aclose(self) -> None:
+        self.close()
+        await self._aclient.aclose()
+
+
+def create_embedding_cache() -> Optional[EmbeddingCache]:
+    """根据配置创建向量缓存，未启用时返回None"""
+    backend = settings.EMBEDDING_CACHE_BACKEND.lower()
+    if backend == "redis":
+        return RedisEmbeddingCache(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            password=settings.REDIS_PASSWORD,
+            db=settings.REDIS_DB,
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+        )
+    if backend == "local":
+        return LocalEmbeddingCache(
+            path=settings.EMBEDDING_CACHE_PATH,
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES,
+        )
+    return None
@@ -0,0 +1,305 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.schema import BaseNode, NodeWithScore
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQuery
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from llama_index.vector_stores.milvus import MilvusVectorStore
+
+from app.services.sparse_index import SparseInvertedIndex
+
+FUSION_RRF = "rrf"
+FUSION_WEIGHTED = "weighted"
+
+# 融合参数默认值，可通过search_kwargs按请求覆盖
+DEFAULT_FUSION_PARAMS: Dict[str, Any] = {
+    "fusion": FUSION_RRF,
+    "weights": [1.0, 1.0],
+    "rrf_k": 60,
+    "candidate_k": None,
+}
+
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[Sequence[NodeWithScore]],
+    weights: Sequence[float],
+    k: int = 60,
+) -> List[NodeWithScore]:
+    """
+    倒数排名融合
+
+    每路结果按 weight / (k + rank) 累加，再除以各路都排第一时的最大可能得分，使融合分数落在 [0, 1]。
+    融合分数只反映排名：权重相同时只被一路检索到的结果最高约为0.5，不能与相似度阈值比较。
+    """
+    scores: Dict[str, float] = {}
+    nodes: Dict[str, NodeWithScore] = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, result in enumerate(results, start=1):
+            node_id = result.node.node_id
+            scores[node_id] = scores.get(node_id, 0.0) + weight / (k + rank)
+            nodes.setdefault(node_id, result)
+    max_score = sum(weights) / (k + 1) or 1.0
+    return [
+        NodeWithScore(node=nodes[node_id].node, score=score / max_score)
+        for node_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+
+def weighted_score_fusion(
+    result_lists: Sequence[Sequence[NodeWithScore]],
+    weights: Sequence[float],
+) -> List[NodeWithScore]:
+    """
+    加权分数融合
+
+    稠密(余弦)和稀疏(内积)分数量纲不同，先在各路结果内做min-max归一化，
+    再按权重加权平均，结果同样落在 [0, 1]。
+    """
+    scores: Dict[str, float] = {}
+    nodes: Dict[str, NodeWithScore] = {}
+    total_weight = sum(weights) or 1.0
+    for results, weight in zip(result_lists, weights):
+        if not results:
+            continue
+        raw = [result.score or 0.0 for result in results]
+        low, high = min(raw), max(raw)
+        for result, score in zip(results, raw):
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            node_id = result.node.node_id
+            scores[node_id] = scores.get(node_id, 0.0) + weight * normalized / total_weight
+            nodes.setdefault(node_id, result)
+    return [
+        NodeWithScore(node=nodes[node_id].node, score=score)
+        for node_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    ]
+
+
+def fuse(
+    dense_results: Sequence[NodeWithScore],
+    sparse_results: Optional[Sequence[NodeWithScore]],
+    params: Dict[str, Any],
+) -> List[NodeWithScore]:
+    """按请求参数融合稠密和稀疏检索结果，未启用稀疏检索时直接返回稠密结果"""
+    if sparse_results is None:
+        return list(dense_results)
+    result_lists = [dense_results, sparse_results]
+    if params["fusion"] == FUSION_WEIGHTED:
+        return weighted_score_fusion(result_lists, params["weights"])
+    if params["fusion"] == FUSION_RRF:
+        return reciprocal_rank_fusion(result_lists, params["weights"], k=params["rrf_k"])
+    raise ValueError(f"不支持的融合方式: {params['fusion']}")
+
+
+class HybridSearcher:
+    """
+    客户端混合检索
+
+    查询的稠密向量和稀疏向量并发编码，稠密和稀疏检索并发发往Milvus，
+    融合在客户端完成，因此混合检索的延迟是两路中较慢的一路而不是两者之和，
+    融合方式和权重也可以按请求调整，无需改动Milvus。
+    稀疏向量保存在Milvus的稀疏字段中，或者保存在进程内的SparseInvertedIndex中，
+    后者可以与任意稠密向量库搭配；进程内索引只返回节点ID，
+    只出现在稀疏结果中的节点再从向量库批量取回。
+    """
+
+    # 检索时丢弃查询向量中权重最小的20%的词，以少量召回换取速度。MilvusVectorStore内置的纯稀疏检索
+    # 使用相同的设置，而内置混合检索的稀疏请求不设置drop_ratio_search，保留查询中的全部词
+    sparse_search_params: Dict[str, Any] = {"metric_type": "IP", "params": {"drop_ratio_search": 0.2}}
+
+    def __init__(
+        self,
+        vector_store: BasePydanticVectorStore,
+        embed_model: BaseEmbedding,
+        sparse_embedding_function: Optional[Any] = None,
+        sparse_index: Optional[SparseInvertedIndex] = None,
+    ):
+        self.vector_store = vector_store
+        self.embed_model = embed_model
+        self.sparse_embedding_function = sparse_embedding_function
+        self.sparse_index = sparse_index
+
+    @property
+    def fuses(self) -> bool:
+        """是否启用稀疏检索；启用时检索结果的分数是融合分数，不是相似度"""
+        return self.sparse_embedding_function is not None
+
+    @property
+    def _milvus_sparse(self) -> bool:
+        """稀疏向量是否保存在Milvus集合中"""
+        return (
+            self.sparse_embedding_function is not None
+            and self.sparse_index is None
+            and isinstance(self.vector_store, MilvusVectorStore)
+        )
+
+    async def aencode(self, query_text: str) -> Tuple[List[float], Optional[Dict[int, float]]]:
+        """并发计算查询的稠密向量和稀疏向量"""
+        dense, sparse = await self.aencode_batch([query_text])
+        return dense[0], sparse[0] if sparse is not None else None
+
+    async def _aembed_queries(self, query_texts: List[str]) -> List[List[float]]:
+        # 支持批量查询编码的模型一次请求完成，其余模型逐条并发编码
+        if hasattr(self.embed_model, "aget_query_embedding_batch"):
+            return await self.embed_model.aget_query_embedding_batch(query_texts)
+        return list(await asyncio.gather(
+            *(self.embed_model.aget_query_embedding(query_text) for query_text in query_texts)
+        ))
+
+    async def aencode_batch(
+        self, query_texts: List[str]
+    ) -> Tuple[List[List[float]], Optional[List[Dict[int, float]]]]:
+        """批量计算多个查询的稠密向量和稀疏向量，两类编码各一次批量请求并发执行"""
+        if self.sparse_embedding_function is None:
+            return await self._aembed_queries(query_texts), None
+        dense, sparse = await asyncio.gather(
+            self._aembed_queries(query_texts),
+            self.sparse_embedding_function.async_encode_queries(query_texts),
+        )
+        return dense, sparse
+
+    def _parse(self, hits: Any) -> List[NodeWithScore]:
+        nodes, similarities, _ = self.vector_store._parse_from_milvus_results([hits])
+        return [NodeWithScore(node=node, score=score) for node, score in zip(nodes, similarities)]
+
+    async def _search(
+        self,
+        data: List[Any],
+        anns_field: str,
+        limit: int,
+        search_params: Dict[str, Any],
+    ) -> List[List[NodeWithScore]]:
+        _, output_fields = self.vector_store._prepare_before_search(VectorStoreQuery())
+        results = await self.vector_store.aclient.search(
+            collection_name=self.vector_store.collection_name,
+            data=data,
+            anns_field=anns_field,
+            limit=limit,
+            output_fields=output_fields,
+            search_params=search_params,
+        )
+        return [self._parse(hits) for hits in results]
+
+    async def asample_vectors(
+        self, limit: int
+    ) -> Tuple[List[List[float]], Optional[List[Dict[int, float]]]]:
+        """从集合中取出若干已存储的稠密和稀疏向量，作为校准检索参数的样本查询"""
+        if not isinstance(self.vector_store, MilvusVectorStore):
+            return await asyncio.to_thread(self.vector_store.sample_embeddings, limit), None
+        fields = [self.vector_store.embedding_field]
+        if self._milvus_sparse:
+            fields.append(self.vector_store.sparse_embedding_field)
+        rows = await self.vector_store.aclient.query(
+            collection_name=self.vector_store.collection_name,
+            filter="",
+            output_fields=fields,
+            limit=limit,
+        )
+        dense = [list(row[self.vector_store.embedding_field]) for row in rows]
+        if not self._milvus_sparse:
+            return dense, None
+        sparse = [dict(row[self.vector_store.sparse_embedding_field]) for row in rows]
+        return dense, sparse
+
+    async def _dense_search(
+        self, dense: Sequence[List[float]], limit: int, ef: Optional[int]
+    ) -> List[List[NodeWithScore]]:
+        if isinstance(self.vector_store, MilvusVectorStore):
+            return await self._search(
+                list(dense),
+                self.vector_store.embedding_field,
+                limit,
+                self.dense_search_params(limit, ef),
+            )
+        # 其他向量库通过VectorStore接口检索，ef只对HNSW有意义，不适用
+        if hasattr(self.vector_store, "aquery_many"):
+            results = await self.vector_store.aquery_many(dense, limit)
+        else:
+            results = await asyncio.gather(*(
+                self.vector_store.aquery(VectorStoreQuery(query_embedding=vector, similarity_top_k=limit))
+                for vector in dense
+            ))
+        return [
+            [NodeWithScore(node=node, score=score) for node, score in zip(result.nodes, result.similarities)]
+            for result in results
+        ]
+
+    async def _afetch_nodes(self, node_ids: List[str]) -> Dict[str, BaseNode]:
+        """按节点ID批量取回节点内容，只取检索结果需要的字段"""
+        if not node_ids:
+            return {}
+        if not isinstance(self.vector_store, MilvusVectorStore):
+            nodes = await self.vector_store.aget_nodes(node_ids=node_ids)
+            return {node.node_id: node for node in nodes}
+        _, output_fields = self.vector_store._prepare_before_search(VectorStoreQuery())
+        rows = await self.vector_store.aclient.query(
+            collection_name=self.vector_store.collection_name,
+            ids=node_ids,
+            output_fields=output_fields,
+        )
+        nodes = [metadata_dict_to_node(row, text=row.get(self.vector_store.text_key)) for row in rows]
+        return {node.node_id: node for node in nodes}
+
+    async def _resolve_sparse_hits(
+        self,
+        hits: List[List[Tuple[str, float]]],
+        dense_results: List[List[NodeWithScore]],
+    ) -> List[List[NodeWithScore]]:
+        """
+        把进程内稀疏索引的(节点ID, 得分)还原为节点
+
+        已在稠密结果中的节点直接复用，其余节点所有查询合并为一次批量读取；
+        向量库中已不存在的节点(如写入中途失败留下的)被跳过。
+        """
+        known = {
+            result.node.node_id: result.node
+            for results in dense_results
+            for result in results
+        }
+        missing = list(dict.fromkeys(
+            node_id for query_hits in hits for node_id, _ in query_hits if node_id not in known
+        ))
+        known.update(await self._afetch_nodes(missing))
+        return [
+            [NodeWithScore(node=known[node_id], score=score) for node_id, score in query_hits if node_id in known]
+            for query_hits in hits
+        ]
+
+    def dense_search_params(self, limit: int, ef: Optional[int] = None) -> Dict[str, Any]:
+        params = {**self.vector_store.search_config}
+        if ef is not None:
+            params["ef"] = ef
+        # HNSW要求ef不小于返回数量
+        if "ef" in params:
+            params["ef"] = max(params["ef"], limit)
+        return {"metric_type": self.vector_store.similarity_metric, "params": params}
+
+    async def asearch(
+        self,
+        dense: Sequence[List[float]],
+        sparse: Optional[Sequence[Dict[int, float]]],
+        limit: int,
+        ef: Optional[int] = None,
+    ) -> Tuple[List[List[NodeWithScore]], Optional[List[List[NodeWithScore]]]]:
+        """
+        并发执行稠密和稀疏检索
+
+        dense和sparse均可包含多个查询向量，Milvus一次请求完成多向量检索，
+        返回的结果列表与输入顺序一致。
+        """
+        dense_task = self._dense_search(dense, limit, ef)
+        if sparse is None:
+            return await dense_task, None
+        if self.sparse_index is not None:
+            dense_results, hits = await asyncio.gather(
+                dense_task, self.sparse_index.asearch_many(sparse, limit)
+            )
+            return dense_results, await self._resolve_sparse_hits(hits, dense_results)
+        sparse_task = self._search(
+            list(sparse),
+            self.vector_store.sparse_embedding_field,
+            limit,
+            self.sparse_search_params,
+        )
+        dense_results, sparse_results = await asyncio.gather(dense_task, sparse_task)
+        return dense_results, sparse_results
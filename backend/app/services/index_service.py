@@ -1,40 +1,91 @@
+import asyncio
 import os
+import logging
 import re
+import threading
+import time
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from sqlalchemy.orm import Session
+from typing import AsyncIterator, List, Dict, Any, Optional
 
 from llama_index.core import Document as LlamaDocument, Settings, VectorStoreIndex, StorageContext
-from llama_index.core.ingestion import IngestionPipeline
 from llama_index.core.node_parser import SentenceSplitter
-from llama_index.core import QueryBundle
-from llama_index.core.indices.vector_store import VectorIndexRetriever
 from llama_index.core.postprocessor import SimilarityPostprocessor
-from llama_index.core.vector_stores.types import VectorStoreQueryMode
+from llama_index.core.schema import NodeWithScore
 from llama_index.storage.docstore.redis import RedisDocumentStore
+from llama_index.storage.kvstore.redis import RedisKVStore
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
 from llama_index.vector_stores.milvus import MilvusVectorStore
-from llama_index.postprocessor.jinaai_rerank import JinaRerank
 from app.services.custom.bgem3_sparse import BGEM3SparseEmbeddingFunction
+from app.services.custom.compact_docstore import CompactRedisDocumentStore, NodeCodec
+from app.services.custom.numpy_vector_store import NumpyVectorStore
 from app.services.custom.siliconflow_embeddings import SiliconFlowEmbedding
+from app.services.document_index import SiteDocumentIndex
+from app.services.embedding_cache import create_embedding_cache
+from app.services.hybrid_search import HybridSearcher, fuse
+from app.services.ingestion_engine import IngestionEngine, ProgressCallback
+from app.services.metadata_policy import MetadataPolicy
+from app.services.query_cache import QueryResultCache
+from app.services.query_vector_cache import QueryVectorCache
+from app.services.reranker import Reranker
+from app.services.search_tuning import DEFAULT_SEARCH_PARAMS, SearchCalibration, resolve_search_params
+from app.services.singleflight import SingleFlight
+from app.services.sparse_index import SparseInvertedIndex
 
 from app.core.config import settings
 from app.models.document import Document
 
+logger = logging.getLogger(__name__)
+
 
 class IndexService:
-    """文档索引服务，使用Redis作为文档存储，Milvus作为向量存储"""
+    """
+    文档索引服务，使用Redis作为文档存储，Milvus(或进程内的NumpyVectorStore)作为向量存储
+
+    实例持有连接池和模型客户端，不绑定数据库会话，应通过IndexServiceFactory
+    按站点共享，而不是每个请求新建。
+    """
     
-    def __init__(self, db: Session, site_id: str = "default"):
-        self.db = db
+    def __init__(self, site_id: str = "default"):
         self.site_id = self._sanitize_site_id(site_id)
         
         # 设置命名空间
         self.redis_namespace = f"simplerag:{self.site_id}:docs"
         self.milvus_collection = f"simplerag_{self.site_id}_vectors"
         
+        # 站点使用的向量库，未单独配置的站点使用全局默认值
+        self.vector_store_backend = settings.SITE_VECTOR_STORE_BACKENDS.get(
+            self.site_id, settings.VECTOR_STORE_BACKEND
+        ).lower()
+        
+        # 稀疏向量保存的位置，进程内向量库没有稀疏字段，总是使用进程内稀疏索引
+        self.sparse_index_backend = (
+            "local" if self.vector_store_backend == "numpy" else settings.SPARSE_INDEX_BACKEND.lower()
+        )
+        
+        # 决定文档元数据中哪些键复制到分块、参与向量化、在查询结果中返回
+        self.metadata_policy = MetadataPolicy.from_settings()
+        
+        # 站点的检索参数默认值(ef、candidate_k、rerank_top_k)
+        self.search_defaults = settings.SITE_SEARCH_DEFAULTS.get(self.site_id, {})
+        
+        # 稠密和稀疏查询向量共用的缓存，容量为0时关闭
+        self.query_vector_cache = (
+            QueryVectorCache(
+                max_entries=settings.QUERY_VECTOR_CACHE_MAX_ENTRIES,
+                ttl=settings.QUERY_VECTOR_CACHE_TTL_SECONDS,
+            )
+            if settings.QUERY_VECTOR_CACHE_MAX_ENTRIES > 0
+            else None
+        )
+        
         # 初始化存储组件
         self.doc_store = self._create_doc_store()
+        self.sparse_embedding_function = self._create_sparse_embedding_function()
+        self.sparse_index = self._create_sparse_index()
         self.vector_store = self._create_vector_store()
+        # 进程内向量库和稀疏索引的目录只能由一个进程打开，
+        # 摄入任务在持有索引的API进程中执行，不交给单独的worker
+        self.indexes_in_process = self.vector_store_backend == "numpy" or self.sparse_index is not None
         self.storage_context = StorageContext.from_defaults(
             docstore=self.doc_store,
             vector_store=self.vector_store,
@@ -46,8 +97,69 @@ class IndexService:
             storage_context=self.storage_context,
         )
         
-        # 初始化摄入管道
-        self.pipeline = self._create_ingestion_pipeline()
+        # 初始化摄入引擎
+        self.ingestion_engine = self._create_ingestion_engine()
+        
+        # 初始化混合检索
+        self.hybrid_searcher = HybridSearcher(
+            self.vector_store, self.embed_model, self.sparse_embedding_function, self.sparse_index
+        )
+        
+        # 初始化重排序客户端，未配置服务地址时不重排序
+        self.reranker = (
+            Reranker(
+                base_url=settings.RERANKER_BASE_URL,
+                api_key=settings.RERANKER_API_KEY,
+                model=settings.RERANKER_MODEL,
+                timeout_ms=settings.RERANKER_TIMEOUT_MS,
+                max_concurrency=settings.RERANKER_MAX_CONCURRENCY,
+            )
+            if settings.RERANKER_BASE_URL
+            else None
+        )
+        
+        # 初始化查询结果缓存和并发相同查询的合并
+        self.query_cache = self._create_query_cache()
+        self.singleflight = SingleFlight()
+        
+        # 按延迟目标选择检索参数的校准表
+        self.search_calibration = SearchCalibration(
+            self.kvstore._async_redis_client,
+            self.redis_namespace,
+            settings.SEARCH_CALIBRATION_PROFILES,
+        )
+
+    async def warmup(self) -> None:
+        """建立Redis连接、将Milvus集合加载到内存并创建重排序连接池，避免首个请求承担这些开销"""
+        await self.kvstore._async_redis_client.ping()
+        if isinstance(self.vector_store, MilvusVectorStore):
+            await asyncio.to_thread(self.vector_store.client.load_collection, self.milvus_collection)
+        if self.reranker is not None:
+            await self.reranker.warmup()
+
+    async def aclose(self) -> None:
+        """关闭该实例持有的所有连接"""
+        await self.embed_model.aclose()
+        if self.embed_model.vector_cache is not None:
+            await self.embed_model.vector_cache.aclose()
+        if self.sparse_embedding_function is not None:
+            await self.sparse_embedding_function.aclose()
+        if self.reranker is not None:
+            await self.reranker.aclose()
+        await self.kvstore._async_redis_client.aclose()
+        self.kvstore._redis_client.close()
+        await self._close_vector_store(self.vector_store)
+        if self.sparse_index is not None:
+            self.sparse_index.close()
+
+    async def _close_vector_store(self, vector_store: BasePydanticVectorStore) -> None:
+        """关闭向量存储的连接(Milvus)或文件(NumpyVectorStore)"""
+        if isinstance(vector_store, MilvusVectorStore):
+            if vector_store.aclient is not None:
+                await vector_store.aclient.close()
+            vector_store.client.close()
+        else:
+            vector_store.close()
 
     def _sanitize_site_id(self, site_id: str) -> str:
         """清理站点ID，确保符合命名规范"""
@@ -57,14 +169,58 @@ class IndexService:
 
     def _create_doc_store(self) -> RedisDocumentStore:
         """创建Redis文档存储"""
-        return RedisDocumentStore.from_host_and_port(
+        self.kvstore = RedisKVStore.from_host_and_port(
             host=settings.REDIS_HOST,
             port=settings.REDIS_PORT,
-            namespace=self.redis_namespace,
+        )
+        # 站点文档二级索引，列表和统计接口只读这里
+        self.document_index = SiteDocumentIndex(
+            self.kvstore._async_redis_client, self.redis_namespace
+        )
+        if settings.DOCSTORE_CODEC == "json":
+            return RedisDocumentStore(self.kvstore, namespace=self.redis_namespace)
+        # 紧凑编码同时能读取旧的JSON记录，已有站点可以先切换再用 app.migrate_docstore 迁移
+        return CompactRedisDocumentStore(
+            self.kvstore, namespace=self.redis_namespace, codec=NodeCodec.from_settings()
         )
 
-    def _create_vector_store(self) -> MilvusVectorStore:
-        """创建Milvus向量存储"""
+    def _create_sparse_embedding_function(self) -> Optional[BGEM3SparseEmbeddingFunction]:
+        """创建BGE-M3稀疏编码客户端，未启用稀疏向量时只做稠密检索"""
+        if not settings.ENABLE_SPARSE_EMBEDDING:
+            return None
+        return BGEM3SparseEmbeddingFunction(
+            base_url=settings.EMBEDDING_BASE_URL,
+            max_batch_size=settings.SPARSE_BATCH_SIZE,
+            max_concurrency=settings.SPARSE_MAX_CONCURRENCY,
+            query_cache=self.query_vector_cache,
+        )
+
+    def _create_sparse_index(self) -> Optional[SparseInvertedIndex]:
+        """按站点配置创建进程内稀疏索引，稀疏向量保存在Milvus中时返回None"""
+        if self.sparse_index_backend not in ("milvus", "local"):
+            raise ValueError(f"不支持的稀疏索引: {self.sparse_index_backend}")
+        if self.sparse_embedding_function is None or self.sparse_index_backend != "local":
+            return None
+        return SparseInvertedIndex(persist_dir=os.path.join(settings.SPARSE_INDEX_DIR, self.site_id))
+
+    def _create_vector_store(self) -> BasePydanticVectorStore:
+        """按站点配置创建向量存储"""
+        if self.vector_store_backend == "numpy":
+            return self._create_numpy_vector_store()
+        if self.vector_store_backend != "milvus":
+            raise ValueError(f"不支持的向量库: {self.vector_store_backend}")
+        return self._create_milvus_vector_store()
+
+    def _create_numpy_vector_store(self) -> NumpyVectorStore:
+        """创建进程内向量存储，数据保存在站点独占的目录中"""
+        return NumpyVectorStore(
+            dim=settings.EMB_DIMENSIONS,
+            persist_dir=os.path.join(settings.NUMPY_VECTOR_STORE_DIR, self.site_id),
+        )
+
+    def _create_milvus_vector_store(self) -> MilvusVectorStore:
+        """创建Milvus向量存储，使用进程内稀疏索引时集合不建稀疏字段"""
+        enable_sparse = self.sparse_embedding_function is not None and self.sparse_index is None
         return MilvusVectorStore(
             uri="",  # 设置为空字符串避免使用本地文件
             host=settings.MILVUS_HOST,
@@ -73,110 +229,156 @@ class IndexService:
             collection_name=self.milvus_collection,
             dim=settings.EMB_DIMENSIONS,
             similarity_metric="cosine",
-            enable_sparse=settings.ENABLE_SPARSE_EMBEDDING,
-            sparse_embedding_function=BGEM3SparseEmbeddingFunction(),
+            enable_sparse=enable_sparse,
+            sparse_embedding_function=self.sparse_embedding_function if enable_sparse else None,
             index_config={
                 "metric_type": "COSINE",
                 "index_type": "HNSW",
-                "params": {"M": 32, "efConstruction": 200}
+                "params": {
+                    "M": settings.MILVUS_HNSW_M,
+                    "efConstruction": settings.MILVUS_HNSW_EF_CONSTRUCTION,
+                }
             },
             sparse_index_config={
                 "metric_type": "IP",
                 "index_type": "SPARSE_INVERTED_INDEX",
                 "params": {"drop_ratio_build": 0.2}
             },
-            search_config={"ef": 512}
+            search_config={"ef": self.search_defaults.get("ef", settings.MILVUS_SEARCH_EF)}
         )
 
-    def _create_ingestion_pipeline(self) -> IngestionPipeline:
-        """创建文档摄入管道"""
-        embed_model = SiliconFlowEmbedding(
+    def _create_ingestion_engine(self) -> IngestionEngine:
+        """
+        创建文档摄入引擎
+
+        嵌入模型上的内容寻址向量缓存负责避免重复嵌入未变化的分块。
+        """
+        self.embed_model = SiliconFlowEmbedding(
             api_key=settings.EMBEDDING_API_KEY,
             base_url=f"{settings.EMBEDDING_BASE_URL}/embeddings",
             model=settings.EMBEDDING_MODEL,
             timeout=30,
             max_retries=64,
             dimensions=settings.EMB_DIMENSIONS,
+            embed_batch_size=settings.EMBEDDING_BATCH_SIZE,
+            max_concurrency=settings.EMBEDDING_MAX_CONCURRENCY,
+            vector_cache=create_embedding_cache(),
+            query_cache=self.query_vector_cache,
         )
 
-        return IngestionPipeline(
-            transformations=[
-                SentenceSplitter(
-                    chunk_size=settings.CHUNK_SIZE,
-                    chunk_overlap=settings.CHUNK_OVERLAP,
-                ),
-                embed_model,
-            ],
+        return IngestionEngine(
+            splitter=SentenceSplitter(
+                chunk_size=settings.CHUNK_SIZE,
+                chunk_overlap=settings.CHUNK_OVERLAP,
+            ),
+            embed_model=self.embed_model,
             vector_store=self.vector_store,
             docstore=self.doc_store,
-            disable_cache=True,
+            kvstore=self.kvstore,
+            manifest_collection=f"{self.redis_namespace}/chunk_manifest",
+            sparse_embedding_function=self.sparse_embedding_function,
+            sparse_index=self.sparse_index,
+            document_index=self.document_index,
+            batch_size=settings.INGEST_BATCH_SIZE,
+            queue_size=settings.INGEST_QUEUE_SIZE,
+            split_workers=settings.INGEST_SPLIT_WORKERS,
+            embed_workers=settings.INGEST_EMBED_WORKERS,
+            insert_workers=settings.INGEST_INSERT_WORKERS,
+        )
+
+    def _create_query_cache(self) -> Optional[QueryResultCache]:
+        """创建查询结果缓存，代数计数与文档存储共用站点的Redis命名空间"""
+        backend = settings.QUERY_CACHE_BACKEND.lower()
+        if backend not in ("redis", "local"):
+            return None
+        return QueryResultCache(
+            client=self.kvstore._async_redis_client,
+            namespace=self.redis_namespace,
+            max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+            ttl=settings.QUERY_CACHE_TTL_SECONDS,
+            use_redis=backend == "redis",
+        )
+
+    async def _invalidate_queries(self) -> None:
+        """索引发生写入后使已缓存的查询结果失效"""
+        self.singleflight.forget()
+        if self.query_cache is None:
+            return
+        try:
+            await self.query_cache.bump()
+        except Exception as e:
+            print(f"查询缓存失效失败: {e}")
+
+    def _to_llama_document(self, document: Document) -> LlamaDocument:
+        """
+        将数据库中的文档转换为LlamaIndex文档对象
+
+        只带上元数据策略允许的键，切分时这些键会复制到每个分块上；
+        其余元数据(如parsed_content)留在数据库的文档记录中，通过document_id引用。
+        """
+        metadata = self.metadata_policy.node_metadata({
+            **(document._metadata or {}),
+            "document_id": document.id,
+            "filename": document.filename,
+            "site_id": self.site_id,
+            "created_at": document.created_at.isoformat() if document.created_at else None,
+        })
+        excluded_keys = self.metadata_policy.excluded_embed_keys(metadata)
+        return LlamaDocument(
+            text=document.content,
+            id_=f"{self.site_id}:{document.id}",
+            metadata=metadata,
+            excluded_embed_metadata_keys=excluded_keys,
+            excluded_llm_metadata_keys=excluded_keys,
         )
 
-    async def add_document(self, document: Document) -> str:
+    async def add_document(
+        self,
+        document: Document,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> str:
         """
         将文档添加到索引中
         
         Args:
             document: 数据库中的文档对象
+            progress_callback: 摄入进度回调
             
         Returns:
             str: 文档ID
         """
-        # 生成文档ID
-        doc_id = f"{self.site_id}:{document.id}"
-        
-        # 创建LlamaIndex文档对象
-        llama_document = LlamaDocument(
-            text=document.content,
-            id_=doc_id,
-            metadata={
-                "document_id": document.id,
-                "filename": document.filename,
-                "site_id": self.site_id,
-                "created_at": document.created_at.isoformat() if document.created_at else None,
-                **document._metadata
-            }
-        )
+        llama_document = self._to_llama_document(document)
         
-        # 执行文档摄入
-        await self.pipeline.arun(documents=[llama_document])
-        return doc_id
+        # 执行文档摄入，即使中途失败也可能已写入部分分块，因此总是使缓存失效
+        try:
+            await self.ingestion_engine.arun([llama_document], progress_callback=progress_callback)
+        finally:
+            await self._invalidate_queries()
+        return llama_document.id_
 
-    async def add_documents(self, documents: List[Document]) -> List[str]:
+    async def add_documents(
+        self,
+        documents: List[Document],
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> List[str]:
         """
         批量添加文档到索引中
         
         Args:
             documents: 文档列表
+            progress_callback: 进度回调，参数为阶段名和本次完成的分块数
             
         Returns:
             List[str]: 文档ID列表
         """
-        docs = []
-        doc_ids = []
-        
-        for document in documents:
-            # 生成文档ID
-            doc_id = f"{self.site_id}:{document.id}"
-            doc_ids.append(doc_id)
-            
-            # 创建LlamaIndex文档对象
-            llama_document = LlamaDocument(
-                text=document.content,
-                id_=doc_id,
-                metadata={
-                    "document_id": document.id,
-                    "filename": document.filename,
-                    "site_id": self.site_id,
-                    "created_at": document.created_at.isoformat() if document.created_at else None,
-                    **document._metadata
-                }
-            )
-            docs.append(llama_document)
+        docs = [self._to_llama_document(document) for document in documents]
         
-        # 执行批量文档摄入
-        await self.pipeline.arun(documents=docs)
-        return doc_ids
+        # 执行批量文档摄入，各文档的切分、向量化和写入流水线式重叠进行
+        try:
+            await self.ingestion_engine.arun(docs, progress_callback=progress_callback)
+        finally:
+            await self._invalidate_queries()
+        return [doc.id_ for doc in docs]
 
     async def delete_document(self, document_id: int) -> bool:
         """
@@ -190,118 +392,329 @@ class IndexService:
         """
         try:
             doc_id = f"{self.site_id}:{document_id}"
-            await self.index.adelete_ref_doc(
-                ref_doc_id=doc_id,
-                delete_from_docstore=True
-            )
+            await self.ingestion_engine.adelete(doc_id)
             return True
         except Exception as e:
             print(f"删除文档失败: {e}")
             return False
+        finally:
+            await self._invalidate_queries()
 
-    async def delete_documents(self, document_ids: List[int]) -> bool:
+    async def delete_documents(
+        self,
+        document_ids: List[int],
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> Dict[str, Any]:
         """
-        批量删除文档
+        批量删除文档，按批次一次性删除向量和Redis记录
         
         Args:
             document_ids: 数据库中的文档ID列表
+            progress_callback: 进度回调，参数为deleted和本批删除的文档数
             
         Returns:
-            bool: 删除是否成功
+            Dict[str, Any]: 删除是否成功，以及删除的文档数
         """
         try:
-            for document_id in document_ids:
-                doc_id = f"{self.site_id}:{document_id}"
-                await self.index.adelete_ref_doc(
-                    ref_doc_id=doc_id,
-                    delete_from_docstore=True
-                )
-            return True
+            doc_ids = [f"{self.site_id}:{document_id}" for document_id in document_ids]
+            deleted = await self.ingestion_engine.adelete_many(doc_ids, progress_callback)
+            return {"success": True, "deleted": deleted}
         except Exception as e:
             print(f"批量删除文档失败: {e}")
-            return False
+            return {"success": False, "deleted": 0}
+        finally:
+            await self._invalidate_queries()
 
-    async def update_document(self, document: Document) -> bool:
+    async def update_document(self, document: Document) -> Dict[str, Any]:
         """
-        更新文档内容
+        更新文档内容，只重新向量化发生变化的分块
         
         Args:
             document: 更新后的文档对象
             
         Returns:
-            bool: 更新是否成功
+            Dict[str, Any]: 更新是否成功，以及复用、新增、删除的分块数
         """
         try:
-            # 先删除旧文档
-            await self.delete_document(document.id)
-            
-            # 添加新文档
-            await self.add_document(document)
-            return True
+            chunk_stats = await self.ingestion_engine.aupdate(self._to_llama_document(document))
+            return {"success": True, **chunk_stats}
         except Exception as e:
             print(f"更新文档失败: {e}")
-            return False
+            return {"success": False, "reused": 0, "relinked": 0, "added": 0, "removed": 0}
+        finally:
+            await self._invalidate_queries()
 
     async def query(
         self, 
         query_text: str, 
         top_k: int = 5, 
         rerank: bool = True,
-        rerank_top_k: int = 10,
+        rerank_top_k: Optional[int] = None,
         similarity_cutoff: float = 0.6,
         search_kwargs: Dict[str, Any] = None
     ) -> Dict[str, Any]:
         """
-        执行查询并返回结果
+        执行查询并返回结果，相同参数的查询在索引未发生写入前直接返回缓存结果
         
         Args:
             query_text: 查询文本
             top_k: 返回的最大文档数量
             rerank: 是否进行重排序
-            rerank_top_k: 重排序返回的最大文档数量
+            rerank_top_k: 重排序返回的最大文档数量，为空时使用站点默认值
             similarity_cutoff: 相似度阈值
             search_kwargs: 搜索的额外参数
             
         Returns:
             Dict[str, Any]: 查询结果
         """
-        # 合并默认参数和传入的搜索参数
-        search_params = {}
-        if search_kwargs:
-            search_params.update(search_kwargs)
-        
-        # 创建检索器
-        vector_retriever = VectorIndexRetriever(
-            index=self.index,
-            similarity_top_k=top_k,
-            vector_store_query_mode=VectorStoreQueryMode.HYBRID,
-            **search_params
+        results = await self.query_batch(
+            [query_text],
+            top_k=top_k,
+            rerank=rerank,
+            rerank_top_k=rerank_top_k,
+            similarity_cutoff=similarity_cutoff,
+            search_kwargs=search_kwargs,
         )
+        return results[0]
+
+    async def query_batch(
+        self, 
+        query_texts: List[str], 
+        top_k: int = 5, 
+        rerank: bool = True,
+        rerank_top_k: Optional[int] = None,
+        similarity_cutoff: float = 0.6,
+        search_kwargs: Dict[str, Any] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        批量执行查询，结果顺序与输入一致
         
-        # 执行检索
-        qb = QueryBundle(query_text)
-        nodes = await vector_retriever.aretrieve(qb)
-        
-        # 重排序处理
-        if rerank and hasattr(settings, 'RERANKER_API_KEY'):
+        已缓存的查询直接返回，与正在执行的相同查询合并，其余查询一起编码和检索，
+        参数含义同query。
+            
+        Returns:
+            List[Dict[str, Any]]: 每个查询的结果
+        """
+        params = dict(
+            top_k=top_k,
+            rerank=rerank,
+            rerank_top_k=rerank_top_k,
+            similarity_cutoff=similarity_cutoff,
+            search_kwargs=search_kwargs,
+        )
+        cache_keys = [QueryResultCache.make_key(query_text, **params) for query_text in query_texts]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(query_texts)
+        generation = None
+        if self.query_cache is not None:
             try:
-                reranker = JinaRerank(
-                    base_url=getattr(settings, 'RERANKER_BASE_URL', None),
-                    model=getattr(settings, 'RERANKER_MODEL', 'bge-reranker-v2-m3'),
-                    api_key=settings.RERANKER_API_KEY,
-                    top_n=rerank_top_k,
-                )
-                nodes = reranker.postprocess_nodes(nodes, qb)
+                # 查询前读取代数，查询期间发生的写入会使本次结果以旧代数写入，不会被后续查询读到
+                generation = await self.query_cache.generation()
+                results = list(await asyncio.gather(
+                    *(self.query_cache.get(cache_key, generation) for cache_key in cache_keys)
+                ))
             except Exception as e:
-                print(f"重排序失败，使用原始结果: {e}")
+                print(f"读取查询缓存失败，直接查询: {e}")
+                generation = None
+        
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+        
+        async def execute(positions: List[int]) -> List[Dict[str, Any]]:
+            indices = [missing[position] for position in positions]
+            computed = await self._query_batch([query_texts[i] for i in indices], **params)
+            if generation is not None:
+                for i, result in zip(indices, computed):
+                    # 重排序降级的结果只是临时回退，不写入缓存，避免服务恢复后仍返回检索顺序
+                    if not result["degraded"]:
+                        await self.query_cache.set(cache_keys[i], generation, result)
+            return computed
+        
+        # 相同查询正在执行时等待其结果；键包含代数，写入之后到达的请求不会合并到写入前的执行
+        computed = await self.singleflight.do_many(
+            [f"{generation}:{cache_keys[i]}" for i in missing], execute
+        )
+        for i, result in zip(missing, computed):
+            results[i] = result
+        return results
+
+    async def _query_batch(
+        self, 
+        query_texts: List[str], 
+        top_k: int = 5, 
+        rerank: bool = True,
+        rerank_top_k: Optional[int] = None,
+        similarity_cutoff: float = 0.6,
+        search_kwargs: Dict[str, Any] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        执行检索、重排序和相似度过滤
+        
+        所有查询的稠密向量和稀疏向量各一次批量编码，Milvus一次多向量检索，
+        之后每个查询的融合、重排序和过滤并发执行，重排序并发数不超过连接池大小。
+        
+        Args:
+            query_texts: 查询文本列表
+            top_k: 返回的最大文档数量
+            rerank: 是否进行重排序
+            rerank_top_k: 重排序返回的最大文档数量，为空时使用站点默认值
+            similarity_cutoff: 相似度阈值
+            search_kwargs: 搜索的额外参数，支持 fusion(rrf/weighted)、
+                weights([稠密权重, 稀疏权重])、rrf_k、candidate_k(每路检索的候选数)、
+                ef(HNSW检索深度) 和 latency_target_ms(按校准表选择 ef、candidate_k 和 rerank_top_k)
+            
+        Returns:
+            List[Dict[str, Any]]: 每个查询的结果
+        """
+        search_params = await self._resolve_search_params(rerank_top_k, search_kwargs)
+        candidates = await self._retrieve(query_texts, top_k, search_params)
+        semaphore = asyncio.Semaphore(settings.RERANKER_MAX_CONCURRENCY)
+        
+        async def finish(i: int) -> Dict[str, Any]:
+            nodes = candidates[i]
+            degraded = False
+            reranked = False
+            if rerank and self.reranker is not None:
+                # 重排序在耗时预算内完成，超时或失败时回退到检索顺序并标记降级；
+                # 预算从获得连接槽位后开始计算，批量查询不会因排队而集体超时
+                async with semaphore:
+                    nodes, degraded = await self.reranker.arerank(
+                        query_texts[i], nodes, search_params["rerank_top_k"]
+                    )
+                reranked = not degraded
+            return self._format_result(query_texts[i], nodes, similarity_cutoff, degraded, reranked)
+        
+        return list(await asyncio.gather(*(finish(i) for i in range(len(query_texts)))))
+
+    async def _resolve_search_params(
+        self,
+        rerank_top_k: Optional[int],
+        search_kwargs: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """
+        合并检索参数
+        
+        优先级从低到高: 全局默认值、站点默认值、延迟目标对应的校准配置、请求参数。
+        站点尚未校准时忽略延迟目标。
+        """
+        search_kwargs = search_kwargs or {}
+        profile = None
+        if search_kwargs.get("latency_target_ms") is not None:
+            profile = await self.search_calibration.apick(search_kwargs["latency_target_ms"])
+        return resolve_search_params(
+            DEFAULT_SEARCH_PARAMS,
+            self.search_defaults,
+            profile,
+            search_kwargs,
+            {"rerank_top_k": rerank_top_k},
+        )
+
+    async def _retrieve(
+        self,
+        query_texts: List[str],
+        top_k: int,
+        search_params: Dict[str, Any],
+    ) -> List[List[NodeWithScore]]:
+        """批量编码和检索，返回每个查询融合后的前top_k个候选"""
+        candidate_k = max(search_params["candidate_k"] or top_k, top_k)
+        
+        # 稠密和稀疏向量并发编码，两路检索并发执行，再在客户端融合
+        dense, sparse = await self.hybrid_searcher.aencode_batch(query_texts)
+        dense_results, sparse_results = await self.hybrid_searcher.asearch(
+            dense, sparse, candidate_k, ef=search_params["ef"]
+        )
+        return [
+            fuse(
+                dense_results[i],
+                sparse_results[i] if sparse_results is not None else None,
+                search_params,
+            )[:top_k]
+            for i in range(len(query_texts))
+        ]
+
+    async def query_stream(
+        self, 
+        query_text: str, 
+        top_k: int = 5, 
+        rerank: bool = True,
+        rerank_top_k: Optional[int] = None,
+        similarity_cutoff: float = 0.6,
+        search_kwargs: Dict[str, Any] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        分阶段执行查询，每个阶段完成后立即产出事件，参数含义同query
         
-        # 应用相似度阈值
-        similarity_processor = SimilarityPostprocessor(
-            similarity_cutoff=similarity_cutoff
+        事件依次为:
+        - retrieval: 检索融合后的结果，此时尚未重排序
+        - rerank: 重排序后的结果，未启用重排序时没有该事件
+        - done: 最终结果(与query返回值相同)和各阶段耗时(毫秒)
+        缓存命中时只产出done事件。
+        """
+        start = time.perf_counter()
+        params = dict(
+            top_k=top_k,
+            rerank=rerank,
+            rerank_top_k=rerank_top_k,
+            similarity_cutoff=similarity_cutoff,
+            search_kwargs=search_kwargs,
         )
-        nodes = similarity_processor.postprocess_nodes(nodes)
         
-        # 格式化结果
+        def elapsed_ms() -> float:
+            return round((time.perf_counter() - start) * 1000, 1)
+        
+        cache_key = None
+        if self.query_cache is not None:
+            try:
+                cache_key = QueryResultCache.make_key(query_text, **params)
+                generation = await self.query_cache.generation()
+                cached = await self.query_cache.get(cache_key, generation)
+            except Exception as e:
+                print(f"读取查询缓存失败，直接查询: {e}")
+                cache_key, cached = None, None
+            if cached is not None:
+                yield {"event": "done", "data": {**cached, "cached": True, "timings": {"total_ms": elapsed_ms()}}}
+                return
+        
+        timings = {}
+        search_params = await self._resolve_search_params(rerank_top_k, search_kwargs)
+        nodes = (await self._retrieve([query_text], top_k, search_params))[0]
+        timings["retrieval_ms"] = elapsed_ms()
+        result = self._format_result(query_text, nodes, similarity_cutoff, False, False)
+        yield {"event": "retrieval", "data": {**result, "elapsed_ms": timings["retrieval_ms"]}}
+        
+        if rerank and self.reranker is not None:
+            nodes, degraded = await self.reranker.arerank(
+                query_text, nodes, search_params["rerank_top_k"]
+            )
+            timings["rerank_ms"] = round(elapsed_ms() - timings["retrieval_ms"], 1)
+            result = self._format_result(query_text, nodes, similarity_cutoff, degraded, not degraded)
+            yield {"event": "rerank", "data": {**result, "elapsed_ms": elapsed_ms()}}
+        
+        if cache_key is not None and not result["degraded"]:
+            await self.query_cache.set(cache_key, generation, result)
+        timings["total_ms"] = elapsed_ms()
+        yield {"event": "done", "data": {**result, "cached": False, "timings": timings}}
+
+    def _format_result(
+        self,
+        query_text: str,
+        nodes: List[NodeWithScore],
+        similarity_cutoff: float,
+        degraded: bool,
+        reranked: bool,
+    ) -> Dict[str, Any]:
+        """
+        应用相似度阈值并格式化结果
+
+        阈值只用于重排序得分和稠密检索的相似度；混合检索未经重排序(关闭或降级)时，
+        分数是只反映排名的融合分数，不做阈值过滤，结果数由top_k限制。
+        """
+        if reranked or not self.hybrid_searcher.fuses:
+            similarity_processor = SimilarityPostprocessor(
+                similarity_cutoff=similarity_cutoff
+            )
+            nodes = similarity_processor.postprocess_nodes(nodes)
+        
         sources = []
         for node in nodes:
             sources.append({
@@ -309,17 +722,15 @@ class IndexService:
                 "document_id": node.node.metadata.get("document_id"),
                 "filename": node.node.metadata.get("filename"),
                 "score": node.score if hasattr(node, 'score') else None,
-                "metadata": node.node.metadata
+                "metadata": self.metadata_policy.source_metadata(node.node.metadata)
             })
         
-        # 构建响应
-        result = {
+        return {
             "query": query_text,
             "sources": sources,
-            "total_results": len(sources)
+            "total_results": len(sources),
+            "degraded": degraded,
         }
-        
-        return result
 
     async def get_document_by_id(self, document_id: int) -> Optional[LlamaDocument]:
         """
@@ -337,116 +748,214 @@ class IndexService:
         except (KeyError, ValueError):
             return None
 
-    async def list_documents(self) -> List[Dict[str, Any]]:
+    async def list_documents(self, cursor: Optional[int] = None, limit: int = 100) -> Dict[str, Any]:
         """
-        列出该站点的所有文档
+        按文档ID分页列出该站点的文档
         
+        Args:
+            cursor: 上一页返回的next_cursor，为空时从第一页开始
+            limit: 每页数量
+            
         Returns:
-            List[Dict[str, Any]]: 文档列表
+            Dict[str, Any]: 文档列表和下一页游标
         """
-        all_docs = self.doc_store.docs
-        site_docs = []
-        
-        for doc_id, doc in all_docs.items():
-            if doc_id.startswith(f"{self.site_id}:"):
-                site_docs.append({
-                    "id": doc_id,
-                    "document_id": doc.metadata.get("document_id"),
-                    "filename": doc.metadata.get("filename"),
-                    "metadata": doc.metadata,
-                    "text_preview": doc.text[:200] + "..." if len(doc.text) > 200 else doc.text,
-                })
-        
-        return site_docs
+        return await self.document_index.alist(cursor=cursor, limit=limit)
 
     async def get_stats(self) -> Dict[str, Any]:
         """
-        获取索引统计信息
+        获取索引统计信息，直接读取二级索引中的累计值
         
         Returns:
             Dict[str, Any]: 统计信息
         """
-        all_docs = self.doc_store.docs
-        site_docs = [
-            doc for doc_id, doc in all_docs.items()
-            if doc_id.startswith(f"{self.site_id}:")
-        ]
-        
-        total_tokens = sum(len(doc.text.split()) for doc in site_docs)
+        totals = await self.document_index.astats()
+        vector_cache = self.embed_model.vector_cache
         
         return {
             "site_id": self.site_id,
-            "total_documents": len(site_docs),
-            "total_tokens": total_tokens,
-            "average_document_length": total_tokens / len(site_docs) if site_docs else 0,
+            "total_documents": totals["documents"],
+            "total_chunks": totals["chunks"],
+            "total_tokens": totals["tokens"],
+            "average_document_length": totals["tokens"] / totals["documents"] if totals["documents"] else 0,
             "redis_namespace": self.redis_namespace,
             "milvus_collection": self.milvus_collection,
+            "vector_store_backend": self.vector_store_backend,
+            "embedding_cache": vector_cache.stats() if vector_cache else None,
+            "query_cache": self.query_cache.stats() if self.query_cache else None,
+            "query_vector_cache": self.query_vector_cache.stats() if self.query_vector_cache else None,
+            "sparse_index": self.sparse_index.stats() if self.sparse_index else None,
+            "reranker": self.reranker.stats() if self.reranker else None,
+            "singleflight": self.singleflight.stats(),
         }
 
-    async def clear_all_documents(self) -> bool:
+    async def rebuild_document_index(self) -> int:
+        """
+        从文档存储和分块清单重建二级索引
+
+        只用于迁移启用二级索引之前摄入的站点，需要完整扫描一次文档存储。
+        
+        Returns:
+            int: 写入索引的文档数
+        """
+        await self.document_index.aclear()
+        count = 0
+        async for docs in self._aiter_doc_batches():
+            # 每批文档的分块清单一次取回
+            manifests = await self.ingestion_engine._get_manifests(list(docs))
+            entries = {
+                doc_id: SiteDocumentIndex.make_entry(
+                    doc.metadata.get("document_id"),
+                    doc.metadata.get("filename"),
+                    doc.text,
+                    len(node_ids or []),
+                )
+                for (doc_id, doc), node_ids in zip(docs.items(), manifests)
+            }
+            await self.document_index.aupsert(entries)
+            count += len(entries)
+        return count
+
+    async def _aiter_doc_batches(self) -> AsyncIterator[Dict[str, LlamaDocument]]:
+        """分批遍历文档存储，紧凑编码的文档存储用HSCAN分批读取"""
+        if isinstance(self.doc_store, CompactRedisDocumentStore):
+            async for docs in self.doc_store.aiter_documents():
+                yield docs
+        else:
+            yield self.doc_store.docs
+
+    async def calibrate_search(self) -> List[Dict[str, Any]]:
+        """
+        在当前集合上测量各候选检索配置的延迟和召回率，供按延迟目标查询时选择
+        
+        校准后使已缓存的查询结果失效，按延迟目标的查询会改用新的配置。
+        
+        Returns:
+            List[Dict[str, Any]]: 校准表
+        """
+        table = await self.search_calibration.acalibrate(
+            self.hybrid_searcher, sample_size=settings.SEARCH_CALIBRATION_SAMPLES
+        )
+        await self._invalidate_queries()
+        return table
+
+    async def _recreate_vector_store(self) -> None:
+        """删除并重建向量集合，比逐条删除向量快得多，也不会留下删除标记"""
+        await self.vector_store.aclear()
+        if self.sparse_index is not None:
+            await self.sparse_index.aclear()
+        # 旧实例的连接不再使用，先关闭再替换
+        await self._close_vector_store(self.vector_store)
+        # 新建向量存储时会按配置重新创建集合和索引
+        self.vector_store = await asyncio.to_thread(self._create_vector_store)
+        self.storage_context = StorageContext.from_defaults(
+            docstore=self.doc_store,
+            vector_store=self.vector_store,
+        )
+        self.index = VectorStoreIndex.from_vector_store(
+            vector_store=self.vector_store,
+            storage_context=self.storage_context,
+        )
+        self.ingestion_engine.vector_store = self.vector_store
+        self.hybrid_searcher.vector_store = self.vector_store
+
+    async def clear_all_documents(self) -> Dict[str, Any]:
         """
         清除该站点的所有文档
         
+        站点独占Milvus集合和Redis命名空间，因此直接重建集合并删除整个Redis哈希，
+        耗时与文档数无关。
+        
         Returns:
-            bool: 清除是否成功
+            Dict[str, Any]: 清除是否成功，以及删除的文档数
         """
         try:
-            all_docs = self.doc_store.docs
-            doc_ids_to_delete = [
-                doc_id for doc_id in all_docs.keys()
-                if doc_id.startswith(f"{self.site_id}:")
-            ]
-            
-            for doc_id in doc_ids_to_delete:
-                await self.index.adelete_ref_doc(
-                    ref_doc_id=doc_id,
-                    delete_from_docstore=True
-                )
-            
-            return True
+            deleted, _ = await asyncio.gather(
+                self.ingestion_engine.aclear_documents(),
+                self._recreate_vector_store(),
+            )
+            return {"success": True, "deleted": deleted}
         except Exception as e:
             print(f"清除所有文档失败: {e}")
-            return False
+            return {"success": False, "deleted": 0}
+        finally:
+            await self._invalidate_queries()
 
 
 class IndexServiceFactory:
-    """索引服务工厂，用于创建和管理站点索引实例"""
+    """
+    索引服务工厂，用于创建和管理站点索引实例
+
+    每个站点只创建一个实例，由API进程和摄入worker的所有请求共享，
+    在应用启动时预热，在关闭时统一释放连接。
+    """
     
     _instances: Dict[str, IndexService] = {}
+    # 同步依赖在线程池中执行，并发的首次请求可能同时创建同一站点的实例
+    _lock = threading.Lock()
     
     @classmethod
     def get_instance(
         cls,
-        db: Session,
         site_id: str = "default",
         use_cache: bool = True
     ) -> IndexService:
         """
         获取索引服务实例，如果不存在则创建新实例
+
+        创建实例会同步连接Milvus并检查集合，在事件循环中应通过asyncio.to_thread调用。
         
         Args:
-            db: 数据库会话
             site_id: 站点ID
             use_cache: 是否使用缓存的实例
             
         Returns:
             IndexService: 索引服务实例
         """
-        # 如果使用缓存且实例已存在，则返回缓存的实例
-        if use_cache and site_id in cls._instances:
-            return cls._instances[site_id]
-            
-        # 创建新实例
-        service = IndexService(db=db, site_id=site_id)
-        
-        # 如果使用缓存，则保存实例
-        if use_cache:
-            cls._instances[site_id] = service
-            
+        if not use_cache:
+            return IndexService(site_id=site_id)
+
+        # 实例已存在时不加锁直接返回
+        service = cls._instances.get(site_id)
+        if service is not None:
+            return service
+
+        with cls._lock:
+            # 等待锁期间可能已由其他线程创建
+            service = cls._instances.get(site_id)
+            if service is None:
+                service = IndexService(site_id=site_id)
+                cls._instances[site_id] = service
         return service
+
+    @classmethod
+    async def warmup(cls, site_ids: List[str]) -> None:
+        """
+        创建并预热指定站点的实例
+
+        依赖服务不可用时只记录日志，不阻止应用启动，请求到来时再重试创建。
+        """
+        for site_id in site_ids:
+            try:
+                # 创建实例会同步连接Milvus并检查集合，放到线程中执行
+                service = await asyncio.to_thread(cls.get_instance, site_id)
+                await service.warmup()
+            except Exception as e:
+                logger.warning(f"索引服务预热失败: {site_id}: {e}")
+
+    @classmethod
+    async def close_all(cls) -> None:
+        """关闭并清除所有缓存的实例"""
+        with cls._lock:
+            instances = list(cls._instances.values())
+            cls._instances.clear()
+        for service in instances:
+            try:
+                await service.aclose()
+            except Exception as e:
+                logger.warning(f"关闭索引服务失败: {service.site_id}: {e}")
         
     @classmethod
     def clear_cache(cls):
         """清除缓存的实例"""
-        cls._instances.clear()
-
+        with cls._lock:
+            cls._instances.clear()
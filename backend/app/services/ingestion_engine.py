@@ -0,0 +1,445 @@
+import asyncio
+import hashlib
+import json
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.node_parser import NodeParser
+from llama_index.core.schema import BaseNode, Document as LlamaDocument, MetadataMode, NodeRelationship
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+from llama_index.core.storage.kvstore.types import BaseKVStore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+from llama_index.storage.kvstore.redis import RedisKVStore
+
+from app.services.custom.compact_docstore import CompactRedisDocumentStore
+from app.services.document_index import SiteDocumentIndex
+from app.services.sparse_index import SparseInvertedIndex
+
+# 队列结束标记
+_DONE = object()
+
+# 进度回调，参数为阶段名(split/embedded/inserted)和本次完成的分块数，可以是协程函数；
+# 批量删除时阶段名为deleted，计数为本次删除的文档数
+ProgressCallback = Callable[[str, int], Optional[Awaitable[None]]]
+
+
+async def _noop_progress(stage: str, count: int) -> None:
+    pass
+
+
+def _as_async_callback(callback: Optional[ProgressCallback]) -> Callable[[str, int], Awaitable[None]]:
+    if callback is None:
+        return _noop_progress
+
+    async def report(stage: str, count: int) -> None:
+        result = callback(stage, count)
+        if result is not None:
+            await result
+
+    return report
+
+
+def _neighbours(node_ids: Sequence[str]) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """分块清单中每个分块的前后分块ID"""
+    padded = [None, *node_ids, None]
+    return {node_id: (padded[i], padded[i + 2]) for i, node_id in enumerate(node_ids)}
+
+
+class IngestionEngine:
+    """
+    分阶段的流式文档摄入引擎
+
+    切分 → 稠密/稀疏向量化 → 向量库写入 三个阶段通过有界队列串联，
+    每个阶段有独立的并发数，队列满时上游自动等待（背压）。
+    这样第N+1篇文档的切分、第N篇文档的向量化和更早批次的写入可以同时进行，
+    稳态吞吐只受最慢的外部服务限制。
+
+    分块ID由文档ID和分块内容哈希确定，每篇文档的分块ID清单保存在kvstore中，
+    更新文档时据此只处理新增和消失的分块。
+    """
+
+    def __init__(
+        self,
+        splitter: NodeParser,
+        embed_model: BaseEmbedding,
+        vector_store: BasePydanticVectorStore,
+        docstore: BaseDocumentStore,
+        kvstore: BaseKVStore,
+        manifest_collection: str,
+        sparse_embedding_function: Optional[Any] = None,
+        sparse_index: Optional[SparseInvertedIndex] = None,
+        document_index: Optional[SiteDocumentIndex] = None,
+        batch_size: int = 64,
+        queue_size: int = 8,
+        split_workers: int = 2,
+        embed_workers: int = 4,
+        insert_workers: int = 2,
+        delete_batch_size: int = 1000,
+    ):
+        self.splitter = splitter
+        self.embed_model = embed_model
+        self.vector_store = vector_store
+        self.docstore = docstore
+        self.kvstore = kvstore
+        self.manifest_collection = manifest_collection
+        self.sparse_embedding_function = sparse_embedding_function
+        self.sparse_index = sparse_index
+        self.document_index = document_index
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.split_workers = split_workers
+        self.embed_workers = embed_workers
+        self.insert_workers = insert_workers
+        self.delete_batch_size = delete_batch_size
+
+    @staticmethod
+    def _chunk_hash(node: BaseNode) -> str:
+        """分块哈希：只要送去向量化的内容不变，向量就可以复用"""
+        content = node.get_content(metadata_mode=MetadataMode.EMBED)
+        return hashlib.sha256(content.encode("utf-8", "surrogatepass")).hexdigest()
+
+    def _assign_chunk_ids(self, doc_id: str, nodes: Sequence[BaseNode]) -> None:
+        """将分块ID替换为由内容决定的稳定ID，并修正前后分块的关联"""
+        occurrences: Counter = Counter()
+        id_map = {}
+        for node in nodes:
+            chunk_hash = self._chunk_hash(node)
+            # 同一文档内重复出现的分块用序号区分
+            id_map[node.node_id] = f"{doc_id}:{chunk_hash[:32]}:{occurrences[chunk_hash]}"
+            occurrences[chunk_hash] += 1
+        for node in nodes:
+            node.node_id = id_map[node.node_id]
+            for relationship in (NodeRelationship.PREVIOUS, NodeRelationship.NEXT):
+                related = node.relationships.get(relationship)
+                if related is not None and related.node_id in id_map:
+                    related.node_id = id_map[related.node_id]
+
+    def _split(self, document: LlamaDocument) -> List[BaseNode]:
+        nodes = self.splitter([document])
+        self._assign_chunk_ids(document.id_, nodes)
+        return nodes
+
+    async def _get_manifest(self, doc_id: str) -> Optional[List[str]]:
+        manifest = await self.kvstore.aget(doc_id, collection=self.manifest_collection)
+        return manifest["node_ids"] if manifest is not None else None
+
+    async def _get_manifests(self, doc_ids: Sequence[str]) -> List[Optional[List[str]]]:
+        """批量读取分块清单，与doc_ids一一对应"""
+        if not doc_ids:
+            return []
+        if isinstance(self.kvstore, RedisKVStore):
+            # 一条HMGET取回整批清单
+            values = await self.kvstore._async_redis_client.hmget(self.manifest_collection, list(doc_ids))
+            return [json.loads(value)["node_ids"] if value is not None else None for value in values]
+        return [await self._get_manifest(doc_id) for doc_id in doc_ids]
+
+    async def _put_manifests(self, manifests: Dict[str, List[str]]) -> None:
+        await self.kvstore.aput_all(
+            [(doc_id, {"node_ids": node_ids}) for doc_id, node_ids in manifests.items()],
+            collection=self.manifest_collection,
+        )
+
+    async def _filter_unchanged(self, documents: Sequence[LlamaDocument]) -> List[LlamaDocument]:
+        """按文档哈希去重：未变化的文档跳过，已变化的先删除旧数据"""
+        documents_to_run = []
+        if isinstance(self.docstore, CompactRedisDocumentStore):
+            hashes = await self.docstore.aget_document_hashes([document.id_ for document in documents])
+        else:
+            hashes = [await self.docstore.aget_document_hash(document.id_) for document in documents]
+        for document, existing_hash in zip(documents, hashes):
+            if not existing_hash:
+                documents_to_run.append(document)
+            elif existing_hash != document.hash:
+                await self.adelete(document.id_)
+                documents_to_run.append(document)
+        return documents_to_run
+
+    async def _run_stages(
+        self,
+        documents: Sequence[LlamaDocument],
+        nodes: Sequence[BaseNode],
+        report: Callable[[str, int], Awaitable[None]],
+    ) -> Tuple[List[BaseNode], Dict[str, List[str]]]:
+        """
+        运行流水线
+
+        documents从切分阶段进入，已切分好的nodes直接进入向量化阶段。
+        返回已写入的分块，以及每篇新切分文档的分块ID清单。
+        """
+        doc_queue: asyncio.Queue = asyncio.Queue()
+        embed_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        insert_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        inserted: List[BaseNode] = []
+        manifests: Dict[str, List[str]] = {}
+
+        for document in documents:
+            doc_queue.put_nowait(document)
+        for _ in range(self.split_workers):
+            doc_queue.put_nowait(_DONE)
+
+        async def feed_nodes() -> None:
+            for start in range(0, len(nodes), self.batch_size):
+                await embed_queue.put(list(nodes[start:start + self.batch_size]))
+
+        async def split_worker() -> None:
+            while (document := await doc_queue.get()) is not _DONE:
+                # 切分是纯CPU操作，放到线程中避免阻塞事件循环
+                doc_nodes = await asyncio.to_thread(self._split, document)
+                manifests[document.id_] = [node.node_id for node in doc_nodes]
+                await report("split", len(doc_nodes))
+                for start in range(0, len(doc_nodes), self.batch_size):
+                    await embed_queue.put(doc_nodes[start:start + self.batch_size])
+
+        async def embed_worker() -> None:
+            while (batch := await embed_queue.get()) is not _DONE:
+                texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in batch]
+                dense_task = self.embed_model.aget_text_embedding_batch(texts)
+                sparse_vectors = None
+                if self.sparse_embedding_function is not None:
+                    sparse_texts = [node.text for node in batch]
+                    embeddings, sparse_vectors = await asyncio.gather(
+                        dense_task,
+                        self.sparse_embedding_function.async_encode_documents(sparse_texts),
+                    )
+                else:
+                    embeddings = await dense_task
+                for node, embedding in zip(batch, embeddings):
+                    node.embedding = embedding
+                await report("embedded", len(batch))
+                await insert_queue.put((batch, sparse_vectors))
+
+        async def insert_worker() -> None:
+            while (item := await insert_queue.get()) is not _DONE:
+                batch, sparse_vectors = item
+                if self.sparse_index is not None and sparse_vectors is not None:
+                    await asyncio.gather(
+                        self.vector_store.async_add(batch),
+                        self.sparse_index.async_add(
+                            [node.node_id for node in batch],
+                            [node.ref_doc_id for node in batch],
+                            sparse_vectors,
+                        ),
+                    )
+                elif sparse_vectors is not None:
+                    # 预先批量计算的稀疏向量只在本批写入期间交给向量库复用，避免逐条同步请求
+                    with self.sparse_embedding_function.prefetched([node.text for node in batch], sparse_vectors):
+                        await self.vector_store.async_add(batch)
+                else:
+                    await self.vector_store.async_add(batch)
+                inserted.extend(batch)
+                await report("inserted", len(batch))
+
+        async def close_stage(workers: List[asyncio.Task], next_queue: asyncio.Queue, next_workers: int) -> None:
+            """上游阶段全部结束后，向下游每个worker发送结束标记"""
+            await asyncio.gather(*workers)
+            for _ in range(next_workers):
+                await next_queue.put(_DONE)
+
+        async with asyncio.TaskGroup() as group:
+            producer_tasks = [group.create_task(split_worker()) for _ in range(self.split_workers)]
+            producer_tasks.append(group.create_task(feed_nodes()))
+            embed_tasks = [group.create_task(embed_worker()) for _ in range(self.embed_workers)]
+            for _ in range(self.insert_workers):
+                group.create_task(insert_worker())
+            group.create_task(close_stage(producer_tasks, embed_queue, self.embed_workers))
+            group.create_task(close_stage(embed_tasks, insert_queue, self.insert_workers))
+
+        return inserted, manifests
+
+    async def _commit_documents(self, documents: Sequence[LlamaDocument], manifests: Dict[str, List[str]]) -> None:
+        # 全部写入成功后再登记文档哈希和分块清单，失败的文档下次会被重新摄入
+        await self._put_manifests(manifests)
+        await self.docstore.aset_document_hashes({doc.id_: doc.hash for doc in documents})
+        await self.docstore.async_add_documents(documents)
+        if self.document_index is not None:
+            await self.document_index.aupsert({
+                doc.id_: SiteDocumentIndex.make_entry(
+                    doc.metadata.get("document_id"),
+                    doc.metadata.get("filename"),
+                    doc.text,
+                    len(manifests[doc.id_]),
+                )
+                for doc in documents
+            })
+
+    async def arun(
+        self,
+        documents: Sequence[LlamaDocument],
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> List[BaseNode]:
+        """
+        执行流式摄入
+
+        Args:
+            documents: 待摄入的文档
+            progress_callback: 进度回调
+
+        Returns:
+            List[BaseNode]: 已写入向量库的分块
+        """
+        documents_to_run = await self._filter_unchanged(documents)
+        if not documents_to_run:
+            return []
+
+        inserted, manifests = await self._run_stages(
+            documents_to_run, [], _as_async_callback(progress_callback)
+        )
+        await self._commit_documents(documents_to_run, manifests)
+        return inserted
+
+    async def aupdate(
+        self,
+        document: LlamaDocument,
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> Dict[str, int]:
+        """
+        增量更新文档：按分块哈希比对新旧分块集合
+
+        只向量化并写入新增的分块，只删除消失的分块，未变化的分块原样保留。
+        内容未变但前后分块变化的分块重新写入以更新PREVIOUS/NEXT关联，
+        向量由嵌入缓存命中，不会再次请求嵌入服务。
+        先写入再删除，中途失败时旧版本的分块仍然完整，清单未更新，重试会重新计算差异。
+
+        Returns:
+            Dict[str, int]: 复用、重新关联、新增、删除的分块数
+        """
+        report = _as_async_callback(progress_callback)
+        nodes = await asyncio.to_thread(self._split, document)
+        await report("split", len(nodes))
+        new_ids = [node.node_id for node in nodes]
+
+        old_ids = await self._get_manifest(document.id_)
+        if old_ids is None:
+            # 旧版本摄入的文档没有分块清单，只能整体替换
+            await asyncio.gather(
+                self.vector_store.adelete(document.id_),
+                self._delete_sparse([document.id_]),
+            )
+            old_ids = []
+
+        old_neighbours = _neighbours(old_ids)
+        new_neighbours = _neighbours(new_ids)
+        new_id_set = set(new_ids)
+        nodes_to_add = [node for node in nodes if node.node_id not in old_neighbours]
+        nodes_to_relink = [
+            node for node in nodes
+            if node.node_id in old_neighbours and old_neighbours[node.node_id] != new_neighbours[node.node_id]
+        ]
+        ids_to_remove = [node_id for node_id in old_ids if node_id not in new_id_set]
+
+        nodes_to_write = nodes_to_add + nodes_to_relink
+        if nodes_to_write:
+            # 重新关联的分块以及上次失败时残留的分块先删除，向量库按ID写入时不会产生重复
+            await self._delete_nodes([node.node_id for node in nodes_to_write])
+            await self._run_stages([], nodes_to_write, report)
+        if ids_to_remove:
+            await self._delete_nodes(ids_to_remove)
+        await self._commit_documents([document], {document.id_: new_ids})
+
+        return {
+            "reused": len(new_ids) - len(nodes_to_write),
+            "relinked": len(nodes_to_relink),
+            "added": len(nodes_to_add),
+            "removed": len(ids_to_remove),
+        }
+
+    async def _delete_nodes(self, node_ids: Sequence[str]) -> None:
+        await self.vector_store.adelete_nodes(node_ids=list(node_ids))
+        if self.sparse_index is not None:
+            await self.sparse_index.adelete_nodes(node_ids)
+
+    async def _remove_from_index(self, doc_ids: Sequence[str]) -> None:
+        if self.document_index is not None:
+            await self.document_index.aremove(doc_ids)
+
+    async def _delete_sparse(self, doc_ids: Sequence[str]) -> None:
+        if self.sparse_index is not None:
+            await self.sparse_index.adelete_refs(doc_ids)
+
+    async def adelete(self, doc_id: str) -> None:
+        """删除文档的向量、文档存储记录和分块清单"""
+        await asyncio.gather(
+            self.vector_store.adelete(doc_id),
+            self._delete_sparse([doc_id]),
+            self.docstore.adelete_document(doc_id, raise_error=False),
+            self.kvstore.adelete(doc_id, collection=self.manifest_collection),
+            self._remove_from_index([doc_id]),
+        )
+
+    @property
+    def _doc_collections(self) -> List[str]:
+        """一篇文档在kvstore中占用的所有集合"""
+        return [
+            self.docstore._node_collection,
+            self.docstore._metadata_collection,
+            self.docstore._ref_doc_collection,
+            self.manifest_collection,
+        ]
+
+    async def _delete_keys(self, doc_ids: Sequence[str]) -> None:
+        if isinstance(self.kvstore, RedisKVStore):
+            # 每个集合是一个Redis哈希，一条HDEL删除整批字段，所有集合一次往返
+            pipe = self.kvstore._async_redis_client.pipeline(transaction=False)
+            for collection in self._doc_collections:
+                pipe.hdel(collection, *doc_ids)
+            await pipe.execute()
+            return
+        await asyncio.gather(*(
+            self.kvstore.adelete(doc_id, collection=collection)
+            for collection in self._doc_collections
+            for doc_id in doc_ids
+        ))
+
+    async def adelete_many(
+        self,
+        doc_ids: Sequence[str],
+        progress_callback: Optional[ProgressCallback] = None,
+    ) -> int:
+        """
+        批量删除文档
+
+        每批文档只发出一次按doc_id过滤的向量库删除和一次kvstore批量删除，
+        不再逐篇查询分块。
+
+        Returns:
+            int: 删除的文档数
+        """
+        report = _as_async_callback(progress_callback)
+        for start in range(0, len(doc_ids), self.delete_batch_size):
+            batch = list(doc_ids[start:start + self.delete_batch_size])
+            filters = MetadataFilters(
+                filters=[MetadataFilter(key="doc_id", value=batch, operator=FilterOperator.IN)]
+            )
+            await asyncio.gather(
+                self.vector_store.adelete_nodes(filters=filters),
+                self._delete_sparse(batch),
+                self._delete_keys(batch),
+                self._remove_from_index(batch),
+            )
+            await report("deleted", len(batch))
+        return len(doc_ids)
+
+    async def aclear_documents(self) -> int:
+        """
+        删除kvstore中的全部文档记录和分块清单，向量由调用方负责清理
+
+        Returns:
+            int: 删除的文档数
+        """
+        if self.document_index is not None:
+            await self.document_index.aclear()
+        if isinstance(self.kvstore, RedisKVStore):
+            client = self.kvstore._async_redis_client
+            count = await client.hlen(self.docstore._metadata_collection)
+            await client.unlink(*self._doc_collections)
+            return count
+
+        doc_ids = list(await self.kvstore.aget_all(collection=self.docstore._metadata_collection))
+        await self._delete_keys(doc_ids)
+        return len(doc_ids)
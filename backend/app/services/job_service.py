@@ -0,0 +1,190 @@
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis.asyncio as aioredis
+from redis.exceptions import ResponseError
+
+from app.core.config import settings
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_COMPLETED = "completed"
+JOB_STATUS_FAILED = "failed"
+
+# 进度计数字段，对应摄入引擎的 split/embedded/inserted 阶段
+PROGRESS_FIELDS = {
+    "split": "chunks_split",
+    "embedded": "chunks_embedded",
+    "inserted": "chunks_inserted",
+}
+
+
+class IngestionJobQueue:
+    """
+    基于Redis Stream的文档摄入任务队列
+
+    任务消息写入Stream并由消费组分发给worker，worker处理完成后ACK；
+    worker崩溃时未ACK的消息会在空闲超时后被其他worker认领重试。
+    处理中的worker定期续期自己的消息，长任务不会被认领；
+    投递次数超过上限的消息转入死信Stream，不再重试。
+    任务状态和进度保存在每个任务独立的Redis哈希中。
+    """
+
+    def __init__(
+        self,
+        client: aioredis.Redis,
+        stream: str = "simplerag:jobs:ingest",
+        group: str = "ingest-workers",
+        job_ttl: int = 7 * 24 * 3600,
+    ):
+        self.client = client
+        self.stream = stream
+        self.group = group
+        self.job_ttl = job_ttl
+        self.dead_letter_stream = f"{stream}:dead"
+
+    @classmethod
+    def from_settings(cls) -> "IngestionJobQueue":
+        client = aioredis.Redis(
+            host=settings.REDIS_HOST,
+            port=settings.REDIS_PORT,
+            password=settings.REDIS_PASSWORD or None,
+            db=settings.REDIS_DB,
+            decode_responses=True,
+        )
+        return cls(
+            client,
+            stream=settings.INGEST_JOB_STREAM,
+            group=settings.INGEST_JOB_GROUP,
+            job_ttl=settings.INGEST_JOB_TTL_SECONDS,
+        )
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.stream}:job:{job_id}"
+
+    async def enqueue(
+        self, document_ids: List[int], site_id: str, filename: str, dispatch: bool = True
+    ) -> str:
+        """
+        创建任务并写入队列，返回任务ID；一个任务可以包含批量上传的多篇文档
+
+        dispatch为False时只创建任务记录，不写入Stream，由调用方在本进程中执行(见worker.run_local_job)
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        job_key = self._job_key(job_id)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(job_key, mapping={
+            "job_id": job_id,
+            "status": JOB_STATUS_QUEUED,
+            "document_ids": ",".join(map(str, document_ids)),
+            "site_id": site_id,
+            "filename": filename,
+            "chunks_split": 0,
+            "chunks_embedded": 0,
+            "chunks_inserted": 0,
+            "error": "",
+            "created_at": now,
+            "updated_at": now,
+        })
+        pipe.expire(job_key, self.job_ttl)
+        if dispatch:
+            pipe.xadd(self.stream, {"job_id": job_id})
+        await pipe.execute()
+        return job_id
+
+    async def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self.client.hgetall(self._job_key(job_id))
+        if not job:
+            return None
+        job["document_ids"] = [int(document_id) for document_id in job["document_ids"].split(",") if document_id]
+        for field in PROGRESS_FIELDS.values():
+            job[field] = int(job[field])
+        for field in ("created_at", "updated_at"):
+            job[field] = float(job[field])
+        job["error"] = job["error"] or None
+        return job
+
+    async def _set_status(self, job_id: str, status: str, **fields: Any) -> None:
+        await self.client.hset(
+            self._job_key(job_id),
+            mapping={"status": status, "updated_at": time.time(), **fields},
+        )
+
+    async def mark_running(self, job_id: str) -> None:
+        # 重试时从零开始统计进度
+        await self._set_status(
+            job_id, JOB_STATUS_RUNNING, **{field: 0 for field in PROGRESS_FIELDS.values()}
+        )
+
+    async def mark_completed(self, job_id: str) -> None:
+        await self._set_status(job_id, JOB_STATUS_COMPLETED)
+
+    async def mark_failed(self, job_id: str, error: str) -> None:
+        await self._set_status(job_id, JOB_STATUS_FAILED, error=error)
+
+    async def record_progress(self, job_id: str, stage: str, count: int) -> None:
+        field = PROGRESS_FIELDS.get(stage)
+        if field is None:
+            return
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(self._job_key(job_id), field, count)
+        pipe.hset(self._job_key(job_id), "updated_at", time.time())
+        await pipe.execute()
+
+    async def ensure_group(self) -> None:
+        """创建消费组，已存在时忽略"""
+        try:
+            await self.client.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def read(self, consumer: str, count: int, block_ms: int) -> List[Tuple[str, str]]:
+        """读取新消息，返回 (消息ID, 任务ID) 列表"""
+        response = await self.client.xreadgroup(
+            self.group, consumer, {self.stream: ">"}, count=count, block=block_ms
+        )
+        return [
+            (message_id, fields["job_id"])
+            for _, messages in response or []
+            for message_id, fields in messages
+        ]
+
+    async def claim_stale(self, consumer: str, min_idle_ms: int, count: int) -> List[Tuple[str, str]]:
+        """认领其他worker长时间未ACK的消息"""
+        _, messages, *_ = await self.client.xautoclaim(
+            self.stream, self.group, consumer, min_idle_time=min_idle_ms, count=count
+        )
+        return [(message_id, fields["job_id"]) for message_id, fields in messages if fields]
+
+    async def heartbeat(self, consumer: str, message_id: str) -> None:
+        """重置消息的空闲时间，JUSTID不会增加投递次数"""
+        await self.client.xclaim(
+            self.stream, self.group, consumer, min_idle_time=0, message_ids=[message_id], justid=True
+        )
+
+    async def delivery_count(self, message_id: str) -> int:
+        """消息已被投递的次数，首次读取为1，每次被认领加1"""
+        pending = await self.client.xpending_range(
+            self.stream, self.group, min=message_id, max=message_id, count=1
+        )
+        return pending[0]["times_delivered"] if pending else 0
+
+    async def dead_letter(self, message_id: str, job_id: str) -> None:
+        """把消息转入死信Stream并从任务队列中移除"""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.xadd(self.dead_letter_stream, {"job_id": job_id, "message_id": message_id})
+        pipe.xack(self.stream, self.group, message_id)
+        pipe.xdel(self.stream, message_id)
+        await pipe.execute()
+
+    async def ack(self, message_id: str) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.xack(self.stream, self.group, message_id)
+        pipe.xdel(self.stream, message_id)
+        await pipe.execute()
+
+    async def close(self) -> None:
+        await self.client.aclose()
@@ -0,0 +1,76 @@
+import json
+import logging
+from typing import Any, Dict, List, Sequence
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 检索结果的来源引用和二级索引依赖这些键，总是保存在分块上
+REQUIRED_NODE_KEYS = ("document_id", "filename")
+
+# 去重时记录的其他文件名，文档接口总是返回
+ALIASES_KEY = "aliases"
+
+
+class MetadataPolicy:
+    """
+    文档元数据策略
+
+    文档的完整元数据(如Markdown解析结果parsed_content)只在数据库的文档记录中保存一份，
+    分块通过document_id引用文档，不再复制整篇文档。三个白名单分别决定:
+    - node_keys: 复制到分块上的键，随分块保存在文档存储和向量库中
+    - embed_keys: 拼入向量化文本的键，其余键只保存不参与向量化
+    - source_keys: 查询结果sources中返回的键
+
+    白名单内的值序列化后超过max_value_bytes时同样不复制到分块上。
+    """
+
+    def __init__(
+        self,
+        node_keys: Sequence[str],
+        embed_keys: Sequence[str],
+        source_keys: Sequence[str],
+        max_value_bytes: int = 1024,
+    ):
+        self.node_keys = list(dict.fromkeys([*REQUIRED_NODE_KEYS, *node_keys]))
+        self.embed_keys = set(embed_keys)
+        self.source_keys = list(source_keys)
+        self.max_value_bytes = max_value_bytes
+
+    @classmethod
+    def from_settings(cls) -> "MetadataPolicy":
+        return cls(
+            node_keys=settings.METADATA_NODE_KEYS,
+            embed_keys=settings.METADATA_EMBED_KEYS,
+            source_keys=settings.METADATA_SOURCE_KEYS,
+            max_value_bytes=settings.METADATA_MAX_VALUE_BYTES,
+        )
+
+    def _size(self, value: Any) -> int:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+    def node_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """从文档元数据中选出复制到分块上的键"""
+        selected = {}
+        for key in self.node_keys:
+            if key not in metadata:
+                continue
+            value = metadata[key]
+            if key not in REQUIRED_NODE_KEYS and self._size(value) > self.max_value_bytes:
+                logger.warning(f"元数据 {key} 超过 {self.max_value_bytes} 字节，不复制到分块上")
+                continue
+            selected[key] = value
+        return selected
+
+    def excluded_embed_keys(self, metadata: Dict[str, Any]) -> List[str]:
+        """不参与向量化的键，LlamaIndex拼接向量化文本时跳过这些键"""
+        return [key for key in metadata if key not in self.embed_keys]
+
+    def source_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """查询结果中返回的元数据，旧版本摄入的分块上多余的键也在这里过滤掉"""
+        return {key: metadata[key] for key in self.source_keys if key in metadata}
+
+    def document_metadata(self, metadata: Dict[str, Any]) -> Dict[str, Any]:
+        """文档接口返回的元数据：source_keys中的键和别名，parsed_content等大字段只留在数据库中"""
+        return {key: metadata[key] for key in (*self.source_keys, ALIASES_KEY) if key in metadata}
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query_text: str) -> str:
+    """统一全半角和空白，使仅有格式差异的问题命中同一缓存项"""
+    return " ".join(unicodedata.normalize("NFKC", query_text).split())
+
+
+class QueryResultCache:
+    """
+    感知写入的查询结果缓存
+
+    缓存键包含站点的代数(generation)，文档新增、更新、删除时代数加一，
+    旧代数的缓存项不再被读到，由LRU或TTL自然淘汰，无需逐条失效。
+    代数保存在Redis中，API进程和摄入worker共享；未提供Redis客户端时退化为进程内计数。
+
+    两级缓存:
+    - 进程内LRU，命中时没有任何网络开销
+    - 可选的Redis层，多个API进程共享，按TTL过期
+    """
+
+    def __init__(
+        self,
+        client: Optional[aioredis.Redis] = None,
+        namespace: str = "simplerag:default:docs",
+        max_entries: int = 10_000,
+        ttl: int = 600,
+        use_redis: bool = True,
+    ):
+        self.client = client
+        self.generation_key = f"{namespace}:query_generation"
+        self.key_prefix = f"{namespace}:query_cache"
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.use_redis = use_redis and client is not None
+        self._local: "OrderedDict[str, str]" = OrderedDict()
+        self._local_generation = 0
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(query_text: str, **params: Any) -> str:
+        payload = json.dumps(
+            {"query": normalize_query(query_text), **params},
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def generation(self) -> int:
+        """读取当前代数，查询前读取一次，写入结果时使用同一个值"""
+        if self.client is None:
+            return self._local_generation
+        value = await self.client.get(self.generation_key)
+        return int(value or 0)
+
+    async def bump(self) -> None:
+        """使该站点所有已缓存的结果失效"""
+        if self.client is None:
+            self._local_generation += 1
+            return
+        await self.client.incr(self.generation_key)
+
+    async def get(self, key: str, generation: int) -> Optional[Dict[str, Any]]:
+        versioned_key = f"{generation}:{key}"
+        raw = self._local.get(versioned_key)
+        if raw is not None:
+            self._local.move_to_end(versioned_key)
+            self.local_hits += 1
+            return json.loads(raw)
+
+        if self.use_redis:
+            try:
+                raw = await self.client.get(f"{self.key_prefix}:{versioned_key}")
+            except Exception as e:
+                logger.warning(f"读取查询缓存失败: {e}")
+                raw = None
+            if raw is not None:
+                self._put_local(versioned_key, raw)
+                self.redis_hits += 1
+                return json.loads(raw)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, generation: int, result: Dict[str, Any]) -> None:
+        versioned_key = f"{generation}:{key}"
+        raw = json.dumps(result, ensure_ascii=False, default=str)
+        self._put_local(versioned_key, raw)
+        if self.use_redis:
+            try:
+                await self.client.set(f"{self.key_prefix}:{versioned_key}", raw, ex=self.ttl)
+            except Exception as e:
+                logger.warning(f"写入查询缓存失败: {e}")
+
+    def _put_local(self, versioned_key: str, raw: str) -> None:
+        self._local[versioned_key] = raw
+        self._local.move_to_end(versioned_key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.local_hits + self.redis_hits
+        total = hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "local_entries": len(self._local),
+        }
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.services.query_cache import normalize_query
+
+
+class QueryVectorCache:
+    """
+    查询向量缓存，(模型, 规范化查询) -> 稠密/稀疏查询向量
+
+    即使索引频繁写入导致查询结果无法缓存，同一问题的查询向量仍然可以复用，
+    每次重复查询省去一到两次远程编码请求。
+    稠密向量以float32字节串保存，稀疏向量保存为按下标排序的int32下标数组和float32权重数组。
+    进程内LRU，条目超过TTL后视为未命中。
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl: int = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # 同步编码路径可能在线程池中执行
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(kind: str, model: str, query: str) -> str:
+        return f"{kind}:{model}:{normalize_query(query)}"
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_dense(self, model: str, query: str) -> Optional[List[float]]:
+        raw = self._get(self._key("dense", model, query))
+        return np.frombuffer(raw, dtype=np.float32).tolist() if raw is not None else None
+
+    def set_dense(self, model: str, query: str, vector: Sequence[float]) -> None:
+        self._set(self._key("dense", model, query), np.asarray(vector, dtype=np.float32).tobytes())
+
+    def get_sparse(self, model: str, query: str) -> Optional[Dict[int, float]]:
+        entry = self._get(self._key("sparse", model, query))
+        if entry is None:
+            return None
+        indices, weights = entry
+        return dict(zip(indices.tolist(), weights.tolist()))
+
+    def set_sparse(self, model: str, query: str, vector: Dict[int, float]) -> None:
+        indices = np.fromiter(vector.keys(), dtype=np.int32, count=len(vector))
+        weights = np.fromiter(vector.values(), dtype=np.float32, count=len(vector))
+        order = np.argsort(indices)
+        self._set(self._key("sparse", model, query), (indices[order], weights[order]))
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+logger = logging.getLogger(__name__)
+
+
+class Reranker:
+    """
+    异步重排序客户端，兼容Jina格式的 /rerank 接口
+
+    每个IndexService持有一个实例，连接池在请求间复用；重排序请求在事件循环中异步等待，
+    不会阻塞同一进程内的其他查询。每次调用有独立的耗时预算，超时或出错时
+    回退到检索顺序并标记为降级，由调用方决定如何处理降级结果。
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str = "",
+        model: str = "bge-reranker-v2-m3",
+        timeout_ms: int = 800,
+        max_concurrency: int = 8,
+        latency_window: int = 1000,
+    ):
+        """
+        初始化函数
+
+        Args:
+            base_url: 重排序服务地址，请求发往 {base_url}/rerank
+            api_key: 服务的API密钥
+            model: 重排序模型名称
+            timeout_ms: 默认的单次调用耗时预算(毫秒)
+            max_concurrency: 连接池大小，同时在途的最大请求数
+            latency_window: 用于计算延迟分位数的最近调用数
+        """
+        self.endpoint = f"{base_url.rstrip('/')}/rerank"
+        self.model = model
+        self.timeout_ms = timeout_ms
+        self.max_concurrency = max_concurrency
+        self._headers = {"Accept-Encoding": "identity"}
+        if api_key:
+            self._headers["Authorization"] = f"Bearer {api_key}"
+        self._limits = httpx.Limits(
+            max_connections=max_concurrency,
+            max_keepalive_connections=max_concurrency,
+        )
+        # 异步客户端的连接池绑定事件循环，首次使用时按当前循环创建
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._latencies: "deque[float]" = deque(maxlen=latency_window)
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                headers=self._headers,
+                # 连接池耗尽时排队等待也计入预算，由调用方的超时统一控制
+                timeout=httpx.Timeout(None),
+                limits=self._limits,
+            )
+            self._loop = loop
+        return self._client
+
+    async def warmup(self) -> None:
+        """提前创建连接池，首次创建需要同步加载证书，不应发生在查询路径上"""
+        self._get_client()
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+    async def _request(
+        self, client: httpx.AsyncClient, query: str, nodes: List[NodeWithScore], top_n: int
+    ) -> List[NodeWithScore]:
+        response = await client.post(
+            self.endpoint,
+            json={
+                "query": query,
+                "documents": [node.node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes],
+                "model": self.model,
+                "top_n": top_n,
+            },
+        )
+        response.raise_for_status()
+        body = response.json()
+        if "results" not in body:
+            raise RuntimeError(body.get("detail", body))
+        return [
+            NodeWithScore(node=nodes[result["index"]].node, score=result["relevance_score"])
+            for result in body["results"]
+        ]
+
+    async def arerank(
+        self,
+        query: str,
+        nodes: List[NodeWithScore],
+        top_n: int,
+        timeout_ms: Optional[int] = None,
+    ) -> Tuple[List[NodeWithScore], bool]:
+        """
+        在耗时预算内重排序
+
+        Args:
+            query: 查询文本
+            nodes: 检索得到的候选节点
+            top_n: 重排序返回的最大节点数
+            timeout_ms: 本次调用的耗时预算(毫秒)，为空时使用实例默认值
+
+        Returns:
+            Tuple[List[NodeWithScore], bool]: 节点列表，以及是否降级为检索顺序
+        """
+        if not nodes:
+            return [], False
+
+        budget = (timeout_ms or self.timeout_ms) / 1000
+        # 未预热时首次创建客户端需要加载证书，不计入耗时预算
+        client = self._get_client()
+        start = time.perf_counter()
+        try:
+            reranked = await asyncio.wait_for(self._request(client, query, nodes, top_n), timeout=budget)
+            return reranked, False
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"重排序超过耗时预算 {budget * 1000:.0f}ms，使用检索顺序")
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"重排序失败，使用检索顺序: {e}")
+        finally:
+            self.calls += 1
+            self._latencies.append((time.perf_counter() - start) * 1000)
+        return nodes[:top_n], True
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = np.fromiter(self._latencies, dtype=np.float64, count=len(self._latencies))
+        fallbacks = self.timeouts + self.errors
+        return {
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "fallback_rate": fallbacks / self.calls if self.calls else 0.0,
+            "latency_ms_p50": float(np.percentile(latencies, 50)) if latencies.size else None,
+            "latency_ms_p95": float(np.percentile(latencies, 95)) if latencies.size else None,
+        }
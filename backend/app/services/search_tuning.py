@@ -0,0 +1,136 @@
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import redis.asyncio as aioredis
+
+from app.services.hybrid_search import DEFAULT_FUSION_PARAMS, HybridSearcher, fuse
+
+logger = logging.getLogger(__name__)
+
+# 检索参数默认值，依次被站点默认值、延迟目标选出的配置和请求参数覆盖
+DEFAULT_SEARCH_PARAMS: Dict[str, Any] = {
+    **DEFAULT_FUSION_PARAMS,
+    "ef": None,
+    "rerank_top_k": 10,
+    "latency_target_ms": None,
+}
+
+# 校准结果在进程内的缓存时间，其他进程重新校准后最迟在这之后生效
+CALIBRATION_RELOAD_SECONDS = 60
+
+
+def resolve_search_params(
+    defaults: Dict[str, Any], *layers: Optional[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """在默认值上按顺序叠加各层参数，后面的层覆盖前面的层，值为None的项视为未设置"""
+    params = dict(defaults)
+    for layer in layers:
+        params.update({key: value for key, value in (layer or {}).items() if value is not None})
+    return params
+
+
+class SearchCalibration:
+    """
+    检索参数的延迟校准表
+
+    对一组候选配置(ef、每路候选数、重排序数)在线上集合上实测检索延迟，
+    并以最深的配置为基准计算相对召回率。按延迟目标选择时，在p95延迟不超过目标的配置中
+    取召回率最高的一个；没有配置满足目标时取最快的一个。
+    校准表保存在Redis中，同一站点的所有API进程共享。
+    """
+
+    def __init__(self, client: aioredis.Redis, namespace: str, profiles: List[Dict[str, int]]):
+        self.client = client
+        self.key = f"{namespace}:search_calibration"
+        self.profiles = profiles
+        self._table: Optional[List[Dict[str, Any]]] = None
+        self._loaded_at = 0.0
+
+    async def aload(self) -> Optional[List[Dict[str, Any]]]:
+        """读取校准表，尚未校准时返回None"""
+        if self._table is None or time.monotonic() - self._loaded_at > CALIBRATION_RELOAD_SECONDS:
+            raw = await self.client.get(self.key)
+            self._table = json.loads(raw) if raw is not None else None
+            self._loaded_at = time.monotonic()
+        return self._table
+
+    async def apick(self, latency_target_ms: float) -> Optional[Dict[str, int]]:
+        """按延迟目标选择检索配置，尚未校准时返回None"""
+        table = await self.aload()
+        if not table:
+            return None
+        within = [row for row in table if row["latency_ms_p95"] <= latency_target_ms]
+        if within:
+            row = max(within, key=lambda row: (row["recall"], -row["latency_ms_p95"]))
+        else:
+            row = min(table, key=lambda row: row["latency_ms_p95"])
+        return {key: row[key] for key in ("ef", "candidate_k", "rerank_top_k")}
+
+    async def acalibrate(
+        self,
+        searcher: HybridSearcher,
+        sample_size: int = 50,
+        top_k: int = 5,
+    ) -> List[Dict[str, Any]]:
+        """
+        在线上集合上测量每个候选配置
+
+        样本查询取自集合中已存储的向量，逐条串行检索以测量单次查询的延迟，
+        只覆盖检索阶段，不含查询编码和重排序。
+
+        Args:
+            searcher: 站点的混合检索器
+            sample_size: 样本查询数
+            top_k: 计算召回率时比较的结果数
+
+        Returns:
+            List[Dict[str, Any]]: 每个配置的p50/p95延迟(毫秒)和相对召回率
+        """
+        dense, sparse = await searcher.asample_vectors(sample_size)
+        if not dense:
+            raise ValueError("集合中没有向量，无法校准")
+
+        async def run(profile: Dict[str, int]):
+            latencies, results = [], []
+            for i, vector in enumerate(dense):
+                start = time.perf_counter()
+                dense_results, sparse_results = await searcher.asearch(
+                    [vector],
+                    [sparse[i]] if sparse is not None else None,
+                    profile["candidate_k"],
+                    ef=profile["ef"],
+                )
+                latencies.append((time.perf_counter() - start) * 1000)
+                fused = fuse(
+                    dense_results[0],
+                    sparse_results[0] if sparse_results is not None else None,
+                    DEFAULT_FUSION_PARAMS,
+                )
+                results.append([result.node.node_id for result in fused[:top_k]])
+            return np.asarray(latencies), results
+
+        deepest = max(self.profiles, key=lambda profile: (profile["ef"], profile["candidate_k"]))
+        _, reference = await run(deepest)
+
+        table = []
+        for profile in self.profiles:
+            latencies, results = await run(profile)
+            recall = np.mean([
+                len(set(ids) & set(expected)) / len(expected) if expected else 1.0
+                for ids, expected in zip(results, reference)
+            ])
+            table.append({
+                **profile,
+                "latency_ms_p50": round(float(np.percentile(latencies, 50)), 2),
+                "latency_ms_p95": round(float(np.percentile(latencies, 95)), 2),
+                "recall": round(float(recall), 4),
+            })
+            logger.info(f"检索参数校准: {table[-1]}")
+
+        await self.client.set(self.key, json.dumps(table))
+        self._table = table
+        self._loaded_at = time.monotonic()
+        return table
@@ -0,0 +1,90 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List
+
+
+class SingleFlight:
+    """
+    合并并发的相同请求
+
+    同一个键同时只有一次执行，执行期间到达的相同请求等待这次执行的结果，
+    不会重复调用嵌入、检索和重排序服务。执行结束后键即被移除，之后的请求重新执行，
+    因此不会返回过期结果。
+
+    执行放在独立的任务中，发起请求的客户端断开也不会取消其他等待者共享的执行。
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do_many(
+        self,
+        keys: List[str],
+        fn: Callable[[List[int]], Awaitable[List[Any]]],
+    ) -> List[Any]:
+        """
+        按键合并执行一批请求
+
+        Args:
+            keys: 每个请求的键
+            fn: 执行函数，参数为本次需要执行的请求在keys中的位置，按相同顺序返回结果
+
+        Returns:
+            List[Any]: 与keys顺序一致的结果
+        """
+        loop = asyncio.get_running_loop()
+        futures = []
+        owned = []
+        for i, key in enumerate(keys):
+            future = self._calls.get(key)
+            if future is None:
+                future = loop.create_future()
+                self._calls[key] = future
+                owned.append(i)
+                self.executed += 1
+            else:
+                self.coalesced += 1
+            futures.append(future)
+
+        if owned:
+            task = asyncio.ensure_future(fn(owned))
+            task.add_done_callback(
+                lambda done: self._resolve(
+                    [keys[i] for i in owned], [futures[i] for i in owned], done
+                )
+            )
+
+        # shield使调用方被取消时不影响共享的结果
+        results = await asyncio.gather(
+            *(asyncio.shield(future) for future in futures), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+    def _resolve(self, keys: List[str], futures: List[asyncio.Future], task: asyncio.Future) -> None:
+        for position, (key, future) in enumerate(zip(keys, futures)):
+            if self._calls.get(key) is future:
+                del self._calls[key]
+            if future.done():
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result()[position])
+
+    def forget(self) -> None:
+        """不再合并到进行中的执行，用于索引写入后，使之后的请求读到新数据"""
+        self._calls.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.executed + self.coalesced
+        return {
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "coalesce_rate": self.coalesced / total if total else 0.0,
+        }
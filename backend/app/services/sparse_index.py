@@ -0,0 +1,474 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from app.services.atomic_files import fsync_file, recover_files, replace_files, staged_path
+from app.services.dir_lock import DirectoryLock
+
+logger = logging.getLogger(__name__)
+
+POSTINGS_FILE = "postings.bin"
+LOG_FILE = "docs.jsonl"
+
+# 作废行超过总行数的这个比例时压缩
+COMPACT_RATIO = 0.5
+COMPACT_MIN_ROWS = 1024
+
+# 倒排文件中的一条记录：词id和权重
+ENTRY_DTYPE = np.dtype([("token", "<u4"), ("weight", "<f4")])
+
+
+class _PostingList:
+    """单个词的倒排表，行号递增追加，容量按倍数增长"""
+
+    __slots__ = ("rows", "weights", "size", "max_weight")
+
+    def __init__(self):
+        self.rows = np.empty(8, dtype=np.int32)
+        self.weights = np.empty(8, dtype=np.float32)
+        self.size = 0
+        self.max_weight = 0.0
+
+    def extend(self, rows: np.ndarray, weights: np.ndarray) -> None:
+        end = self.size + len(rows)
+        if end > len(self.rows):
+            capacity = max(end, len(self.rows) * 2)
+            self.rows = np.resize(self.rows, capacity)
+            self.weights = np.resize(self.weights, capacity)
+        self.rows[self.size:end] = rows
+        self.weights[self.size:end] = weights
+        self.size = end
+        self.max_weight = max(self.max_weight, float(weights.max()))
+
+
+class SparseInvertedIndex:
+    """
+    进程内稀疏倒排索引，保存BGE-M3稀疏向量，不依赖Milvus的SPARSE_INVERTED_INDEX
+
+    每个词的倒排表是两段连续数组(行号、权重)，检索按词逐个累加得分(term-at-a-time)，
+    并用MaxScore方式剪枝：词按得分上界从大到小处理，剩余词的上界之和小于当前第k名得分后，
+    未出现过的行不可能进入前k名，之后的词只更新已有的候选行。
+
+    行号是内部编号，与节点ID一一对应；删除只作废行，作废行过多时整体压缩。
+    指定persist_dir时词和权重追加写入二进制文件，节点和删除操作追加写入日志，
+    日志是提交标记：重启时按日志回放，日志之外的残留记录被丢弃。
+    persist_dir同一时间只能由一个进程打开，打开时加独占锁，close后释放。
+    """
+
+    def __init__(self, persist_dir: Optional[str] = None):
+        """
+        初始化函数
+
+        Args:
+            persist_dir: 持久化目录，为None时只保存在内存中
+        """
+        self.persist_dir = persist_dir
+        self._lock = threading.RLock()
+        self._postings_file = None
+        self._log = None
+        self._dir_lock = None
+        self._reset()
+        if persist_dir is not None:
+            os.makedirs(persist_dir, exist_ok=True)
+            self._dir_lock = DirectoryLock(persist_dir)
+            try:
+                self._load()
+            except Exception:
+                self._dir_lock.release()
+                raise
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ---- 存储 ----
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_dir, name)
+
+    def _reset(self) -> None:
+        self._postings: Dict[int, _PostingList] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._count = 0
+        self._row_ids: List[Optional[str]] = []
+        self._row_refs: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._ref_rows: Dict[str, Set[int]] = {}
+        # 已写入倒排文件的记录数，即下一批记录的偏移
+        self._offset = 0
+
+    def _load(self) -> None:
+        """回放日志，一次读入倒排文件并按词分组重建倒排表"""
+        recover_files(self.persist_dir, (POSTINGS_FILE, LOG_FILE))
+        log_path = self._path(LOG_FILE)
+        if not os.path.exists(log_path):
+            return
+        adds = []
+        deletes = []
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry["op"] == "add":
+                    adds.append(entry)
+                else:
+                    deletes.append(entry["rows"])
+        if not adds:
+            return
+
+        end = max(entry["offset"] + entry["length"] for entry in adds)
+        entries = np.fromfile(self._path(POSTINGS_FILE), dtype=ENTRY_DTYPE, count=end)
+        # 丢弃未提交的尾部记录
+        with open(self._path(POSTINGS_FILE), "r+b") as f:
+            f.truncate(end * ENTRY_DTYPE.itemsize)
+        rows = np.empty(end, dtype=np.int32)
+        for entry in adds:
+            rows[entry["offset"]:entry["offset"] + entry["length"]] = entry["row"]
+
+        self._count = max(entry["row"] for entry in adds) + 1
+        self._alive = np.zeros(self._count, dtype=bool)
+        self._row_ids = [None] * self._count
+        self._row_refs = [None] * self._count
+        self._offset = end
+        for entry in adds:
+            self._register(entry["row"], entry["id"], entry["ref"])
+        for rows_to_delete in deletes:
+            self._invalidate(rows_to_delete)
+        self._index(rows, entries["token"], entries["weight"])
+
+    def _index(self, rows: np.ndarray, tokens: np.ndarray, weights: np.ndarray) -> None:
+        """按词分组后整段追加到倒排表，同一词内保持行号递增"""
+        # 权重为0的词对得分没有贡献，不进入倒排表
+        keep = weights > 0
+        rows, tokens, weights = rows[keep], tokens[keep], weights[keep]
+        if not len(rows):
+            return
+        order = np.lexsort((rows, tokens))
+        rows, tokens, weights = rows[order], tokens[order], weights[order]
+        bounds = np.flatnonzero(np.diff(tokens)) + 1
+        starts = np.concatenate(([0], bounds))
+        ends = np.concatenate((bounds, [len(tokens)]))
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            token = int(tokens[start])
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = _PostingList()
+            postings.extend(rows[start:end], weights[start:end])
+
+    def _register(self, row: int, node_id: str, ref_doc_id: Optional[str]) -> None:
+        previous = self._rows.get(node_id)
+        if previous is not None:
+            self._invalidate([previous])
+        self._row_ids[row] = node_id
+        self._row_refs[row] = ref_doc_id
+        self._rows[node_id] = row
+        self._ref_rows.setdefault(ref_doc_id, set()).add(row)
+        self._alive[row] = True
+
+    def _invalidate(self, rows: Sequence[int]) -> None:
+        for row in rows:
+            node_id = self._row_ids[row]
+            if node_id is None:
+                continue
+            ref_doc_id = self._row_refs[row]
+            self._ref_rows[ref_doc_id].discard(row)
+            if not self._ref_rows[ref_doc_id]:
+                del self._ref_rows[ref_doc_id]
+            del self._rows[node_id]
+            self._row_ids[row] = None
+            self._row_refs[row] = None
+            self._alive[row] = False
+
+    def _append(self, entries: np.ndarray, log_entries: List[Dict[str, Any]]) -> None:
+        if self.persist_dir is None:
+            return
+        if self._postings_file is None:
+            self._postings_file = open(self._path(POSTINGS_FILE), "ab")
+            self._log = open(self._path(LOG_FILE), "a", encoding="utf-8")
+        if len(entries):
+            self._postings_file.write(entries.tobytes())
+            self._postings_file.flush()
+        # 倒排记录落盘后再写日志，日志中的记录总是完整的
+        self._log.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in log_entries))
+        self._log.flush()
+
+    def _close_files(self) -> None:
+        if self._postings_file is not None:
+            self._postings_file.close()
+            self._log.close()
+            self._postings_file = None
+            self._log = None
+
+    def _remove_files(self) -> None:
+        self._close_files()
+        for name in (POSTINGS_FILE, LOG_FILE):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+
+    def _maybe_compact(self) -> None:
+        """
+        作废行过多时只保留有效行，按新行号重建倒排表并重写文件
+
+        新文件先完整写入并fsync，再一起替换旧文件，压缩中途失败或崩溃时旧文件保持不变。
+        """
+        dead = self._count - len(self._rows)
+        if dead < COMPACT_MIN_ROWS or dead < self._count * COMPACT_RATIO:
+            return
+        live = np.flatnonzero(self._alive)
+        remap = np.full(self._count, -1, dtype=np.int32)
+        remap[live] = np.arange(len(live), dtype=np.int32)
+        rows = [np.empty(0, dtype=np.int32)]
+        tokens = [np.empty(0, dtype=np.uint32)]
+        weights = [np.empty(0, dtype=np.float32)]
+        for token, postings in self._postings.items():
+            keep = self._alive[postings.rows[:postings.size]]
+            rows.append(remap[postings.rows[:postings.size][keep]])
+            tokens.append(np.full(int(keep.sum()), token, dtype=np.uint32))
+            weights.append(postings.weights[:postings.size][keep])
+        rows, tokens, weights = np.concatenate(rows), np.concatenate(tokens), np.concatenate(weights)
+        order = np.lexsort((tokens, rows))
+        node_ids = [self._row_ids[row] for row in live.tolist()]
+        ref_doc_ids = [self._row_refs[row] for row in live.tolist()]
+        lengths = np.bincount(rows, minlength=len(live)).tolist()
+        if self.persist_dir is None:
+            self._reset()
+            if node_ids:
+                self._write(node_ids, ref_doc_ids, lengths, tokens[order], weights[order])
+            return
+        entries = np.empty(len(order), dtype=ENTRY_DTYPE)
+        entries["token"] = tokens[order]
+        entries["weight"] = weights[order]
+        log_entries, _ = self._log_entries(0, 0, node_ids, ref_doc_ids, lengths)
+        try:
+            with open(staged_path(self.persist_dir, POSTINGS_FILE), "wb") as f:
+                f.write(entries.tobytes())
+                fsync_file(f)
+            with open(staged_path(self.persist_dir, LOG_FILE), "w", encoding="utf-8") as f:
+                f.write("".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in log_entries))
+                fsync_file(f)
+        except OSError as e:
+            # 未提交的新文件直接丢弃，继续使用旧文件，下次删除时再尝试压缩
+            logger.warning(f"稀疏索引压缩失败，保留原文件: {e}")
+            recover_files(self.persist_dir, (POSTINGS_FILE, LOG_FILE))
+            return
+        self._close_files()
+        replace_files(self.persist_dir, (POSTINGS_FILE, LOG_FILE))
+        self._reset()
+        self._load()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_files()
+            if self._dir_lock is not None:
+                self._dir_lock.release()
+
+    # ---- 写入和删除 ----
+
+    @staticmethod
+    def _log_entries(
+        start: int,
+        offset: int,
+        node_ids: Sequence[str],
+        ref_doc_ids: Sequence[Optional[str]],
+        lengths: Sequence[int],
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """一批节点的日志记录，节点从start行、记录从offset开始编号，同时返回下一批的偏移"""
+        log_entries = []
+        for i, (node_id, ref_doc_id, length) in enumerate(zip(node_ids, ref_doc_ids, lengths)):
+            log_entries.append(
+                {"op": "add", "row": start + i, "id": node_id, "ref": ref_doc_id, "offset": offset, "length": length}
+            )
+            offset += length
+        return log_entries, offset
+
+    def _write(
+        self,
+        node_ids: Sequence[str],
+        ref_doc_ids: Sequence[Optional[str]],
+        lengths: Sequence[int],
+        tokens: np.ndarray,
+        weights: np.ndarray,
+    ) -> None:
+        """追加一批节点，tokens和weights按节点顺序连续排列，每个节点占lengths中对应的条数"""
+        start = self._count
+        entries = np.empty(len(tokens), dtype=ENTRY_DTYPE)
+        entries["token"] = tokens
+        entries["weight"] = weights
+        rows = np.repeat(np.arange(start, start + len(node_ids), dtype=np.int32), lengths)
+
+        log_entries, offset = self._log_entries(start, self._offset, node_ids, ref_doc_ids, lengths)
+        self._append(entries, log_entries)
+        self._offset = offset
+
+        self._count = start + len(node_ids)
+        alive = np.zeros(self._count, dtype=bool)
+        alive[:start] = self._alive
+        self._alive = alive
+        self._row_ids.extend([None] * len(node_ids))
+        self._row_refs.extend([None] * len(node_ids))
+        for i, (node_id, ref_doc_id) in enumerate(zip(node_ids, ref_doc_ids)):
+            self._register(start + i, node_id, ref_doc_id)
+        self._index(rows, entries["token"], entries["weight"])
+
+    def add(
+        self,
+        node_ids: Sequence[str],
+        ref_doc_ids: Sequence[Optional[str]],
+        vectors: Sequence[Dict[int, float]],
+    ) -> None:
+        """
+        写入节点的稀疏向量，节点ID已存在时替换旧向量
+
+        Args:
+            node_ids: 节点ID
+            ref_doc_ids: 节点所属文档ID，用于按文档删除
+            vectors: BGE-M3稀疏向量(词id -> 权重)
+        """
+        if not node_ids:
+            return
+        lengths = [len(vector) for vector in vectors]
+        tokens = np.fromiter(
+            (token for vector in vectors for token in vector), dtype=np.uint32, count=sum(lengths)
+        )
+        weights = np.fromiter(
+            (weight for vector in vectors for weight in vector.values()), dtype=np.float32, count=sum(lengths)
+        )
+        with self._lock:
+            self._write(node_ids, ref_doc_ids, lengths, tokens, weights)
+            self._maybe_compact()
+
+    def _delete_rows(self, rows: Sequence[int]) -> None:
+        rows = sorted(row for row in rows if self._row_ids[row] is not None)
+        if not rows:
+            return
+        self._invalidate(rows)
+        self._append(np.empty(0, dtype=ENTRY_DTYPE), [{"op": "delete", "rows": rows}])
+        self._maybe_compact()
+
+    def delete(self, ref_doc_id: str) -> None:
+        """删除一篇文档的全部节点"""
+        self.delete_refs([ref_doc_id])
+
+    def delete_refs(self, ref_doc_ids: Sequence[str]) -> None:
+        """删除多篇文档的全部节点"""
+        with self._lock:
+            self._delete_rows([row for ref_doc_id in ref_doc_ids for row in self._ref_rows.get(ref_doc_id, ())])
+
+    def delete_nodes(self, node_ids: Sequence[str]) -> None:
+        with self._lock:
+            self._delete_rows([self._rows[node_id] for node_id in node_ids if node_id in self._rows])
+
+    def clear(self) -> None:
+        with self._lock:
+            if self.persist_dir is not None:
+                self._remove_files()
+            self._reset()
+
+    async def async_add(
+        self,
+        node_ids: Sequence[str],
+        ref_doc_ids: Sequence[Optional[str]],
+        vectors: Sequence[Dict[int, float]],
+    ) -> None:
+        await asyncio.to_thread(self.add, node_ids, ref_doc_ids, vectors)
+
+    async def adelete(self, ref_doc_id: str) -> None:
+        await asyncio.to_thread(self.delete, ref_doc_id)
+
+    async def adelete_refs(self, ref_doc_ids: Sequence[str]) -> None:
+        await asyncio.to_thread(self.delete_refs, ref_doc_ids)
+
+    async def adelete_nodes(self, node_ids: Sequence[str]) -> None:
+        await asyncio.to_thread(self.delete_nodes, node_ids)
+
+    async def aclear(self) -> None:
+        await asyncio.to_thread(self.clear)
+
+    # ---- 检索 ----
+
+    @staticmethod
+    def _kth_score(scores: np.ndarray, k: int) -> float:
+        if len(scores) < k:
+            return 0.0
+        return float(np.partition(scores, len(scores) - k)[len(scores) - k])
+
+    def _search(self, query: Dict[int, float], top_k: int) -> List[Tuple[str, float]]:
+        terms = []
+        for token, weight in query.items():
+            postings = self._postings.get(token)
+            if postings is not None and postings.size and weight > 0:
+                terms.append((weight * postings.max_weight, weight, postings))
+        if not terms or top_k <= 0 or not self._rows:
+            return []
+        terms.sort(key=lambda term: term[0], reverse=True)
+
+        # 作废行的得分固定为-inf，不参与第k名的计算，也不会被返回
+        if len(self._rows) == self._count:
+            scores = np.zeros(self._count, dtype=np.float32)
+        else:
+            scores = np.where(self._alive, np.float32(0), np.float32(-np.inf))
+        remaining = sum(term[0] for term in terms)
+        processed = 0.0
+        candidates = None
+        for upper_bound, weight, postings in terms:
+            remaining -= upper_bound
+            processed += upper_bound
+            rows = postings.rows[:postings.size]
+            if candidates is None:
+                scores[rows] += weight * postings.weights[:postings.size]
+                # 第k名得分不会超过已处理词的上界之和，此时不必计算
+                if remaining >= processed:
+                    continue
+                # 剩余词的上界之和不足以让未出现过的行超过第k名时，只保留可能进入前k名的行
+                threshold = self._kth_score(scores, top_k)
+                if threshold > 0 and remaining < threshold:
+                    candidates = np.flatnonzero(scores + remaining >= threshold)
+            else:
+                positions = np.searchsorted(rows, candidates)
+                positions[positions == len(rows)] = 0
+                hit = rows[positions] == candidates
+                scores[candidates[hit]] += weight * postings.weights[positions[hit]]
+                threshold = self._kth_score(scores[candidates], top_k)
+                candidates = candidates[scores[candidates] + remaining >= threshold]
+
+        if candidates is None:
+            candidates = np.flatnonzero(scores > 0)
+        candidate_scores = scores[candidates]
+        k = min(top_k, len(candidates))
+        if k == 0:
+            return []
+        top = np.argpartition(-candidate_scores, k - 1)[:k]
+        top = top[np.argsort(-candidate_scores[top], kind="stable")]
+        return [(self._row_ids[candidates[i]], float(candidate_scores[i])) for i in top.tolist()]
+
+    def search(self, query: Dict[int, float], top_k: int) -> List[Tuple[str, float]]:
+        """
+        检索与稀疏查询向量内积最大的节点
+
+        Returns:
+            List[Tuple[str, float]]: 按得分降序的(节点ID, 内积)
+        """
+        with self._lock:
+            return self._search(query, top_k)
+
+    def search_many(self, queries: Sequence[Dict[int, float]], top_k: int) -> List[List[Tuple[str, float]]]:
+        with self._lock:
+            return [self._search(query, top_k) for query in queries]
+
+    async def asearch_many(
+        self, queries: Sequence[Dict[int, float]], top_k: int
+    ) -> List[List[Tuple[str, float]]]:
+        return await asyncio.to_thread(self.search_many, queries, top_k)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "nodes": len(self._rows),
+                "terms": len(self._postings),
+                "postings": sum(postings.size for postings in self._postings.values()),
+            }
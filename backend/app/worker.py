@@ -0,0 +1,162 @@
+"""
+文档摄入worker
+
+从Redis Stream消费上传接口创建的摄入任务，执行向量化和Milvus写入。
+可以启动多个进程水平扩展，每个进程内的并行任务数由 --concurrency 控制:
+
+    python -m app.worker --concurrency 4
+
+使用numpy向量库或本地稀疏索引的站点数据只能由一个进程打开，这些站点的任务不写入Stream，
+由API进程通过run_local_job直接执行，worker不处理。
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+from typing import Optional, Set
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, async_engine
+from app.models.document import Document
+from app.services.index_service import IndexServiceFactory
+from app.services.job_service import IngestionJobQueue
+
+logger = logging.getLogger(__name__)
+
+# 在API进程中执行的摄入任务，关闭时等待完成
+_local_jobs: Set[asyncio.Task] = set()
+_local_slots: Optional[asyncio.Semaphore] = None
+
+
+async def process_job(queue: IngestionJobQueue, job_id: str) -> None:
+    """执行单个摄入任务"""
+    job = await queue.get_job(job_id)
+    if job is None:
+        logger.warning(f"任务不存在或已过期: {job_id}")
+        return
+
+    await queue.mark_running(job_id)
+    try:
+        # 只在读取文档时占用连接，向量化和写入期间连接已归还连接池
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Document).where(Document.id.in_(job["document_ids"])))
+            documents = list(result.scalars())
+        if not documents:
+            raise ValueError(f"文档不存在: {job['document_ids']}")
+
+        # 同一任务的文档一次性送入摄入引擎，切分、向量化和写入跨文档流水线执行
+        # 首次创建实例会同步连接Milvus，放到线程中执行，不阻塞其他任务
+        index_service = await asyncio.to_thread(IndexServiceFactory.get_instance, job["site_id"])
+        await index_service.add_documents(
+            documents,
+            progress_callback=lambda stage, count: queue.record_progress(job_id, stage, count),
+        )
+        await queue.mark_completed(job_id)
+    except Exception as e:
+        logger.exception(f"摄入任务失败: {job_id}")
+        await queue.mark_failed(job_id, str(e))
+
+
+async def keep_alive(queue: IngestionJobQueue, consumer: str, message_id: str) -> None:
+    """任务执行期间定期续期消息，避免超过认领空闲时间后被其他worker重复执行"""
+    interval = settings.INGEST_JOB_CLAIM_IDLE_MS / 3 / 1000
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await queue.heartbeat(consumer, message_id)
+        except Exception as e:
+            logger.warning(f"任务消息续期失败: {message_id}: {e}")
+
+
+def run_local_job(queue: IngestionJobQueue, job_id: str) -> None:
+    """
+    在当前进程的后台执行摄入任务，用于数据保存在进程内的站点(IndexService.indexes_in_process)
+
+    同时执行的任务数不超过INGEST_WORKER_CONCURRENCY，其余任务排队等待。
+    任务没有写入Stream，进程在执行期间退出时任务不会被重新投递，需要重新上传。
+    """
+    global _local_slots
+    if _local_slots is None:
+        _local_slots = asyncio.Semaphore(settings.INGEST_WORKER_CONCURRENCY)
+
+    async def run() -> None:
+        async with _local_slots:
+            await process_job(queue, job_id)
+
+    task = asyncio.create_task(run())
+    _local_jobs.add(task)
+    task.add_done_callback(_local_jobs.discard)
+
+
+async def wait_local_jobs() -> None:
+    """等待run_local_job提交的任务全部完成"""
+    if _local_jobs:
+        await asyncio.gather(*_local_jobs, return_exceptions=True)
+
+
+async def run_worker(concurrency: int) -> None:
+    queue = IngestionJobQueue.from_settings()
+    await queue.ensure_group()
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    running = set()
+    logger.info(f"摄入worker已启动: {consumer}, 并发数 {concurrency}")
+
+    async def handle(message_id: str, job_id: str) -> None:
+        # 反复导致worker崩溃(如超大文件OOM)的任务不再无限重试
+        deliveries = await queue.delivery_count(message_id)
+        if deliveries > settings.INGEST_JOB_MAX_DELIVERIES:
+            logger.error(f"任务投递 {deliveries} 次仍未完成，转入死信队列: {job_id}")
+            await queue.mark_failed(job_id, f"任务投递 {deliveries} 次仍未完成")
+            await queue.dead_letter(message_id, job_id)
+            return
+
+        heartbeat = asyncio.create_task(keep_alive(queue, consumer, message_id))
+        try:
+            await process_job(queue, job_id)
+        finally:
+            heartbeat.cancel()
+        await queue.ack(message_id)
+
+    try:
+        while True:
+            # 只拉取空闲槽位数量的消息，其余消息留在Stream中供其他worker消费
+            if len(running) >= concurrency:
+                await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            free = concurrency - len(running)
+
+            messages = await queue.claim_stale(
+                consumer, settings.INGEST_JOB_CLAIM_IDLE_MS, free
+            )
+            if len(messages) < free:
+                messages += await queue.read(consumer, free - len(messages), block_ms=5000)
+
+            for message_id, job_id in messages:
+                task = asyncio.create_task(handle(message_id, job_id))
+                running.add(task)
+                task.add_done_callback(running.discard)
+    finally:
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+        await IndexServiceFactory.close_all()
+        await queue.close()
+        await async_engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SimpleRAG 文档摄入worker")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.INGEST_WORKER_CONCURRENCY,
+        help="每个进程同时处理的任务数",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
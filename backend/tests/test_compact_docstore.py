@@ -0,0 +1,51 @@
+import json
+
+from llama_index.core import Document as LlamaDocument
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.storage.docstore.utils import doc_to_json
+
+from app.migrate_docstore import FORMAT_COMPACT, FORMAT_JSON, _convert
+from app.services.custom.compact_docstore import NodeCodec
+
+
+def test_node_codec_round_trip_is_lossless_and_smaller():
+    """测试紧凑编码还原出完全相同的节点，正文只保存一份并被压缩"""
+    codec = NodeCodec(min_compress_bytes=256)
+    text = "# 标题\n\n" + "包含\"引号\"和换行的正文。\n" * 100
+    document = LlamaDocument(
+        text=text,
+        id_="default:1",
+        metadata={"document_id": 1, "filename": "a.md"},
+        excluded_embed_metadata_keys=["document_id"],
+    )
+    node = TextNode(text="short chunk", id_="default:1:abc:0", start_char_idx=3, end_char_idx=14)
+    node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id="default:1")
+
+    for original in (document, node, LlamaDocument(text="", id_="default:2")):
+        legacy = json.dumps(doc_to_json(original)).encode()
+        encoded = codec.encode(doc_to_json(original))
+        decoded = codec.decode_node(encoded)
+        assert type(decoded) is type(original)
+        assert decoded.to_dict() == original.to_dict()
+        assert decoded.hash == original.hash
+        assert len(encoded) < len(legacy)
+        # 迁移完成前的JSON记录仍可读取
+        assert codec.decode_node(legacy).to_dict() == original.to_dict()
+
+    assert len(codec.encode(doc_to_json(document))) < len(text.encode()) / 10
+    assert NodeCodec(compression="none").decode_node(codec.encode(doc_to_json(document))).text == text
+
+
+def test_migration_converts_between_formats_once():
+    """测试迁移只改写非目标格式的记录，并能改写回JSON"""
+    codec = NodeCodec()
+    document = LlamaDocument(text="hello world", id_="default:1")
+    legacy = json.dumps(doc_to_json(document)).encode()
+
+    compact = _convert(codec, legacy, FORMAT_COMPACT)
+    assert codec.is_compact(compact)
+    assert _convert(codec, compact, FORMAT_COMPACT) is None
+
+    restored = _convert(codec, compact, FORMAT_JSON)
+    assert json.loads(restored) == json.loads(legacy)
+    assert _convert(codec, restored, FORMAT_JSON) is None
@@ -0,0 +1,140 @@
+import asyncio
+import json
+
+import fakeredis
+from redis.asyncio.client import Pipeline
+from redis.exceptions import WatchError
+
+from app.services.document_index import SiteDocumentIndex
+
+
+def _index(server):
+    return SiteDocumentIndex(fakeredis.FakeAsyncRedis(server=server), "simplerag:test:docs")
+
+
+def test_document_index_upsert_overwrites_and_remove_updates_stats():
+    """测试覆盖写入按新旧摘要的差值更新累计值，删除后累计值扣回"""
+    index = _index(fakeredis.FakeServer())
+
+    async def run():
+        await index.aupsert({
+            "default:1": SiteDocumentIndex.make_entry(1, "a.md", "one two three", 2),
+            "default:2": SiteDocumentIndex.make_entry(2, "b.md", "four five", 1),
+        })
+        assert await index.astats() == {"documents": 2, "chunks": 3, "tokens": 5}
+
+        # 更新同一文档不增加文档数
+        await index.aupsert({"default:1": SiteDocumentIndex.make_entry(1, "a.md", "one", 4)})
+        assert await index.astats() == {"documents": 2, "chunks": 5, "tokens": 3}
+        listed = await index.alist()
+        assert [(doc["id"], doc["chunks"]) for doc in listed["documents"]] == [("default:1", 4), ("default:2", 1)]
+
+        # 不存在的文档不影响累计值
+        await index.aremove(["default:1", "default:9"])
+        assert await index.astats() == {"documents": 1, "chunks": 1, "tokens": 2}
+        assert [doc["id"] for doc in (await index.alist())["documents"]] == ["default:2"]
+
+        await index.aclear()
+        assert await index.astats() == {"documents": 0, "chunks": 0, "tokens": 0}
+        assert await index.alist() == {"documents": [], "next_cursor": None}
+
+    asyncio.run(run())
+
+
+def test_document_index_cursor_pagination():
+    """测试按文档ID升序分页，游标跨页不重复不遗漏"""
+    index = _index(fakeredis.FakeServer())
+
+    async def run():
+        await index.aupsert({
+            f"default:{i}": SiteDocumentIndex.make_entry(i, f"{i}.md", "x " * 300, 1)
+            for i in (5, 1, 12, 3, 8)
+        })
+        pages = []
+        cursor = None
+        while True:
+            page = await index.alist(cursor=cursor, limit=2)
+            pages.append([doc["document_id"] for doc in page["documents"]])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages, page
+
+    pages, last = asyncio.run(run())
+    assert pages == [[1, 3], [5, 8], [12]]
+    assert last["documents"][0]["text_preview"].endswith("...")
+
+
+def test_document_index_retries_on_concurrent_write():
+    """测试读取旧摘要之后被其他worker修改时重试，累计值与最终摘要一致"""
+    server = fakeredis.FakeServer()
+    index = _index(server)
+    other = fakeredis.FakeRedis(server=server)
+    attempts = []
+
+    class RacingIndex(SiteDocumentIndex):
+        @staticmethod
+        def _totals(raw_entries):
+            # 第一次读取旧摘要后，另一个worker写入了同一文档
+            if not attempts:
+                other.hset(index.entries_key, "default:1", json.dumps(
+                    SiteDocumentIndex.make_entry(1, "a.md", "other writer", 7)
+                ))
+                other.hset(index.stats_key, mapping={"documents": 1, "chunks": 7, "tokens": 2})
+            attempts.append(len(raw_entries))
+            return SiteDocumentIndex._totals(raw_entries)
+
+    racing = RacingIndex(index.client, "simplerag:test:docs")
+
+    async def run():
+        await racing.aupsert({"default:1": SiteDocumentIndex.make_entry(1, "a.md", "mine", 2)})
+        return await racing.astats()
+
+    # 冲突的一轮读新旧两次，重试一轮再读两次
+    assert asyncio.run(run()) == {"documents": 1, "chunks": 2, "tokens": 1}
+    assert len(attempts) == 4
+
+
+def test_document_index_concurrent_upserts_keep_stats_consistent(monkeypatch):
+    """测试多个worker并发写入同一批文档后，累计值等于最终摘要之和"""
+    server = fakeredis.FakeServer()
+    indexes = [_index(server) for _ in range(8)]
+    conflicts = []
+
+    # fakeredis的命令不会让出事件循环，在WATCH期间的读取前让出，使各worker的事务交错执行
+    immediate_execute_command = Pipeline.immediate_execute_command
+    execute = Pipeline.execute
+
+    async def yielding_immediate_execute_command(self, *args, **options):
+        await asyncio.sleep(0)
+        return await immediate_execute_command(self, *args, **options)
+
+    async def counting_execute(self, *args, **kwargs):
+        try:
+            return await execute(self, *args, **kwargs)
+        except WatchError:
+            conflicts.append(1)
+            raise
+
+    monkeypatch.setattr(Pipeline, "immediate_execute_command", yielding_immediate_execute_command)
+    monkeypatch.setattr(Pipeline, "execute", counting_execute)
+
+    async def worker(index, round_):
+        for i in range(10):
+            doc_id = f"default:{(i + round_) % 6}"
+            entry = SiteDocumentIndex.make_entry((i + round_) % 6, "a.md", "word " * (round_ + i), round_ + 1)
+            await index.aupsert({doc_id: entry})
+            if i % 4 == 3:
+                await index.aremove([doc_id])
+
+    async def run():
+        await asyncio.gather(*(worker(index, round_) for round_, index in enumerate(indexes)))
+        listed = await indexes[0].alist(limit=100)
+        return listed["documents"], await indexes[0].astats()
+
+    documents, stats = asyncio.run(run())
+    assert conflicts
+    assert stats == {
+        "documents": len(documents),
+        "chunks": sum(doc["chunks"] for doc in documents),
+        "tokens": sum(doc["tokens"] for doc in documents),
+    }
@@ -1,8 +1,11 @@
+import io
 import os
+import zipfile
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
 from app.models.document import Document
 
 
@@ -34,10 +37,11 @@ def test_create_and_get_document(client: TestClient, db_session: Session):
             files={"file": ("test_document.md", f, "text/markdown")}
         )
     
-    # 检查响应
-    assert response.status_code == 200
+    # 检查响应，索引由摄入worker异步完成
+    assert response.status_code == 202
     data = response.json()
     assert data["filename"] == "test_document.md"
+    assert data["job_status"] == "queued"
     assert "# Test Document" in data["content"]
     
     # 获取文档
@@ -84,3 +88,139 @@ def test_delete_document(client: TestClient, db_session: Session):
     # 删除测试文件
     os.remove(test_file_path)
 
+
+
+def test_upload_documents_batch(client: TestClient, db_session: Session):
+    """测试批量上传文件和zip压缩包"""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("docs/a.md", "# A\n\nDocument A.")
+        zf.writestr("docs/b.txt", "Document B.")
+        zf.writestr("docs/image.png", b"\x89PNG")
+    archive.seek(0)
+
+    response = client.post(
+        "/api/documents/upload/batch",
+        files=[
+            ("files", ("c.md", io.BytesIO(b"# C\n\nDocument C."), "text/markdown")),
+            ("files", ("docs.zip", archive, "application/zip")),
+        ],
+    )
+
+    assert response.status_code == 202
+    data = response.json()
+    assert data["job_status"] == "queued"
+    assert [document["filename"] for document in data["documents"]] == ["c.md", "a.md", "b.txt"]
+    assert data["skipped"] == [{"filename": "docs/image.png", "reason": "不支持的文件类型"}]
+
+    response = client.get("/api/documents/")
+    assert len(response.json()) == 3
+
+
+def test_upload_rejects_oversized_file(client: TestClient, db_session: Session, monkeypatch):
+    """测试单文件上传和更新超过大小限制时返回413，不创建文档"""
+    monkeypatch.setattr(settings, "UPLOAD_MAX_FILE_BYTES", 16)
+    response = client.post(
+        "/api/documents/upload",
+        files={"file": ("big.md", io.BytesIO(b"x" * 17), "text/markdown")},
+    )
+    assert response.status_code == 413
+    assert db_session.query(Document).count() == 0
+
+    response = client.post(
+        "/api/documents/upload",
+        files={"file": ("small.md", io.BytesIO(b"x" * 16), "text/markdown")},
+    )
+    assert response.status_code == 202
+    response = client.put(
+        f"/api/documents/{response.json()['id']}",
+        files={"file": ("small.md", io.BytesIO(b"y" * 17), "text/markdown")},
+    )
+    assert response.status_code == 413
+
+
+def test_list_document_summaries(client: TestClient, db_session: Session):
+    """测试文档摘要列表不返回正文，并按游标翻页"""
+    long_text = "x" * 1000
+    response = client.post(
+        "/api/documents/upload/batch",
+        files=[
+            ("files", ("a.txt", io.BytesIO(b"Document A."), "text/plain")),
+            ("files", ("b.txt", io.BytesIO(long_text.encode()), "text/plain")),
+            ("files", ("c.txt", io.BytesIO(b"Document C."), "text/plain")),
+        ],
+    )
+    assert response.status_code == 202
+
+    response = client.get("/api/documents/summary", params={"limit": 2})
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [document["filename"] for document in first_page["documents"]] == ["a.txt", "b.txt"]
+    assert "content" not in first_page["documents"][0]
+    assert first_page["documents"][0]["preview"] == "Document A."
+    assert first_page["documents"][1]["size"] == 1000
+    assert first_page["documents"][1]["truncated"] is True
+    assert len(first_page["documents"][1]["preview"]) < 1000
+
+    response = client.get(
+        "/api/documents/summary", params={"limit": 2, "cursor": first_page["next_cursor"]}
+    )
+    second_page = response.json()
+    assert [document["filename"] for document in second_page["documents"]] == ["c.txt"]
+    assert second_page["next_cursor"] is None
+
+    response = client.get("/api/documents/summary", params={"cursor": "invalid"})
+    assert response.status_code == 400
+
+
+def test_upload_deduplicates_by_content(client: TestClient, db_session: Session):
+    """测试内容重复的上传按策略跳过、记录别名或替换，不创建新的摄入任务"""
+    content = b"# Dedup\n\nSame content."
+    response = client.post(
+        "/api/documents/upload",
+        files={"file": ("first.md", io.BytesIO(content), "text/markdown")},
+    )
+    assert response.status_code == 202
+    document_id = response.json()["id"]
+
+    response = client.post(
+        "/api/documents/upload",
+        files={"file": ("first.md", io.BytesIO(content), "text/markdown")},
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["id"] == document_id
+    assert data["dedup_action"] == "skip"
+    assert data["job_id"] is None
+
+    response = client.post(
+        "/api/documents/upload",
+        files={"file": ("renamed.md", io.BytesIO(content), "text/markdown")},
+        data={"dedup": "alias"},
+    )
+    assert response.status_code == 200
+    assert response.json()["metadata"]["aliases"] == ["renamed.md"]
+
+    response = client.post(
+        "/api/documents/upload/batch",
+        files=[
+            ("files", ("copy.md", io.BytesIO(content), "text/markdown")),
+            ("files", ("new.txt", io.BytesIO(b"New content."), "text/plain")),
+        ],
+    )
+    assert response.status_code == 202
+    data = response.json()
+    assert [document["filename"] for document in data["documents"]] == ["new.txt"]
+    assert data["duplicates"] == [{"filename": "copy.md", "document_id": document_id, "action": "skip"}]
+
+    response = client.post(
+        "/api/documents/upload",
+        files={"file": ("replaced.md", io.BytesIO(content), "text/markdown")},
+        data={"dedup": "replace"},
+    )
+    assert response.status_code == 202
+    data = response.json()
+    assert data["dedup_action"] == "replace"
+    assert data["id"] != document_id
+    assert data["job_status"] == "queued"
+    assert client.get(f"/api/documents/{document_id}").status_code == 404
@@ -0,0 +1,52 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from app.services.custom.siliconflow_embeddings import SiliconFlowEmbedding
+from app.services.embedding_cache import EmbeddingCache, LocalEmbeddingCache
+
+
+def test_local_cache_lru_eviction(tmp_path):
+    """测试本地缓存的命中统计和LRU淘汰"""
+    cache = LocalEmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.set_many({"a": [1.0, 2.0], "b": [3.0, 4.0]})
+
+    # 访问a使其成为最近使用
+    assert cache.get_many(["a"]) == {"a": [1.0, 2.0]}
+    cache.set_many({"c": [5.0, 6.0]})
+
+    found = cache.get_many(["a", "b", "c"])
+    assert set(found) == {"a", "c"}
+    assert cache.hits == 3
+    assert cache.misses == 1
+
+
+def test_embedding_batch_dedupes_and_caches(tmp_path):
+    """测试批内重复文本只嵌入一次，再次嵌入时命中缓存"""
+    cache = LocalEmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    embed_model = SiliconFlowEmbedding(api_key="test", vector_cache=cache, dimensions=2)
+    calls = []
+
+    async def fake_embed(texts):
+        calls.append(list(texts))
+        return [[float(len(text)), 0.0] for text in texts]
+
+    with patch.object(SiliconFlowEmbedding, "_aget_text_embeddings", side_effect=fake_embed):
+        first = asyncio.run(embed_model.aget_text_embedding_batch(["aa", "b", "aa"]))
+        second = asyncio.run(embed_model.aget_text_embedding_batch(["b", "aa", "ccc"]))
+
+    assert first == [[2.0, 0.0], [1.0, 0.0], [2.0, 0.0]]
+    assert second == [[1.0, 0.0], [2.0, 0.0], [3.0, 0.0]]
+    assert calls == [["aa", "b"], ["ccc"]]
+
+
+def test_incomplete_cache_backend_fails_on_construction():
+    """测试未实现读写原语的缓存后端在创建时报错，而不是第一次使用时"""
+
+    class ReadOnlyCache(EmbeddingCache):
+        def _get_raw(self, keys):
+            return {}
+
+    with pytest.raises(TypeError):
+        ReadOnlyCache()
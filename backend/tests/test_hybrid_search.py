@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+from llama_index.core import MockEmbedding
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from app.services.hybrid_search import HybridSearcher, fuse
+from app.services.index_service import IndexService
+from app.services.metadata_policy import MetadataPolicy
+
+
+def _results(*scored):
+    return [NodeWithScore(node=TextNode(id_=node_id, text=node_id), score=score) for node_id, score in scored]
+
+
+def test_rrf_fusion_normalized_and_weighted():
+    """测试倒数排名融合：两路都排第一得分为1，权重改变排序"""
+    dense = _results(("a", 0.9), ("b", 0.8), ("c", 0.7))
+    sparse = _results(("a", 12.0), ("c", 9.0), ("d", 3.0))
+
+    fused = fuse(dense, sparse, {"fusion": "rrf", "weights": [1.0, 1.0], "rrf_k": 60})
+    assert [result.node.node_id for result in fused] == ["a", "c", "b", "d"]
+    assert fused[0].score == 1.0
+
+    sparse_only = fuse(dense, sparse, {"fusion": "rrf", "weights": [0.0, 1.0], "rrf_k": 60})
+    assert [result.node.node_id for result in sparse_only][:2] == ["a", "c"]
+    assert sparse_only[-1].score == 0.0
+
+
+def test_similarity_cutoff_skips_unreranked_fused_scores():
+    """测试只被一路检索到的结果融合分数约为0.5，未经重排序时不被相似度阈值过滤"""
+    fused = fuse(
+        _results(("a", 0.9), ("b", 0.8)),
+        _results(("c", 12.0)),
+        {"fusion": "rrf", "weights": [1.0, 1.0], "rrf_k": 60},
+    )
+    assert all(result.score <= 0.5 for result in fused)
+
+    service = IndexService.__new__(IndexService)
+    service.metadata_policy = MetadataPolicy(node_keys=[], embed_keys=[], source_keys=[])
+    service.hybrid_searcher = HybridSearcher(None, MockEmbedding(embed_dim=4), sparse_embedding_function=object())
+    assert service._format_result("q", fused, 0.6, True, False)["total_results"] == 3
+    assert service._format_result("q", fused, 0.6, False, True)["total_results"] == 0
+
+    # 只有稠密检索时分数是相似度，照常过滤
+    service.hybrid_searcher = HybridSearcher(None, MockEmbedding(embed_dim=4))
+    assert service._format_result("q", _results(("a", 0.9), ("b", 0.3)), 0.6, False, False)["total_results"] == 1
+
+
+def test_weighted_fusion_normalizes_each_list():
+    """测试加权分数融合先在各路内归一化"""
+    dense = _results(("a", 0.9), ("b", 0.5))
+    sparse = _results(("b", 30.0), ("a", 10.0))
+
+    fused = fuse(dense, sparse, {"fusion": "weighted", "weights": [1.0, 3.0]})
+    assert [result.node.node_id for result in fused] == ["b", "a"]
+    assert fused[0].score == 0.75
+    assert fuse(dense, None, {"fusion": "weighted", "weights": [1.0, 1.0]}) == dense
+
+
+def test_hybrid_searcher_encodes_concurrently():
+    """测试稠密和稀疏查询编码并发执行"""
+    class SlowSparse:
+        async def async_encode_queries(self, queries):
+            await asyncio.sleep(0.2)
+            return [{1: 0.5} for _ in queries]
+
+    class SlowEmbedding(MockEmbedding):
+        async def _aget_query_embedding(self, query):
+            await asyncio.sleep(0.2)
+            return [0.1] * self.embed_dim
+
+    searcher = HybridSearcher(None, SlowEmbedding(embed_dim=2), SlowSparse())
+    start = time.perf_counter()
+    dense, sparse = asyncio.run(searcher.aencode("query"))
+    elapsed = time.perf_counter() - start
+
+    assert dense == [0.1, 0.1]
+    assert sparse == {1: 0.5}
+    assert elapsed < 0.35
+
+
+def test_hybrid_searcher_batch_encodes_in_single_calls():
+    """测试批量编码时稠密和稀疏各只发起一次批量请求，结果与输入顺序一致"""
+    calls = {"dense": [], "sparse": []}
+
+    class BatchSparse:
+        async def async_encode_queries(self, queries):
+            calls["sparse"].append(list(queries))
+            return [{index: 1.0} for index, _ in enumerate(queries)]
+
+    class BatchEmbedding(MockEmbedding):
+        async def aget_query_embedding_batch(self, queries):
+            calls["dense"].append(list(queries))
+            return [[float(len(query))] * self.embed_dim for query in queries]
+
+    searcher = HybridSearcher(None, BatchEmbedding(embed_dim=2), BatchSparse())
+    dense, sparse = asyncio.run(searcher.aencode_batch(["a", "bbb", "cc"]))
+
+    assert dense == [[1.0, 1.0], [3.0, 3.0], [2.0, 2.0]]
+    assert sparse == [{0: 1.0}, {1: 1.0}, {2: 1.0}]
+    assert calls == {"dense": [["a", "bbb", "cc"]], "sparse": [["a", "bbb", "cc"]]}
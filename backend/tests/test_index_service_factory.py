@@ -0,0 +1,29 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.services import index_service
+
+
+class SlowIndexService:
+    """创建时模拟连接Milvus的耗时"""
+
+    created = 0
+
+    def __init__(self, site_id):
+        time.sleep(0.1)
+        SlowIndexService.created += 1
+        self.site_id = site_id
+
+
+def test_factory_creates_one_instance_under_concurrent_first_requests(monkeypatch):
+    """测试并发的首次请求只创建一个站点实例"""
+    monkeypatch.setattr(index_service, "IndexService", SlowIndexService)
+    monkeypatch.setattr(index_service.IndexServiceFactory, "_instances", {})
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        services = list(executor.map(
+            lambda _: index_service.IndexServiceFactory.get_instance("cold"), range(8)
+        ))
+
+    assert SlowIndexService.created == 1
+    assert all(service is services[0] for service in services)
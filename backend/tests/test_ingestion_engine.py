@@ -0,0 +1,169 @@
+import asyncio
+
+import pytest
+from llama_index.core import Document as LlamaDocument, MockEmbedding
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.kvstore import SimpleKVStore
+from llama_index.core.vector_stores import SimpleVectorStore
+
+from app.services.custom.bgem3_sparse import BGEM3SparseEmbeddingFunction
+from app.services.ingestion_engine import IngestionEngine
+
+
+def _create_engine():
+    # 与IndexService一致，文档存储和分块清单共用同一个kvstore
+    kvstore = SimpleKVStore()
+    return IngestionEngine(
+        splitter=SentenceSplitter(chunk_size=32, chunk_overlap=0),
+        embed_model=MockEmbedding(embed_dim=4),
+        vector_store=SimpleVectorStore(),
+        docstore=SimpleDocumentStore(simple_kvstore=kvstore),
+        kvstore=kvstore,
+        manifest_collection="test/chunk_manifest",
+        batch_size=2,
+        queue_size=1,
+    )
+
+
+def test_ingestion_engine_inserts_all_chunks():
+    """测试流式摄入写入所有分块并上报进度"""
+    engine = _create_engine()
+    documents = [
+        LlamaDocument(text=" ".join(f"word{i}_{j}." for j in range(40)), id_=f"default:{i}")
+        for i in range(3)
+    ]
+    progress = {}
+
+    def on_progress(stage, count):
+        progress[stage] = progress.get(stage, 0) + count
+
+    nodes = asyncio.run(engine.arun(documents, progress_callback=on_progress))
+
+    assert len(nodes) > len(documents)
+    assert all(node.embedding is not None for node in nodes)
+    assert progress["split"] == progress["embedded"] == progress["inserted"] == len(nodes)
+    assert {node.ref_doc_id for node in nodes} == {doc.id_ for doc in documents}
+    assert engine.docstore.get_document_hash("default:0") == documents[0].hash
+
+
+def test_ingestion_engine_skips_unchanged_documents():
+    """测试未变化的文档不会被重复摄入"""
+    engine = _create_engine()
+    document = LlamaDocument(text="Hello world.", id_="default:1")
+
+    assert len(asyncio.run(engine.arun([document]))) == 1
+    assert asyncio.run(engine.arun([document])) == []
+
+
+def test_ingestion_engine_update_only_embeds_changed_chunks():
+    """测试增量更新只处理新增和消失的分块"""
+    engine = _create_engine()
+    paragraphs = [f"Paragraph {i} " + "text " * 20 for i in range(4)]
+    original = LlamaDocument(text="\n\n".join(paragraphs), id_="default:1")
+    original_nodes = asyncio.run(engine.arun([original]))
+
+    paragraphs[-1] = "A completely different closing paragraph " + "words " * 20
+    updated = LlamaDocument(text="\n\n".join(paragraphs), id_="default:1")
+    stats = asyncio.run(engine.aupdate(updated))
+
+    assert stats["reused"] > 0
+    assert stats["added"] > 0
+    assert stats["reused"] + stats["relinked"] + stats["removed"] == len(original_nodes)
+    assert engine.docstore.get_document_hash("default:1") == updated.hash
+
+
+def test_ingestion_engine_update_relinks_neighbours_of_changed_chunks():
+    """测试删除中间分块后，前后分块重新写入并指向新的相邻分块，其余分块不动"""
+
+    class RecordingStore(SimpleVectorStore):
+        written: list = []
+
+        async def async_add(self, nodes, **kwargs):
+            self.written.extend(nodes)
+            return self.add(nodes)
+
+    engine = _create_engine()
+    engine.vector_store = RecordingStore()
+    # 每段一个分块
+    engine.splitter = SentenceSplitter(chunk_size=16, chunk_overlap=0)
+    paragraphs = [f"Paragraph {i} has some distinct words in it." for i in range(5)]
+    original_ids = [node.node_id for node in asyncio.run(engine.arun(
+        [LlamaDocument(text="\n\n".join(paragraphs), id_="default:1")]
+    ))]
+
+    del paragraphs[2]
+    engine.vector_store.written = []
+    stats = asyncio.run(engine.aupdate(LlamaDocument(text="\n\n".join(paragraphs), id_="default:1")))
+    new_ids = asyncio.run(engine._get_manifest("default:1"))
+
+    assert new_ids == [node_id for node_id in original_ids if node_id != original_ids[2]]
+    assert stats == {"reused": 2, "relinked": 2, "added": 0, "removed": 1}
+    written = {node.node_id: node for node in engine.vector_store.written}
+    assert set(written) == {original_ids[1], original_ids[3]}
+    assert written[original_ids[1]].next_node.node_id == original_ids[3]
+    assert written[original_ids[3]].prev_node.node_id == original_ids[1]
+    assert len(engine.vector_store.data.embedding_dict) == 4
+
+
+def test_ingestion_engine_bulk_delete():
+    """测试批量删除文档的向量、文档记录和分块清单"""
+    engine = _create_engine()
+    engine.delete_batch_size = 2
+    documents = [LlamaDocument(text=f"Document {i}.", id_=f"default:{i}") for i in range(5)]
+    asyncio.run(engine.arun(documents))
+    deleted_batches = []
+
+    deleted = asyncio.run(engine.adelete_many(
+        ["default:0", "default:1", "default:2"],
+        progress_callback=lambda stage, count: deleted_batches.append((stage, count)),
+    ))
+
+    assert deleted == 3
+    assert deleted_batches == [("deleted", 2), ("deleted", 1)]
+    assert set(engine.vector_store.data.text_id_to_ref_doc_id.values()) == {"default:3", "default:4"}
+    assert engine.docstore.get_document_hash("default:0") is None
+    assert asyncio.run(engine._get_manifest("default:1")) is None
+    assert asyncio.run(engine.aclear_documents()) == 2
+    assert engine.docstore.get_document_hash("default:4") is None
+
+
+def test_ingestion_engine_prefetched_sparse_vectors_are_batch_scoped():
+    """测试预取的稀疏向量只在写入期间有效：重复文本都能命中，写入失败后也会清除"""
+    sparse = BGEM3SparseEmbeddingFunction(base_url="http://bgem3")
+
+    async def aencode(texts):
+        return [{len(text): 1.0} for text in texts]
+
+    def encode(texts):
+        raise AssertionError("写入时不应发出同步请求")
+
+    sparse._aencode = aencode
+    sparse._encode = encode
+
+    class MilvusLikeStore(SimpleVectorStore):
+        """与MilvusVectorStore一样，写入时逐条同步计算稀疏向量"""
+
+        fail: bool = False
+
+        async def async_add(self, nodes, **kwargs):
+            for node in nodes:
+                assert sparse.encode_documents([node.text]) == [{len(node.text): 1.0}]
+            if self.fail:
+                raise RuntimeError("insert failed")
+            return self.add(nodes)
+
+    engine = _create_engine()
+    engine.vector_store = MilvusLikeStore()
+    engine.sparse_embedding_function = sparse
+    # 同一批内有两个文本相同的分块
+    document = LlamaDocument(text="Same sentence. Same sentence. Other sentence.", id_="default:1")
+    engine.splitter = SentenceSplitter(chunk_size=4, chunk_overlap=0)
+
+    assert len(asyncio.run(engine.arun([document]))) > 1
+    assert sparse._prefetched == {}
+
+    engine.vector_store.fail = True
+    with pytest.raises(Exception):
+        asyncio.run(engine.arun([LlamaDocument(text="Another document.", id_="default:2")]))
+    assert sparse._prefetched == {}
@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import MetadataMode
+from markitdown import MarkItDown
+
+from app.models.document import Document
+from app.schemas.document import DocumentResponse
+from app.services.document_service import DocumentService
+from app.services.index_service import IndexService
+from app.services.metadata_policy import MetadataPolicy
+
+
+def _index_service(policy):
+    service = IndexService.__new__(IndexService)
+    service.site_id = "default"
+    service.metadata_policy = policy
+    return service
+
+
+def test_metadata_policy_keeps_large_fields_off_chunks():
+    """测试整篇文档的解析结果不复制到分块上，也不参与向量化"""
+    policy = MetadataPolicy(
+        node_keys=["site_id", "created_at", "author"],
+        embed_keys=["filename"],
+        source_keys=["document_id", "filename"],
+    )
+    content = "# Title\n\n" + "This is a sentence. " * 200
+    document = Document(
+        id=7,
+        filename="guide.md",
+        content=content,
+        _metadata={"parsed_content": content, "author": "alice"},
+        created_at=datetime(2025, 6, 5, tzinfo=timezone.utc),
+    )
+
+    llama_document = _index_service(policy)._to_llama_document(document)
+    assert llama_document.metadata == {
+        "document_id": 7,
+        "filename": "guide.md",
+        "site_id": "default",
+        "created_at": "2025-06-05T00:00:00+00:00",
+        "author": "alice",
+    }
+
+    nodes = SentenceSplitter(chunk_size=256, chunk_overlap=0).get_nodes_from_documents([llama_document])
+    assert len(nodes) > 1
+    for node in nodes:
+        assert "parsed_content" not in node.metadata
+        embed_text = node.get_content(metadata_mode=MetadataMode.EMBED)
+        assert embed_text.startswith("filename: guide.md\n\n")
+        assert "author" not in embed_text
+
+    assert policy.source_metadata({**nodes[0].metadata, "parsed_content": content}) == {
+        "document_id": 7,
+        "filename": "guide.md",
+    }
+
+
+def test_metadata_policy_drops_oversized_allowed_values():
+    """测试白名单内超过大小限制的值不复制到分块上，必需的键总是保留"""
+    policy = MetadataPolicy(node_keys=["summary"], embed_keys=[], source_keys=[], max_value_bytes=16)
+    metadata = policy.node_metadata({
+        "document_id": 1,
+        "filename": "a-very-long-file-name.md",
+        "summary": "x" * 100,
+        "other": "y",
+    })
+    assert metadata == {"document_id": 1, "filename": "a-very-long-file-name.md"}
+    assert policy.excluded_embed_keys(metadata) == ["document_id", "filename"]
+
+
+def test_document_response_omits_parsed_content():
+    """测试Markdown解析结果与原文相同时不保存，文档响应也不返回大字段"""
+    service = DocumentService.__new__(DocumentService)
+    service.markitdown = MarkItDown()
+    content, metadata = service.parse_content("a.md", "# 标题\n\n正文".encode("utf-8"))
+    assert content == "# 标题\n\n正文"
+    assert metadata == {}
+
+    document = Document(
+        id=1,
+        filename="a.md",
+        content=content,
+        _metadata={"parsed_content": content * 100, "aliases": ["b.md"]},
+        created_at=datetime.now(timezone.utc),
+    )
+    response = DocumentResponse.model_validate(document).model_dump()
+    assert response["metadata"] == {"aliases": ["b.md"]}
@@ -0,0 +1,193 @@
+import asyncio
+
+import numpy as np
+import pytest
+from llama_index.core import Document as LlamaDocument
+from llama_index.core.embeddings import BaseEmbedding
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.kvstore import SimpleKVStore
+from llama_index.core.vector_stores.types import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+
+from app.services import atomic_files
+from app.services.custom import numpy_vector_store
+from app.services.custom.numpy_vector_store import NumpyVectorStore
+from app.services.hybrid_search import HybridSearcher
+from app.services.ingestion_engine import IngestionEngine
+
+
+def _nodes(vectors, docs_per_ref=2):
+    return [
+        TextNode(
+            id_=f"n{i}",
+            text=f"node {i}",
+            embedding=list(vector),
+            metadata={"filename": f"{i // docs_per_ref}.md"},
+            relationships={NodeRelationship.SOURCE: RelatedNodeInfo(node_id=f"doc{i // docs_per_ref}")},
+        )
+        for i, vector in enumerate(vectors)
+    ]
+
+
+def test_numpy_vector_store_top_k_matches_brute_force():
+    """测试检索结果与逐条计算余弦相似度一致，批量检索与单条检索一致"""
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 8)).astype(np.float32)
+    store = NumpyVectorStore(dim=8)
+    store.add(_nodes(vectors))
+
+    query = rng.normal(size=8)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]
+
+    result = store.query(VectorStoreQuery(query_embedding=list(query), similarity_top_k=5))
+    assert result.ids == [f"n{i}" for i in expected]
+    assert result.similarities == sorted(result.similarities, reverse=True)
+    assert result.nodes[0].ref_doc_id == f"doc{expected[0] // 2}"
+
+    many = store.query_many([list(query), list(vectors[7])], similarity_top_k=5)
+    assert many[0].ids == result.ids
+    assert many[1].ids[0] == "n7"
+
+
+def test_numpy_vector_store_delete_and_persist(tmp_path):
+    """测试按文档删除、按doc_id过滤批量删除，以及重启后从磁盘恢复"""
+    rng = np.random.default_rng(1)
+    vectors = rng.normal(size=(10, 4)).astype(np.float32)
+    store = NumpyVectorStore(dim=4, persist_dir=str(tmp_path))
+    store.add(_nodes(vectors))
+
+    store.delete("doc0")
+    store.delete_nodes(filters=MetadataFilters(
+        filters=[MetadataFilter(key="doc_id", value=["doc1", "doc2"], operator=FilterOperator.IN)]
+    ))
+    store.delete_nodes(node_ids=["n9"])
+    assert len(store) == 3
+    store.close()
+
+    reopened = NumpyVectorStore(dim=4, persist_dir=str(tmp_path))
+    assert len(reopened) == 3
+    result = reopened.query(VectorStoreQuery(query_embedding=list(vectors[6]), similarity_top_k=10))
+    assert result.ids[0] == "n6"
+    assert sorted(result.ids) == ["n6", "n7", "n8"]
+    filtered = reopened.query(VectorStoreQuery(
+        query_embedding=list(vectors[6]),
+        similarity_top_k=10,
+        filters=MetadataFilters(filters=[MetadataFilter(key="filename", value="4.md")]),
+    ))
+    assert filtered.ids == ["n8"]
+
+    reopened.clear()
+    reopened.close()
+    assert len(NumpyVectorStore(dim=4, persist_dir=str(tmp_path))) == 0
+
+
+def test_numpy_vector_store_single_writer(tmp_path):
+    """测试同一目录只能由一个实例打开，关闭后才能重新打开"""
+    store = NumpyVectorStore(dim=4, persist_dir=str(tmp_path))
+    store.add(_nodes(np.eye(4, dtype=np.float32)))
+    with pytest.raises(RuntimeError):
+        NumpyVectorStore(dim=4, persist_dir=str(tmp_path))
+    # 加锁失败的实例没有改动文件
+    assert len(store) == 4
+    store.close()
+
+    reopened = NumpyVectorStore(dim=4, persist_dir=str(tmp_path))
+    assert len(reopened) == 4
+    reopened.close()
+
+
+def test_numpy_vector_store_compaction_survives_failures(tmp_path, monkeypatch):
+    """测试压缩写新文件失败时保留旧文件，替换中途崩溃后重新打开时完成替换"""
+    monkeypatch.setattr(numpy_vector_store, "COMPACT_MIN_ROWS", 4)
+    rng = np.random.default_rng(2)
+    vectors = rng.normal(size=(12, 4)).astype(np.float32)
+    store = NumpyVectorStore(dim=4, persist_dir=str(tmp_path))
+    store.add(_nodes(vectors))
+
+    def fail_fsync(f):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(numpy_vector_store, "fsync_file", fail_fsync)
+    store.delete_nodes(node_ids=[f"n{i}" for i in range(7)])
+    assert store._count == 12
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        [".lock", numpy_vector_store.VECTORS_FILE, numpy_vector_store.LOG_FILE]
+    )
+    monkeypatch.setattr(numpy_vector_store, "fsync_file", atomic_files.fsync_file)
+
+    # 提交标记写入后、替换文件时崩溃
+    replace = atomic_files.os.replace
+    def crash(src, dst):
+        raise OSError("crash")
+
+    monkeypatch.setattr(atomic_files.os, "replace", crash)
+    with pytest.raises(OSError):
+        store.delete("doc3")
+    store.close()
+    monkeypatch.setattr(atomic_files.os, "replace", replace)
+
+    reopened = NumpyVectorStore(dim=4, persist_dir=str(tmp_path))
+    assert reopened._count == 4
+    assert sorted(reopened._rows) == ["n10", "n11", "n8", "n9"]
+    result = reopened.query(VectorStoreQuery(query_embedding=list(vectors[10]), similarity_top_k=1))
+    assert result.ids == ["n10"]
+    assert not (tmp_path / atomic_files.COMMIT_MARKER).exists()
+    reopened.close()
+
+
+class WordEmbedding(BaseEmbedding):
+    """按词哈希的词袋向量，测试中无需嵌入服务即可得到有区分度的相似度"""
+
+    def _embed(self, text):
+        vector = np.zeros(64)
+        for word in text.lower().split():
+            vector[hash(word.strip(".")) % 64] += 1
+        return vector.tolist()
+
+    def _get_query_embedding(self, query):
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query):
+        return self._embed(query)
+
+    def _get_text_embedding(self, text):
+        return self._embed(text)
+
+
+def test_numpy_vector_store_serves_hybrid_query_path():
+    """测试摄入和检索完整链路可以在没有任何外部服务的情况下运行"""
+    store = NumpyVectorStore(dim=64)
+    kvstore = SimpleKVStore()
+    embed_model = WordEmbedding()
+    engine = IngestionEngine(
+        splitter=SentenceSplitter(chunk_size=64, chunk_overlap=0),
+        embed_model=embed_model,
+        vector_store=store,
+        docstore=SimpleDocumentStore(simple_kvstore=kvstore),
+        kvstore=kvstore,
+        manifest_collection="test/chunk_manifest",
+    )
+    documents = [
+        LlamaDocument(text="apples grow on trees in the orchard", id_="default:1"),
+        LlamaDocument(text="milvus stores vectors for similarity search", id_="default:2"),
+    ]
+    searcher = HybridSearcher(store, embed_model)
+
+    async def run():
+        await engine.arun(documents)
+        dense, sparse = await searcher.aencode_batch(["vectors similarity", "orchard apples"])
+        return await searcher.asearch(dense, sparse, limit=1)
+
+    dense_results, sparse_results = asyncio.run(run())
+    assert sparse_results is None
+    assert [results[0].node.ref_doc_id for results in dense_results] == ["default:2", "default:1"]
+
+    asyncio.run(engine.adelete_many(["default:2"]))
+    assert len(store) == 1
@@ -1,30 +1,33 @@
+import json
 import os
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import AsyncMock, MagicMock
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from app.services.index_service import IndexService
+from app.api.deps import get_index_service
+from app.main import app
 
 
 @pytest.fixture
 def mock_index_service():
-    """模拟IndexService"""
-    with patch("app.api.endpoints.query.IndexService") as mock:
-        instance = mock.return_value
-        instance.query.return_value = {
-            "query": "test query",
-            "answer": "This is a test answer.",
-            "sources": [
-                {
-                    "text": "Test source text",
-                    "document_id": 1,
-                    "score": 0.95,
-                    "metadata": {"filename": "test_document.md"}
-                }
-            ]
-        }
-        yield mock
+    """模拟共享的IndexService实例"""
+    instance = MagicMock()
+    instance.query = AsyncMock(return_value={
+        "query": "test query",
+        "answer": "This is a test answer.",
+        "sources": [
+            {
+                "text": "Test source text",
+                "document_id": 1,
+                "score": 0.95,
+                "metadata": {"filename": "test_document.md"}
+            }
+        ]
+    })
+    app.dependency_overrides[get_index_service] = lambda: instance
+    yield instance
+    app.dependency_overrides.pop(get_index_service, None)
 
 
 def test_query_documents(client: TestClient, db_session: Session, mock_index_service):
@@ -49,17 +52,25 @@ def test_query_documents(client: TestClient, db_session: Session, mock_index_ser
     assert data["sources"][0]["score"] == 0.95
     
     # 验证IndexService.query被调用
-    mock_index_service.return_value.query.assert_called_once_with(
+    mock_index_service.query.assert_called_once_with(
         query_text="test query",
         top_k=5,
-        rerank=True
+        rerank=True,
+        rerank_top_k=None,
+        search_kwargs={
+            "fusion": "rrf",
+            "weights": [1.0, 1.0],
+            "candidate_k": None,
+            "ef": None,
+            "latency_target_ms": None,
+        },
     )
 
 
 def test_query_error_handling(client: TestClient, db_session: Session, mock_index_service):
     """测试查询错误处理"""
     # 设置模拟异常
-    mock_index_service.return_value.query.side_effect = Exception("Test error")
+    mock_index_service.query.side_effect = Exception("Test error")
     
     # 发送查询请求
     response = client.post(
@@ -75,3 +86,57 @@ def test_query_error_handling(client: TestClient, db_session: Session, mock_inde
     assert response.status_code == 500
     assert response.json() == {"detail": "查询失败: Test error"}
 
+
+
+def test_query_documents_batch(client: TestClient, db_session: Session, mock_index_service):
+    """测试批量查询按输入顺序返回结果"""
+    mock_index_service.query_batch = AsyncMock(return_value=[
+        {"query": "first", "sources": [], "total_results": 0},
+        {"query": "second", "sources": [], "total_results": 0, "degraded": True},
+    ])
+
+    response = client.post(
+        "/api/query/batch",
+        json={"queries": ["first", "second"], "top_k": 3}
+    )
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["query"] for result in results] == ["first", "second"]
+    assert results[1]["degraded"] is True
+    mock_index_service.query_batch.assert_called_once_with(
+        query_texts=["first", "second"],
+        top_k=3,
+        rerank=True,
+        rerank_top_k=None,
+        search_kwargs={
+            "fusion": "rrf",
+            "weights": [1.0, 1.0],
+            "candidate_k": None,
+            "ef": None,
+            "latency_target_ms": None,
+        },
+    )
+
+    # 空查询列表被拒绝
+    response = client.post("/api/query/batch", json={"queries": []})
+    assert response.status_code == 422
+
+
+def test_query_documents_stream(client: TestClient, db_session: Session, mock_index_service):
+    """测试流式查询依次推送各阶段事件"""
+    async def query_stream(**kwargs):
+        yield {"event": "retrieval", "data": {"query": "test query", "sources": []}}
+        yield {"event": "done", "data": {"query": "test query", "sources": [], "timings": {"total_ms": 1.0}}}
+
+    mock_index_service.query_stream = query_stream
+
+    response = client.post("/api/query/stream", json={"query": "test query"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [event["event"] for event in events] == ["retrieval", "done"]
+
+    response = client.post("/api/query/stream?format=sse", json={"query": "test query"})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text.startswith("event: retrieval\ndata: ")
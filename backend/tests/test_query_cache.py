@@ -0,0 +1,70 @@
+import asyncio
+from unittest.mock import patch
+
+from app.services.custom.bgem3_sparse import BGEM3SparseEmbeddingFunction
+from app.services.query_cache import QueryResultCache
+from app.services.query_vector_cache import QueryVectorCache
+
+
+def test_query_cache_invalidated_by_generation():
+    """测试查询缓存按规范化文本命中，写入后代数变化使旧结果失效"""
+    cache = QueryResultCache(max_entries=2)
+    result = {"query": "什么是Python?", "sources": [], "total_results": 0}
+
+    async def run():
+        key = QueryResultCache.make_key("什么是Python?", top_k=5, rerank=True)
+        generation = await cache.generation()
+        assert await cache.get(key, generation) is None
+        await cache.set(key, generation, result)
+
+        same_key = QueryResultCache.make_key("  什么是Python？ ", top_k=5, rerank=True)
+        assert same_key == key
+        assert await cache.get(same_key, await cache.generation()) == result
+        assert QueryResultCache.make_key("什么是Python?", top_k=3, rerank=True) != key
+
+        await cache.bump()
+        assert await cache.get(key, await cache.generation()) is None
+
+    asyncio.run(run())
+    stats = cache.stats()
+    assert stats["local_hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == 1 / 3
+
+
+def test_query_cache_lru_eviction():
+    """测试进程内缓存超过容量时淘汰最久未使用的结果"""
+    cache = QueryResultCache(max_entries=2)
+
+    async def run():
+        for name in ("a", "b"):
+            await cache.set(name, 0, {"query": name})
+        await cache.get("a", 0)
+        await cache.set("c", 0, {"query": "c"})
+        return [await cache.get(name, 0) is not None for name in ("a", "b", "c")]
+
+    assert asyncio.run(run()) == [True, False, True]
+
+
+def test_query_vector_cache_ttl_and_sparse_encoding():
+    """测试查询向量缓存的紧凑存储、TTL过期，以及稀疏编码只请求未命中的查询"""
+    cache = QueryVectorCache(max_entries=10, ttl=60)
+    cache.set_dense("bge-m3:1024", "hello", [0.5, 0.25])
+    assert cache.get_dense("bge-m3:1024", " hello ") == [0.5, 0.25]
+    assert cache.get_dense("other-model", "hello") is None
+
+    sparse = BGEM3SparseEmbeddingFunction(base_url="http://bgem3", query_cache=cache)
+    calls = []
+
+    def fake_encode(texts):
+        calls.append(list(texts))
+        return [{len(text): 1.0, 1: 0.5} for text in texts]
+
+    with patch.object(sparse, "_encode", side_effect=fake_encode):
+        assert sparse.encode_queries(["ab", "abc"]) == [{2: 1.0, 1: 0.5}, {3: 1.0, 1: 0.5}]
+        assert sparse.encode_queries(["abc", "abcd"]) == [{1: 0.5, 3: 1.0}, {4: 1.0, 1: 0.5}]
+    assert calls == [["ab", "abc"], ["abcd"]]
+
+    cache.ttl = -1
+    cache.set_dense("bge-m3:1024", "expired", [1.0])
+    assert cache.get_dense("bge-m3:1024", "expired") is None
@@ -0,0 +1,48 @@
+import asyncio
+
+import httpx
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from app.services.reranker import Reranker
+
+
+def _nodes(*texts):
+    return [NodeWithScore(node=TextNode(id_=text, text=text), score=0.5) for text in texts]
+
+
+async def _arerank(handler, nodes, top_n, timeout_ms=200):
+    reranker = Reranker(base_url="http://reranker", timeout_ms=timeout_ms)
+    reranker._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    reranker._loop = asyncio.get_running_loop()
+    return reranker, await reranker.arerank("问题", nodes, top_n=top_n)
+
+
+def test_rerank_reorders_by_relevance():
+    """测试重排序按服务返回的相关度排序"""
+    def handler(request):
+        return httpx.Response(200, json={"results": [
+            {"index": 1, "relevance_score": 0.9},
+            {"index": 0, "relevance_score": 0.3},
+        ]})
+
+    reranker, (nodes, degraded) = asyncio.run(_arerank(handler, _nodes("a", "b"), top_n=2))
+    assert [node.node.node_id for node in nodes] == ["b", "a"]
+    assert degraded is False
+    assert reranker.stats()["fallback_rate"] == 0.0
+
+
+def test_rerank_falls_back_when_budget_exceeded():
+    """测试重排序超过耗时预算时回退到检索顺序并标记降级"""
+    async def handler(request):
+        await asyncio.sleep(1)
+        return httpx.Response(200, json={"results": []})
+
+    reranker, (nodes, degraded) = asyncio.run(
+        _arerank(handler, _nodes("a", "b", "c"), top_n=2, timeout_ms=50)
+    )
+    assert [node.node.node_id for node in nodes] == ["a", "b"]
+    assert degraded is True
+    stats = reranker.stats()
+    assert stats["timeouts"] == 1
+    assert stats["fallback_rate"] == 1.0
+    assert stats["latency_ms_p50"] < 500
@@ -0,0 +1,48 @@
+import asyncio
+import json
+
+from app.services.search_tuning import DEFAULT_SEARCH_PARAMS, SearchCalibration, resolve_search_params
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value):
+        self.data[key] = value
+
+
+def test_resolve_search_params_layers():
+    """测试检索参数按层覆盖，None视为未设置"""
+    params = resolve_search_params(
+        DEFAULT_SEARCH_PARAMS,
+        {"ef": 128, "rerank_top_k": 8},
+        {"ef": 16, "candidate_k": 10},
+        {"candidate_k": None, "fusion": "weighted"},
+        {"rerank_top_k": None},
+    )
+    assert params["ef"] == 16
+    assert params["candidate_k"] == 10
+    assert params["rerank_top_k"] == 8
+    assert params["fusion"] == "weighted"
+    assert resolve_search_params(DEFAULT_SEARCH_PARAMS)["candidate_k"] is None
+
+
+def test_calibration_picks_best_recall_within_target():
+    """测试按延迟目标选择召回率最高的配置，无满足目标的配置时选最快的"""
+    client = FakeRedis()
+    table = [
+        {"ef": 16, "candidate_k": 10, "rerank_top_k": 5, "latency_ms_p50": 5, "latency_ms_p95": 8, "recall": 0.8},
+        {"ef": 64, "candidate_k": 20, "rerank_top_k": 10, "latency_ms_p50": 12, "latency_ms_p95": 18, "recall": 0.95},
+        {"ef": 512, "candidate_k": 100, "rerank_top_k": 20, "latency_ms_p50": 40, "latency_ms_p95": 60, "recall": 1.0},
+    ]
+    client.data["site:search_calibration"] = json.dumps(table)
+    calibration = SearchCalibration(client, "site", [])
+
+    assert asyncio.run(calibration.apick(20)) == {"ef": 64, "candidate_k": 20, "rerank_top_k": 10}
+    assert asyncio.run(calibration.apick(100))["ef"] == 512
+    assert asyncio.run(calibration.apick(1))["ef"] == 16
+    assert asyncio.run(SearchCalibration(FakeRedis(), "other", []).apick(20)) is None
@@ -0,0 +1,58 @@
+import asyncio
+
+from app.services.singleflight import SingleFlight
+
+
+def test_singleflight_coalesces_concurrent_calls():
+    """测试并发的相同请求只执行一次并共享结果"""
+    flight = SingleFlight()
+    calls = []
+
+    async def execute(keys, positions):
+        calls.append([keys[i] for i in positions])
+        await asyncio.sleep(0.05)
+        return [keys[i].upper() for i in positions]
+
+    async def run():
+        requests = [["a", "b"], ["b", "c"], ["a"]]
+        return await asyncio.gather(*(
+            flight.do_many(keys, lambda positions, keys=keys: execute(keys, positions))
+            for keys in requests
+        ))
+
+    results = asyncio.run(run())
+    assert results == [["A", "B"], ["B", "C"], ["A"]]
+    assert calls == [["a", "b"], ["c"]]
+    assert flight.stats()["executed"] == 3
+    assert flight.stats()["coalesced"] == 2
+
+
+def test_singleflight_shares_errors_and_survives_cancelled_caller():
+    """测试执行失败时所有等待者收到异常，发起者被取消时其他等待者仍得到结果"""
+    flight = SingleFlight()
+
+    async def fail(positions):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("boom")
+
+    async def slow(positions):
+        await asyncio.sleep(0.05)
+        return ["ok"]
+
+    async def run_errors():
+        return await asyncio.gather(
+            flight.do_many(["q"], fail), flight.do_many(["q"], fail), return_exceptions=True
+        )
+
+    errors = asyncio.run(run_errors())
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+    async def run_cancel():
+        leader = asyncio.ensure_future(flight.do_many(["q"], slow))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do_many(["q"], slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(run_cancel()) == ["ok"]
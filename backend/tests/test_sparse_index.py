@@ -0,0 +1,200 @@
+import asyncio
+
+import numpy as np
+import pytest
+from llama_index.core import Document as LlamaDocument
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.kvstore import SimpleKVStore
+
+from app.services import atomic_files, sparse_index
+from app.services.custom.numpy_vector_store import NumpyVectorStore
+from app.services.hybrid_search import HybridSearcher
+from app.services.ingestion_engine import IngestionEngine
+from app.services.sparse_index import SparseInvertedIndex
+from tests.test_numpy_vector_store import WordEmbedding
+
+
+def _random_vectors(rng, count, terms, vocab=500):
+    # 词频服从长尾分布，少数词出现在大量文档中，与真实稀疏向量相近
+    return [
+        {int(token): float(rng.random()) for token in np.unique(rng.zipf(1.5, terms) % vocab)}
+        for _ in range(count)
+    ]
+
+
+def _brute_force(vectors, query, top_k, alive):
+    scores = [
+        (sum(weight * vector.get(token, 0.0) for token, weight in query.items()), f"n{i}")
+        for i, vector in enumerate(vectors)
+        if f"n{i}" in alive
+    ]
+    scores = [item for item in scores if item[0] > 0]
+    scores.sort(key=lambda item: (-item[0], item[1]))
+    return [node_id for _, node_id in scores[:top_k]]
+
+
+def test_sparse_index_pruned_search_matches_brute_force():
+    """测试剪枝后的检索结果与逐条计算内积一致"""
+    rng = np.random.default_rng(0)
+    vectors = _random_vectors(rng, 2000, 40)
+    index = SparseInvertedIndex()
+    for start in range(0, len(vectors), 500):
+        index.add(
+            [f"n{i}" for i in range(start, start + 500)],
+            [f"doc{i // 4}" for i in range(start, start + 500)],
+            vectors[start:start + 500],
+        )
+
+    queries = _random_vectors(rng, 20, 12)
+    alive = {f"n{i}" for i in range(len(vectors))}
+    for query, hits in zip(queries, index.search_many(queries, 10)):
+        assert [node_id for node_id, _ in hits] == _brute_force(vectors, query, 10, alive)
+        assert [score for _, score in hits] == sorted((score for _, score in hits), reverse=True)
+
+
+def test_sparse_index_delete_compact_and_persist(tmp_path, monkeypatch):
+    """测试按文档和节点删除、压缩，以及重启后丢弃未提交的尾部记录"""
+    monkeypatch.setattr(sparse_index, "COMPACT_MIN_ROWS", 10)
+    rng = np.random.default_rng(1)
+    vectors = _random_vectors(rng, 40, 20, vocab=50)
+    index = SparseInvertedIndex(persist_dir=str(tmp_path))
+    index.add([f"n{i}" for i in range(40)], [f"doc{i // 2}" for i in range(40)], vectors)
+
+    index.delete("doc0")
+    index.delete_refs([f"doc{i}" for i in range(1, 10)])
+    # 作废行达到一半，触发压缩
+    assert index._count == 20
+    index.delete_nodes(["n39"])
+    alive = {f"n{i}" for i in range(20, 39)}
+    assert len(index) == 19
+    index.close()
+
+    # 模拟写入倒排记录后、写日志前崩溃
+    with open(tmp_path / sparse_index.POSTINGS_FILE, "ab") as f:
+        f.write(b"\x00" * 24)
+
+    reopened = SparseInvertedIndex(persist_dir=str(tmp_path))
+    assert len(reopened) == 19
+    query = vectors[25]
+    assert [node_id for node_id, _ in reopened.search(query, 5)] == _brute_force(vectors, query, 5, alive)
+
+    reopened.add(["n20"], ["doc10"], [{7: 1.0}])
+    assert reopened.search({7: 1.0}, 1)[0][0] == "n20"
+    reopened.clear()
+    reopened.close()
+    assert len(SparseInvertedIndex(persist_dir=str(tmp_path))) == 0
+
+
+def test_sparse_index_single_writer(tmp_path):
+    """测试两个实例不能同时打开同一目录，第一个关闭后第二个能看到全部写入"""
+    index = SparseInvertedIndex(persist_dir=str(tmp_path))
+    index.add(["n0", "n1"], ["doc0", "doc1"], [{1: 1.0}, {2: 1.0}])
+    with pytest.raises(RuntimeError):
+        SparseInvertedIndex(persist_dir=str(tmp_path))
+    index.add(["n2"], ["doc2"], [{3: 1.0}])
+    index.close()
+
+    reopened = SparseInvertedIndex(persist_dir=str(tmp_path))
+    assert len(reopened) == 3
+    assert reopened.search({3: 1.0}, 1)[0][0] == "n2"
+    reopened.close()
+
+
+def test_sparse_index_compaction_survives_failures(tmp_path, monkeypatch):
+    """测试压缩写新文件失败时保留旧文件，替换中途崩溃后重新打开时完成替换"""
+    monkeypatch.setattr(sparse_index, "COMPACT_MIN_ROWS", 4)
+    rng = np.random.default_rng(3)
+    vectors = _random_vectors(rng, 12, 10, vocab=40)
+    index = SparseInvertedIndex(persist_dir=str(tmp_path))
+    index.add([f"n{i}" for i in range(12)], [f"doc{i // 2}" for i in range(12)], vectors)
+
+    def fail_fsync(f):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(sparse_index, "fsync_file", fail_fsync)
+    index.delete_nodes([f"n{i}" for i in range(7)])
+    assert index._count == 12
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(
+        [".lock", sparse_index.POSTINGS_FILE, sparse_index.LOG_FILE]
+    )
+    monkeypatch.setattr(sparse_index, "fsync_file", atomic_files.fsync_file)
+
+    # 提交标记写入后、替换文件时崩溃
+    def crash(src, dst):
+        raise OSError("crash")
+
+    replace = atomic_files.os.replace
+    monkeypatch.setattr(atomic_files.os, "replace", crash)
+    with pytest.raises(OSError):
+        index.delete("doc3")
+    index.close()
+    monkeypatch.setattr(atomic_files.os, "replace", replace)
+
+    reopened = SparseInvertedIndex(persist_dir=str(tmp_path))
+    alive = {f"n{i}" for i in range(8, 12)}
+    assert reopened._count == 4
+    assert set(reopened._rows) == alive
+    for query in vectors[8:]:
+        assert [node_id for node_id, _ in reopened.search(query, 3)] == _brute_force(vectors, query, 3, alive)
+    assert not (tmp_path / atomic_files.COMMIT_MARKER).exists()
+    reopened.close()
+
+
+class WordSparseEmbedding:
+    """按词哈希的稀疏向量，代替BGE-M3服务"""
+
+    def _encode(self, texts):
+        return [
+            {hash(word.strip(".")) % 1000: 1.0 for word in text.lower().split()}
+            for text in texts
+        ]
+
+    async def async_encode_queries(self, queries):
+        return self._encode(queries)
+
+    async def async_encode_documents(self, documents):
+        return self._encode(documents)
+
+
+def test_sparse_index_fills_hybrid_sparse_half_with_numpy_store():
+    """测试进程内稀疏索引与NumpyVectorStore搭配时，混合检索的稀疏一路能返回完整节点"""
+    store = NumpyVectorStore(dim=64)
+    index = SparseInvertedIndex()
+    kvstore = SimpleKVStore()
+    embed_model = WordEmbedding()
+    sparse_function = WordSparseEmbedding()
+    engine = IngestionEngine(
+        splitter=SentenceSplitter(chunk_size=64, chunk_overlap=0),
+        embed_model=embed_model,
+        vector_store=store,
+        docstore=SimpleDocumentStore(simple_kvstore=kvstore),
+        kvstore=kvstore,
+        manifest_collection="test/chunk_manifest",
+        sparse_embedding_function=sparse_function,
+        sparse_index=index,
+    )
+    documents = [
+        LlamaDocument(text="apples grow on trees in the orchard", id_="default:1"),
+        LlamaDocument(text="milvus stores vectors for similarity search", id_="default:2"),
+    ]
+    searcher = HybridSearcher(store, embed_model, sparse_function, index)
+
+    async def run():
+        await engine.arun(documents)
+        dense, sparse = await searcher.aencode_batch(["similarity", "orchard"])
+        _, sparse_results = await searcher.asearch(dense, sparse, limit=2)
+        # 不在稠密结果中的节点从向量库取回，向量库中已不存在的节点被跳过
+        hits = index.search_many(sparse, 1)
+        hits[0].append(("missing", 0.5))
+        fetched = await searcher._resolve_sparse_hits(hits, [[], []])
+        return sparse_results, fetched
+
+    sparse_results, fetched = asyncio.run(run())
+    assert [results[0].node.ref_doc_id for results in sparse_results] == ["default:2", "default:1"]
+    assert [len(results) for results in sparse_results] == [1, 1]
+    assert [[result.node.ref_doc_id for result in results] for results in fetched] == [["default:2"], ["default:1"]]
+    assert fetched[1][0].node.get_content() == "apples grow on trees in the orchard"
+
+    asyncio.run(engine.adelete_many(["default:2"]))
+    assert len(index) == 1